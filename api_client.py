@@ -0,0 +1,172 @@
+"""
+OpenAI-compatible Chat Completions client
+Each instance owns its API key and a keep-alive HTTP connection pool, so concurrent
+sessions and worker threads never share the process-global openai.api_key.
+"""
+
+import hashlib
+import random
+import re
+import threading
+import time
+from typing import Dict, List, Any, Tuple
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+
+class APIError(Exception):
+    """Chat Completions request failed (HTTP error or malformed response)"""
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class DeadlineExceeded(APIError):
+    """No response arrived within the per-request deadline"""
+
+
+class ChatClient:
+    """Chat Completions client with a per-instance connection pool"""
+
+    def __init__(self, api_key: str, base_url: str = DEFAULT_BASE_URL,
+                 connect_timeout: float = 10.0, read_timeout: float = 60.0,
+                 pool_size: int = 10):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+
+        # requests在创建客户端时才导入，批处理进程启动时不承担其导入开销
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        # 连接池大小与并发线程数一致，连接保持复用
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        })
+
+    def chat_completion(self, model: str, messages: List[Dict[str, str]],
+                        max_tokens: int = None, temperature: float = None,
+                        timeout: float = None) -> Dict[str, Any]:
+        """Send one chat completion request and return the decoded response
+
+        timeout is the read timeout in seconds (read_timeout when None); a caller whose
+        deadline has already passed gets DeadlineExceeded without a request being sent.
+        """
+        if timeout is not None and timeout <= 0:
+            raise DeadlineExceeded("No time left before the request deadline")
+        import requests
+        payload = {'model': model, 'messages': messages}
+        if max_tokens is not None:
+            payload['max_tokens'] = max_tokens
+        if temperature is not None:
+            payload['temperature'] = temperature
+
+        try:
+            response = self.session.post(
+                f"{self.base_url}/chat/completions",
+                json=payload,
+                timeout=(self.connect_timeout, timeout if timeout is not None else self.read_timeout)
+            )
+        except requests.RequestException as e:
+            raise APIError(f"Request failed: {str(e)}") from e
+
+        if response.status_code != 200:
+            try:
+                message = response.json().get('error', {}).get('message', response.text)
+            except ValueError:
+                message = response.text
+            raise APIError(f"HTTP {response.status_code}: {message}", response.status_code)
+
+        try:
+            return response.json()
+        except ValueError as e:
+            raise APIError(f"Invalid JSON response: {str(e)}", response.status_code) from e
+
+    def __reduce__(self):
+        # 跨进程传递时按配置重建，连接池不能序列化
+        return (ChatClient, (self.api_key, self.base_url, self.connect_timeout,
+                             self.read_timeout, self.pool_size))
+
+    def identity(self) -> Tuple[str, str]:
+        """Endpoint and API key fingerprint; only clients with the same identity may share replies"""
+        return self.base_url, hashlib.sha256(self.api_key.encode('utf-8')).hexdigest()[:16]
+
+    def close(self):
+        """Close pooled connections"""
+        self.session.close()
+
+
+def get_message_content(response: Dict[str, Any]) -> str:
+    """Extract the assistant message text from a chat completion response"""
+    try:
+        return response['choices'][0]['message']['content'] or ''
+    except (KeyError, IndexError, TypeError) as e:
+        raise APIError(f"Malformed response: {str(e)}") from e
+
+
+_TRANSLATE_REQUEST = re.compile(r'^Translate this .+? to (.+?): (.*)$', re.DOTALL)
+
+
+def pseudo_translate(user_content: str) -> str:
+    """Deterministic stand-in for a translation: '[Target] source text'
+
+    Placeholders, numbers and URLs survive unchanged, so responses pass validation.
+    Requests that are not translations (e.g. special-name detection) get an empty reply.
+    """
+    match = _TRANSLATE_REQUEST.match(user_content)
+    if not match:
+        return ''
+    target_lang, text = match.groups()
+    return f"[{target_lang}] {text}"
+
+
+class OfflineChatClient:
+    """Offline backend with the ChatClient interface, for local runs and tests without network"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, seed: int = None):
+        self.latency = latency  # seconds per request
+        self.jitter = jitter    # +/- uniform jitter in seconds
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        return (OfflineChatClient, (self.latency, self.jitter, self.seed))
+
+    def identity(self) -> Tuple[str, str]:
+        """Replies are deterministic and free, so every offline client may share them"""
+        return 'offline', ''
+
+    def chat_completion(self, model: str, messages: List[Dict[str, str]],
+                        max_tokens: int = None, temperature: float = None,
+                        timeout: float = None) -> Dict[str, Any]:
+        if self.latency or self.jitter:
+            with self._lock:
+                delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+            time.sleep(max(0.0, delay))
+
+        prompt = messages[-1]['content'] if messages else ''
+        content = pseudo_translate(prompt)
+        prompt_tokens = sum(len(message['content'].split()) for message in messages)
+        completion_tokens = len(content.split())
+        return {
+            'model': model,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        }
+
+    def close(self):
+        pass
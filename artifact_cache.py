@@ -0,0 +1,191 @@
+"""
+Document-level artifact cache
+Parsed layers are keyed by the hash of the source bytes; finished documents by that hash
+plus the target language and every translator option that changes the output (models,
+glossary, proper nouns, style examples, prompt version). Re-uploading the same file, or
+re-running it with the same options, returns the cached parse or document instead of
+running the pipeline again.
+
+Entries are files in one directory, written atomically, so several processes can share
+it. Each hit refreshes an entry's timestamp: entries unused for ttl seconds expire, and
+the least recently used entries are evicted once the directory exceeds max_bytes.
+
+Entries are pickles, so the directory must only be writable by the user running the
+service: it is created with mode 0700 under the user's cache directory by default, and
+a directory owned by another user or writable by group/others is refused.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from typing import Any, BinaryIO, Dict, Optional
+
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                                 'free_translate')
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+PARSE_FORMAT_VERSION = 1  # 解析结果结构变化时递增，旧条目自然失效
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def _ensure_private_dir(directory: str):
+    """Create directory (mode 0700) if needed; refuse one other users could plant entries in"""
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not hasattr(os, 'getuid'):
+        return  # Windows：没有POSIX属主和权限位
+    info = os.stat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o022:
+        raise PermissionError(f"Cache directory {directory} must be a directory owned by the current user "
+                              f"and not writable by group or others")
+
+
+def source_hash(source_bytes: bytes) -> str:
+    return hashlib.sha256(source_bytes).hexdigest()
+
+
+def parse_key(source_digest: str) -> str:
+    """Cache key of the parsed layers of a document"""
+    return hashlib.sha256(f"parse:{PARSE_FORMAT_VERSION}:{source_digest}".encode('utf-8')).hexdigest()
+
+
+def output_key(source_digest: str, target_lang: str, options: Dict[str, Any]) -> str:
+    """Cache key of a translated document; options come from SemanticTranslator.options_fingerprint"""
+    fingerprint = json.dumps(options, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(f"output:{source_digest}:{target_lang}:{fingerprint}".encode('utf-8')).hexdigest()
+
+
+class ArtifactCache:
+    """Directory of pickled artifacts and document files with TTL and size-based eviction"""
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, ttl: float = DEFAULT_TTL,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        _ensure_private_dir(directory)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    def _fresh(self, path: str) -> bool:
+        """Whether path exists and has not expired; a fresh entry is marked as just used"""
+        try:
+            if time.time() - os.stat(path).st_mtime > self.ttl:
+                os.remove(path)
+                return False
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _count(self, hit: bool):
+        with self._lock:
+            self._stats['hits' if hit else 'misses'] += 1
+
+    def get(self, key: str) -> Any:
+        """Cached object for key, or None"""
+        path = self._path(key, '.pickle')
+        if self._fresh(path):
+            try:
+                with open(path, 'rb') as f:
+                    value = pickle.load(f)
+                self._count(True)
+                return value
+            except Exception:
+                # 被其他进程淘汰、写坏，或引用了已改名的类的条目按未命中处理，并删除以免每次都失败
+                self._discard(path)
+        self._count(False)
+        return None
+
+    def _discard(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def put(self, key: str, value: Any):
+        self._write(self._path(key, '.pickle'), lambda f: pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def open_file(self, key: str) -> Optional[BinaryIO]:
+        """Open a cached document for reading, or None"""
+        path = self._path(key, '.docx')
+        if self._fresh(path):
+            try:
+                stream = open(path, 'rb')
+                self._count(True)
+                return stream
+            except OSError:
+                pass
+        self._count(False)
+        return None
+
+    def put_file(self, key: str, stream: BinaryIO):
+        """Store a document from a readable file object; the stream is rewound afterwards"""
+        stream.seek(0)
+        self._write(self._path(key, '.docx'), lambda f: shutil.copyfileobj(stream, f, COPY_CHUNK_SIZE))
+        stream.seek(0)
+
+    def _write(self, path: str, write):
+        # 先写临时文件再替换，读取方不会看到写了一半的条目
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        with self._lock:
+            self._stats['stores'] += 1
+        self.evict()
+
+    def evict(self):
+        """Remove expired entries, then the least recently used until under max_bytes"""
+        now = time.time()
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if not entry.name.endswith(('.pickle', '.docx')):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for mtime, size, path in entries:
+            if now - mtime <= self.ttl and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                evicted += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._lock:
+            self._stats['evictions'] += evicted
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(('.pickle', '.docx')):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,55 @@
+"""
+Cooperative cancellation of translation jobs
+A CancellationToken is passed to SmartDocumentTranslator.process_document; cancelling it
+stops new requests from being sent, drops queued segments, and stops waiting for requests
+already in flight (their replies are discarded).
+"""
+
+import threading
+from concurrent.futures import Future
+from typing import Callable
+
+
+class JobCancelled(Exception):
+    """The job's cancellation token was cancelled"""
+
+
+class CancellationToken:
+    """Thread-safe, one-way cancellation flag with callbacks"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        """Cancel the job; callbacks run once, on the cancelling thread"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], None]):
+        """Run callback when the token is cancelled (immediately if it already is)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def as_future(self) -> Future:
+        """Future that completes on cancellation, for use with concurrent.futures.wait"""
+        future = Future()
+        self.on_cancel(lambda: future.done() or future.set_result(None))
+        return future
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise JobCancelled("Job was cancelled")
@@ -0,0 +1,79 @@
+"""
+Circuit breaker for translation backends
+After failure_threshold consecutive backend failures the circuit opens and requests fail
+immediately instead of each waiting for its own timeout. After recovery_timeout one probe
+request is let through (half-open); its outcome closes or re-opens the circuit.
+"""
+
+import threading
+import time
+from typing import Any, Dict
+
+from api_client import APIError
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(APIError):
+    """The backend's circuit is open; the request was not sent"""
+
+
+def is_backend_failure(error: Exception) -> bool:
+    """Errors that say the backend is unhealthy, as opposed to a bad request"""
+    status_code = getattr(error, 'status_code', None)
+    if isinstance(error, CircuitOpenError):
+        return False
+    return status_code is None or status_code == 429 or status_code >= 500
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker, safe to share between threads"""
+
+    def __init__(self, name: str = 'backend', failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout  # seconds the circuit stays open before a probe
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self._stats = {'trips': 0, 'rejected': 0, 'failures': 0, 'successes': 0}
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now; rejected requests are counted"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._stats['successes'] += 1
+            self._failures = 0
+            self.state = CLOSED
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._stats['failures'] += 1
+            self._failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self._failures >= self.failure_threshold):
+                if self.state == CLOSED:
+                    self._stats['trips'] += 1
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, name=self.name, state=self.state, consecutive_failures=self._failures)
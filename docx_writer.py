@@ -0,0 +1,93 @@
+"""
+Zip-level passthrough writer for .docx packages
+Produces the same package as Document.save, but entries whose bytes are unchanged from
+the source package (typically images and other media) are copied as their raw compressed
+stream instead of being decompressed and recompressed. Only modified parts are deflated.
+"""
+
+import io
+import struct
+import zipfile
+import zlib
+from typing import Iterator, Tuple, Union, BinaryIO
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def _package_entries(doc) -> Iterator[Tuple[str, bytes]]:
+    """(zip member name, bytes) for every item Document.save would write, in the same order"""
+    from docx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+    from docx.opc.pkgwriter import _ContentTypesItem
+
+    package = doc.part.package
+    for part in package.parts:
+        part.before_marshal()
+    parts = list(package.parts)
+
+    yield CONTENT_TYPES_URI.membername, _ContentTypesItem.from_parts(parts).blob
+    yield PACKAGE_URI.rels_uri.membername, package.rels.xml
+    for part in parts:
+        yield part.partname.membername, part.blob
+        if len(part.rels):
+            yield part.partname.rels_uri.membername, part.rels.xml
+
+
+def _copy_raw(source: zipfile.ZipFile, info: zipfile.ZipInfo, target: zipfile.ZipFile):
+    """Append one entry to target by copying its compressed bytes unchanged"""
+    source.fp.seek(info.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, source.fp.read(zipfile.sizeFileHeader))
+    source.fp.seek(header[zipfile._FH_FILENAME_LENGTH] + header[zipfile._FH_EXTRA_FIELD_LENGTH], io.SEEK_CUR)
+
+    copied = zipfile.ZipInfo(info.filename, info.date_time)
+    copied.compress_type = info.compress_type
+    copied.create_system = info.create_system
+    copied.external_attr = info.external_attr
+    copied.flag_bits = info.flag_bits & ~0x08  # sizes go in the local header, no data descriptor
+    copied.CRC = info.CRC
+    copied.compress_size = info.compress_size
+    copied.file_size = info.file_size
+    copied.header_offset = target.fp.tell()
+
+    target.fp.write(copied.FileHeader())
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = source.fp.read(min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Truncated entry {info.filename}")
+        target.fp.write(chunk)
+        remaining -= len(chunk)
+
+    # 登记到目标压缩包的中央目录
+    target.filelist.append(copied)
+    target.NameToInfo[copied.filename] = copied
+    target.start_dir = target.fp.tell()
+    target._didModify = True
+
+
+def save_docx(doc, output: Union[str, BinaryIO], source: bytes) -> dict:
+    """Save doc to output, reusing unchanged entries of the source package bytes
+
+    Returns counts of copied and rewritten entries. File objects are left at position 0.
+    """
+    stats = {'copied': 0, 'rewritten': 0}
+    with zipfile.ZipFile(io.BytesIO(source)) as source_zip, \
+            zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as target_zip:
+        for name, blob in _package_entries(doc):
+            info = source_zip.NameToInfo.get(name)
+            unchanged = (
+                info is not None
+                and info.file_size == len(blob)
+                and info.CRC == zlib.crc32(blob)
+                and info.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+                and not info.flag_bits & 0x01  # encrypted entries are never copied
+            )
+            if unchanged:
+                _copy_raw(source_zip, info, target_zip)
+                stats['copied'] += 1
+            else:
+                target_zip.writestr(name, blob)
+                stats['rewritten'] += 1
+
+    if hasattr(output, 'seek'):
+        output.seek(0)
+    return stats
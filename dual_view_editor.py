@@ -0,0 +1,479 @@
+"""
+Dual-view editor - side-by-side original/translation display for the Streamlit UI
+Kept separate from the translation core so batch workers never import Streamlit.
+"""
+
+import streamlit as st
+from typing import Dict, List, Any
+
+def _build_page_index(job_id: str, items: List[Dict], layout_layer: List[Dict] = None) -> Dict[str, Any]:
+    """按页面/表格/行建立索引，每份译文只构建一次
+    
+    索引保存在当前会话中，并与传入的译文列表对象绑定：同一文件重新翻译（换了术语表、
+    模型或翻译记忆）会得到新的列表，索引随之重建；切页时不会再扫描整个文档。
+    """
+    cached = st.session_state.get('page_index')
+    if cached and cached['job_id'] == job_id and cached['items'] is items:
+        return cached['index']
+    index = _index_pages(items, layout_layer)
+    st.session_state['page_index'] = {'job_id': job_id, 'items': items, 'index': index}
+    return index
+
+def _index_pages(items: List[Dict], layout_layer: List[Dict] = None) -> Dict[str, Any]:
+    """按页面分组段落，按表格/行/列分组单元格，同时统计字数并去重"""
+    page_of = {layout['id']: layout.get('page_number', 0) for layout in (layout_layer or []) if 'id' in layout}
+    
+    pages = {}
+    unique_items = []
+    seen_texts = set()
+    
+    for item in items:
+        item_type = item.get('type')
+        if item_type not in ('paragraph', 'table_cell'):
+            continue
+        
+        # 去重结果随索引一起缓存
+        text_key = item.get('text', '').strip()
+        if not text_key:
+            unique_items.append(item)
+        elif text_key not in seen_texts:
+            seen_texts.add(text_key)
+            unique_items.append(item)
+        
+        page_num = page_of.get(item.get('id'), item.get('layout', {}).get('page_number', 0))
+        page = pages.get(page_num)
+        if page is None:
+            page = pages[page_num] = {
+                'paragraphs': [],
+                'tables': {},
+                'stats': {'paragraphs': 0, 'tables': 0, 'original_chars': 0, 'translated_chars': 0}
+            }
+        
+        stats = page['stats']
+        stats['original_chars'] += len(item.get('text', ''))
+        stats['translated_chars'] += len(item.get('translated_text', item.get('text', '')))
+        
+        if item_type == 'paragraph':
+            page['paragraphs'].append(item)
+            stats['paragraphs'] += 1
+        else:
+            table_idx = item.get('table_index', 0)
+            if table_idx not in page['tables']:
+                page['tables'][table_idx] = {}
+                stats['tables'] += 1
+            page['tables'][table_idx].setdefault(item.get('row', 0), {})[item.get('col', 0)] = item
+    
+    return {
+        'pages': pages,
+        'page_numbers': sorted(pages.keys()),
+        'unique_items': unique_items
+    }
+
+class DualViewEditor:
+    """双视图编辑器 - 左右对比显示"""
+    
+    def __init__(self):
+        self.original_content = []
+        self.translated_content = []
+    
+    def display_dual_view(self, original_items: List[Dict], translated_items: List[Dict],
+                          layout_layer: List[Dict] = None, job_id: str = None):
+        """显示双视图 - 修复重复内容问题
+        
+        传入job_id时使用按任务缓存的页面索引，layout_layer来自解析结果的布局层。
+        """
+        st.subheader("📖 双视图编辑器")
+        
+        # 添加视图模式选择
+        view_mode = st.radio(
+            "选择查看模式",
+            ["整体对比", "页面对比"],
+            horizontal=True
+        )
+        
+        if view_mode == "页面对比":
+            self.display_page_comparison(original_items, translated_items, layout_layer, job_id)
+        else:
+            # 去重处理
+            if job_id:
+                # 译文项同时包含原文，去重结果已随索引缓存
+                translated_unique = _build_page_index(job_id, translated_items, layout_layer)['unique_items']
+                original_unique = translated_unique
+            else:
+                original_unique = self._deduplicate_items(original_items)
+                translated_unique = self._deduplicate_items(translated_items)
+            
+            # 创建两列布局
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.markdown("### 📄 原文")
+                self._display_content(original_unique, "original")
+            
+            with col2:
+                st.markdown("### 🌐 译文")
+                self._display_content(translated_unique, "translated")
+    
+    def display_page_comparison(self, original_items, translated_items, layout_layer=None, job_id=None):
+        """显示页面对比视图"""
+        st.subheader("📖 页面内容对比")
+        
+        if job_id:
+            self._display_indexed_page_comparison(
+                _build_page_index(job_id, translated_items, layout_layer),
+                original_items, translated_items
+            )
+            return
+        
+        # 按页面组织内容
+        original_pages = self._organize_by_pages(original_items)
+        translated_pages = self._organize_by_pages(translated_items)
+        
+        # 获取所有页面
+        all_pages = set(original_pages.keys()) | set(translated_pages.keys())
+        
+        if not all_pages:
+            st.info("📄 未检测到分页信息，显示整体内容对比")
+            self._display_content_comparison(original_items, translated_items)
+            return
+        
+        # 页面选择器
+        selected_page = st.selectbox(
+            "选择页面查看",
+            options=sorted(all_pages),
+            format_func=lambda x: f"第 {x} 页" if x > 0 else "封面/前言"
+        )
+        
+        # 显示选中页面的内容
+        if selected_page in original_pages and selected_page in translated_pages:
+            self._display_page_content(selected_page, original_pages[selected_page], translated_pages[selected_page])
+        elif selected_page in original_pages:
+            st.warning(f"第 {selected_page} 页只有原文，没有译文")
+            self._display_original_page(selected_page, original_pages[selected_page])
+        elif selected_page in translated_pages:
+            st.warning(f"第 {selected_page} 页只有译文，没有原文")
+            self._display_translated_page(selected_page, translated_pages[selected_page])
+    
+    def _display_indexed_page_comparison(self, page_index, original_items, translated_items):
+        """基于预建索引的页面对比，切页只处理当前页的内容"""
+        page_numbers = page_index['page_numbers']
+        
+        if not page_numbers:
+            st.info("📄 未检测到分页信息，显示整体内容对比")
+            self._display_content_comparison(original_items, translated_items)
+            return
+        
+        # 页面选择器
+        selected_page = st.selectbox(
+            "选择页面查看",
+            options=page_numbers,
+            format_func=lambda x: f"第 {x} 页" if x > 0 else "封面/前言"
+        )
+        
+        page = page_index['pages'][selected_page]
+        st.markdown(f"### 📄 第 {selected_page} 页内容对比")
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.markdown("**📝 原文**")
+            self._display_indexed_page_items(page, "original")
+        
+        with col2:
+            st.markdown("**🌐 译文**")
+            self._display_indexed_page_items(page, "translated")
+        
+        # 页面统计在建索引时已算好
+        stats = page['stats']
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            st.metric("段落数", f"{stats['paragraphs']} → {stats['paragraphs']}")
+        
+        with col2:
+            st.metric("表格数", f"{stats['tables']} → {stats['tables']}")
+        
+        with col3:
+            st.metric("字符数", f"{stats['original_chars']} → {stats['translated_chars']}")
+        
+        with col4:
+            if stats['original_chars'] > 0:
+                ratio = stats['translated_chars'] / stats['original_chars']
+                st.metric("长度比例", f"{ratio:.2f}")
+    
+    def collect_edits(self, translated_items: List[Dict]) -> Dict[str, str]:
+        """页面对比视图中被修改过的译文：片段id -> 输入框中的新译文"""
+        edits = {}
+        for item in translated_items:
+            value = st.session_state.get(f"trans_{item.get('id')}")
+            if value is not None and value != item.get('translated_text', item.get('text', '')):
+                edits[item['id']] = value
+        return edits
+    
+    def _display_indexed_page_items(self, page, view_type):
+        """显示索引中单个页面的段落和表格"""
+        if not page['paragraphs'] and not page['tables']:
+            st.info("该页面没有内容")
+            return
+        
+        if page['paragraphs']:
+            st.markdown("**段落内容:**")
+            for i, item in enumerate(page['paragraphs']):
+                with st.expander(f"段落 {i+1}", expanded=False):
+                    if view_type == "original":
+                        st.text_area("原文", value=item.get('text', ''), height=100, key=f"orig_{item.get('id', i)}")
+                    else:
+                        st.text_area("译文", value=item.get('translated_text', item.get('text', '')), height=100, key=f"trans_{item.get('id', i)}")
+        
+        if page['tables']:
+            st.markdown("**表格内容:**")
+            for table_idx, rows in page['tables'].items():
+                st.markdown(f"**表格 {table_idx + 1}:**")
+                self._display_table_rows(rows, view_type)
+    
+    def _display_table_rows(self, rows, view_type):
+        """按已分组的行/列显示表格"""
+        import pandas as pd
+        
+        table_data = {}
+        for row_idx, cols in rows.items():
+            for col_idx, cell in cols.items():
+                if view_type == "original":
+                    table_data.setdefault(row_idx, {})[col_idx] = cell.get('text', '')
+                else:
+                    table_data.setdefault(row_idx, {})[col_idx] = cell.get('translated_text', cell.get('text', ''))
+        
+        if table_data:
+            df = pd.DataFrame.from_dict(table_data, orient='index')
+            df = df.fillna('')  # 填充空值
+            st.dataframe(df, use_container_width=True)
+    
+    def _organize_by_pages(self, items):
+        """按页面组织内容项"""
+        pages = {}
+        
+        for item in items:
+            # 尝试从布局信息中获取页面信息
+            page_num = item.get('layout', {}).get('page_number', 0)
+            
+            if page_num not in pages:
+                pages[page_num] = []
+            
+            pages[page_num].append(item)
+        
+        return pages
+    
+    def _display_page_content(self, page_num, original_items, translated_items):
+        """显示页面内容对比"""
+        st.markdown(f"### 📄 第 {page_num} 页内容对比")
+        
+        # 创建两列布局
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.markdown("**📝 原文**")
+            self._display_page_items(original_items, "original")
+        
+        with col2:
+            st.markdown("**🌐 译文**")
+            self._display_page_items(translated_items, "translated")
+        
+        # 显示页面统计
+        self._display_page_stats(page_num, original_items, translated_items)
+    
+    def _display_page_items(self, items, view_type):
+        """显示页面内容项"""
+        if not items:
+            st.info("该页面没有内容")
+            return
+        
+        # 按类型分组显示
+        paragraphs = [item for item in items if item.get('type') == 'paragraph']
+        table_cells = [item for item in items if item.get('type') == 'table_cell']
+        
+        # 显示段落
+        if paragraphs:
+            st.markdown("**段落内容:**")
+            for i, item in enumerate(paragraphs):
+                with st.expander(f"段落 {i+1}", expanded=False):
+                    if view_type == "original":
+                        st.text_area("原文", value=item.get('text', ''), height=100, key=f"orig_para_{i}")
+                    else:
+                        st.text_area("译文", value=item.get('translated_text', item.get('text', '')), height=100, key=f"trans_para_{i}")
+        
+        # 显示表格
+        if table_cells:
+            st.markdown("**表格内容:**")
+            self._display_table_content(table_cells, view_type)
+    
+    def _display_table_content(self, table_cells, view_type):
+        """显示表格内容"""
+        import pandas as pd
+        
+        # 按表格分组
+        tables = {}
+        for cell in table_cells:
+            table_idx = cell.get('table_index', 0)
+            if table_idx not in tables:
+                tables[table_idx] = []
+            tables[table_idx].append(cell)
+        
+        for table_idx, cells in tables.items():
+            st.markdown(f"**表格 {table_idx + 1}:**")
+            
+            # 构建表格数据
+            table_data = {}
+            for cell in cells:
+                row = cell.get('row', 0)
+                col = cell.get('col', 0)
+                
+                if row not in table_data:
+                    table_data[row] = {}
+                
+                if view_type == "original":
+                    table_data[row][col] = cell.get('text', '')
+                else:
+                    table_data[row][col] = cell.get('translated_text', cell.get('text', ''))
+            
+            # 转换为DataFrame显示
+            if table_data:
+                df = pd.DataFrame.from_dict(table_data, orient='index')
+                df = df.fillna('')  # 填充空值
+                st.dataframe(df, use_container_width=True)
+    
+    def _display_original_page(self, page_num, original_items):
+        """显示只有原文的页面"""
+        st.markdown(f"### 📄 第 {page_num} 页原文")
+        st.warning("该页面只有原文，没有对应的译文")
+        
+        self._display_page_items(original_items, "original")
+    
+    def _display_translated_page(self, page_num, translated_items):
+        """显示只有译文的页面"""
+        st.markdown(f"### 📄 第 {page_num} 页译文")
+        st.warning("该页面只有译文，没有对应的原文")
+        
+        self._display_page_items(translated_items, "translated")
+    
+    def _display_page_stats(self, page_num, original_items, translated_items):
+        """显示页面统计信息"""
+        # 计算统计信息
+        orig_para_count = len([item for item in original_items if item.get('type') == 'paragraph'])
+        trans_para_count = len([item for item in translated_items if item.get('type') == 'paragraph'])
+        
+        orig_table_count = len(set(item.get('table_index', 0) for item in original_items if item.get('type') == 'table_cell'))
+        trans_table_count = len(set(item.get('table_index', 0) for item in translated_items if item.get('type') == 'table_cell'))
+        
+        # 计算字符数
+        orig_chars = sum(len(item.get('text', '')) for item in original_items)
+        trans_chars = sum(len(item.get('translated_text', item.get('text', ''))) for item in translated_items)
+        
+        # 显示统计
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            st.metric("段落数", f"{orig_para_count} → {trans_para_count}")
+        
+        with col2:
+            st.metric("表格数", f"{orig_table_count} → {trans_table_count}")
+        
+        with col3:
+            st.metric("字符数", f"{orig_chars} → {trans_chars}")
+        
+        with col4:
+            if orig_chars > 0:
+                ratio = trans_chars / orig_chars
+                st.metric("长度比例", f"{ratio:.2f}")
+    
+    def _display_content_comparison(self, original_items, translated_items):
+        """显示整体内容对比（无分页信息时）"""
+        st.markdown("### 📄 整体内容对比")
+        
+        # 创建两列布局
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.markdown("**📝 原文**")
+            self._display_content(original_items, "original")
+        
+        with col2:
+            st.markdown("**🌐 译文**")
+            self._display_content(translated_items, "translated")
+    
+    def _deduplicate_items(self, items: List[Dict]) -> List[Dict]:
+        """去重处理，避免重复显示"""
+        seen_texts = set()
+        unique_items = []
+        
+        for item in items:
+            text_key = item.get('text', '').strip()
+            if text_key and text_key not in seen_texts:
+                seen_texts.add(text_key)
+                unique_items.append(item)
+            elif not text_key:  # 保留空内容项
+                unique_items.append(item)
+        
+        return unique_items
+    
+    def _display_content(self, items: List[Dict], view_type: str):
+        """显示内容 - 优化显示逻辑"""
+        # 按类型分组显示
+        paragraphs = [item for item in items if item['type'] == 'paragraph']
+        table_cells = [item for item in items if item['type'] == 'table_cell']
+        
+        # 显示段落
+        if paragraphs:
+            st.markdown("**📝 段落内容:**")
+            for i, item in enumerate(paragraphs):
+                if item['text'].strip():  # 只显示非空段落
+                    if view_type == "translated" and 'translated_text' in item:
+                        st.text_area(f"段落 {i+1}", value=item['translated_text'], height=80, key=f"para_{view_type}_{i}")
+                    else:
+                        st.text_area(f"段落 {i+1}", value=item['text'], height=80, key=f"para_{view_type}_{i}")
+        
+        # 显示表格单元格 - 修复重复问题
+        if table_cells:
+            st.markdown("**📊 表格内容:**")
+            # 按表格分组
+            tables = {}
+            for item in table_cells:
+                table_idx = item.get('table_index', 0)
+                if table_idx not in tables:
+                    tables[table_idx] = []
+                tables[table_idx].append(item)
+            
+            for table_idx, cells in tables.items():
+                st.markdown(f"**表格 {table_idx + 1}:**")
+                
+                # 去重处理：使用集合跟踪已显示的单元格
+                displayed_cells = set()
+                
+                # 按行列组织
+                rows = {}
+                for cell in cells:
+                    row = cell.get('row', 0)
+                    col = cell.get('col', 0)
+                    cell_text = cell['text'].strip()
+                    
+                    # 跳过空单元格和重复内容
+                    if not cell_text or cell_text in displayed_cells:
+                        continue
+                    
+                    displayed_cells.add(cell_text)
+                    
+                    if row not in rows:
+                        rows[row] = {}
+                    rows[row][col] = cell
+                
+                # 显示表格内容
+                for row_idx in sorted(rows.keys()):
+                    cols = rows[row_idx]
+                    if cols:  # 只显示有内容的行
+                        st.markdown(f"**第 {row_idx + 1} 行:**")
+                        for col_idx in sorted(cols.keys()):
+                            cell = cols[col_idx]
+                            if cell['text'].strip():  # 只显示非空单元格
+                                if view_type == "translated" and 'translated_text' in cell:
+                                    st.text_input(f"列{col_idx+1}", value=cell['translated_text'], key=f"cell_{view_type}_{table_idx}_{row_idx}_{col_idx}")
+                                else:
+                                    st.text_input(f"列{col_idx+1}", value=cell['text'], key=f"cell_{view_type}_{table_idx}_{row_idx}_{col_idx}")
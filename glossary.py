@@ -0,0 +1,232 @@
+"""
+Glossary for terminology locking
+Source terms are indexed once in an Aho-Corasick automaton, so each request only carries
+the entries that actually occur in its segment. Loads from dicts, CSV and TBX files.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import threading
+import xml.etree.ElementTree as ET
+from collections import Counter
+from typing import Dict, List, Tuple, Union, BinaryIO
+
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+
+class Glossary:
+    """Source -> target term mapping with a multi-pattern matcher and usage counts"""
+
+    def __init__(self, terms: Dict[str, str] = None, case_sensitive: bool = False):
+        self.case_sensitive = case_sensitive
+        self.terms = {}
+        self.usage = Counter()
+        self._lock = threading.Lock()
+        self._automaton = None
+        if terms:
+            self.update(terms)
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def __contains__(self, source: str) -> bool:
+        return source in self.terms
+
+    def add(self, source: str, target: str):
+        """Add or replace one entry"""
+        source = source.strip()
+        if source:
+            self.terms[source] = target.strip()
+            self._automaton = None
+
+    def update(self, terms: Dict[str, str]):
+        """Add or replace several entries"""
+        for source, target in terms.items():
+            self.add(source, target)
+
+    def _normalize(self, text: str) -> str:
+        return text if self.case_sensitive else text.lower()
+
+    def _build(self):
+        """Build the Aho-Corasick automaton over all source terms"""
+        goto = [{}]
+        fail = [0]
+        outputs = [[]]
+        sources = list(self.terms)
+
+        for term_index, source in enumerate(sources):
+            state = 0
+            for char in self._normalize(source):
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    fail.append(0)
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(term_index)
+
+        # Breadth-first pass to compute failure links
+        queue = list(goto[0].values())
+        while queue:
+            next_queue = []
+            for state in queue:
+                for char, child in goto[state].items():
+                    fallback = fail[state]
+                    while fallback and char not in goto[fallback]:
+                        fallback = fail[fallback]
+                    fail[child] = goto[fallback].get(char, 0)
+                    outputs[child] = outputs[child] + outputs[fail[child]]
+                    next_queue.append(child)
+            queue = next_queue
+
+        self._automaton = (goto, fail, outputs, sources)
+
+    def _scan(self, text: str) -> List[Tuple[int, str]]:
+        """Return (end position, source term) for every occurrence in text"""
+        if self._automaton is None:
+            self._build()
+        goto, fail, outputs, sources = self._automaton
+
+        matches = []
+        state = 0
+        for position, char in enumerate(self._normalize(text)):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for term_index in outputs[state]:
+                matches.append((position, sources[term_index]))
+        return matches
+
+    @staticmethod
+    def _on_word_boundary(text: str, start: int, end: int) -> bool:
+        """Alphanumeric terms must not match inside a longer word (e.g. 'cat' in 'category')"""
+        if start > 0 and text[start].isascii() and text[start].isalnum():
+            if text[start - 1].isascii() and text[start - 1].isalnum():
+                return False
+        if end < len(text) and text[end - 1].isascii() and text[end - 1].isalnum():
+            if text[end].isascii() and text[end].isalnum():
+                return False
+        return True
+
+    def find(self, text: str, count_usage: bool = True, usage: Counter = None) -> Dict[str, str]:
+        """Entries whose source term occurs in text; occurrences are added to usage counts
+
+        usage is the counter to update instead of self.usage, e.g. one per translation job.
+        """
+        if not self.terms or not text:
+            return {}
+
+        found = Counter()
+        for end_position, source in self._scan(text):
+            start = end_position - len(source) + 1
+            if self._on_word_boundary(text, start, end_position + 1):
+                found[source] += 1
+
+        if count_usage and found:
+            with self._lock:
+                (self.usage if usage is None else usage).update(found)
+        return {source: self.terms[source] for source in found}
+
+    def get_usage_report(self, usage: Counter = None) -> List[Dict[str, Union[str, int]]]:
+        """Entries that were used, most frequent first (from self.usage unless usage is given)"""
+        with self._lock:
+            return [
+                {'source': source, 'target': self.terms.get(source, ''), 'count': count}
+                for source, count in (self.usage if usage is None else usage).most_common()
+            ]
+
+    def reset_usage(self):
+        with self._lock:
+            self.usage.clear()
+
+    def fingerprint(self) -> str:
+        """Stable hash of the entries, for cache keys"""
+        payload = json.dumps(sorted(self.terms.items()), ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def load(cls, source: Union[str, BinaryIO], file_name: str = None, **kwargs) -> 'Glossary':
+        """Load a CSV or TBX glossary, chosen by file extension"""
+        name = (file_name or (source if isinstance(source, str) else getattr(source, 'name', ''))).lower()
+        if name.endswith(('.tbx', '.xml')):
+            return cls.load_tbx(source, **kwargs)
+        return cls.load_csv(source, **kwargs)
+
+    @classmethod
+    def load_csv(cls, source: Union[str, BinaryIO], source_column: str = 'source',
+                 target_column: str = 'target', encoding: str = 'utf-8-sig',
+                 **glossary_options) -> 'Glossary':
+        """Load a two-column CSV; a header row naming source_column/target_column is optional"""
+        if isinstance(source, str):
+            stream = open(source, 'r', encoding=encoding, newline='')
+        else:
+            stream = io.TextIOWrapper(source, encoding=encoding, newline='')
+
+        glossary = cls(**glossary_options)
+        try:
+            reader = csv.reader(stream)
+            header = next(reader, None)
+            if header is None:
+                return glossary
+
+            columns = [column.strip().lower() for column in header]
+            if source_column in columns and target_column in columns:
+                source_index, target_index = columns.index(source_column), columns.index(target_column)
+            else:
+                source_index, target_index = 0, 1
+                if len(header) > 1:
+                    glossary.add(header[0], header[1])
+
+            for row in reader:
+                if len(row) > max(source_index, target_index):
+                    glossary.add(row[source_index], row[target_index])
+        finally:
+            if isinstance(source, str):
+                stream.close()
+            else:
+                stream.detach()
+        return glossary
+
+    @classmethod
+    def load_tbx(cls, source: Union[str, BinaryIO], source_lang: str = None,
+                 target_lang: str = None, **glossary_options) -> 'Glossary':
+        """Stream a TBX file (termEntry/langSet or TBX v3 conceptEntry/langSec)
+
+        Without explicit languages, the first language of each entry is the source
+        and the second is the target.
+        """
+        def lang_matches(lang: str, wanted: str) -> bool:
+            lang, wanted = lang.lower(), wanted.lower()
+            return lang == wanted or lang.split('-')[0] == wanted.split('-')[0]
+
+        glossary = cls(**glossary_options)
+        for _, element in ET.iterparse(source, events=('end',)):
+            tag = element.tag.rsplit('}', 1)[-1]
+            if tag not in ('termEntry', 'conceptEntry'):
+                continue
+
+            terms_by_lang = []
+            for lang_set in element.iter():
+                if lang_set.tag.rsplit('}', 1)[-1] not in ('langSet', 'langSec'):
+                    continue
+                lang = lang_set.get(XML_LANG) or lang_set.get('lang') or ''
+                term = next((node.text for node in lang_set.iter()
+                             if node.tag.rsplit('}', 1)[-1] == 'term' and node.text), None)
+                if term:
+                    terms_by_lang.append((lang, term))
+
+            source_term = target_term = None
+            if source_lang and target_lang:
+                source_term = next((t for lang, t in terms_by_lang if lang_matches(lang, source_lang)), None)
+                target_term = next((t for lang, t in terms_by_lang if lang_matches(lang, target_lang)), None)
+            elif len(terms_by_lang) >= 2:
+                source_term, target_term = terms_by_lang[0][1], terms_by_lang[1][1]
+
+            if source_term and target_term:
+                glossary.add(source_term, target_term)
+            element.clear()
+        return glossary
@@ -0,0 +1,146 @@
+"""
+Hedged requests with per-request deadlines
+Each request gets a hard wall-clock deadline. If a request has not answered by the
+observed p95 latency of its route, one duplicate is fired and whichever answers first
+wins; the other is cancelled if it has not started, otherwise its answer is discarded
+(its HTTP read timeout is capped by the remaining deadline). A ratio cap bounds the
+extra requests hedging may add.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from api_client import DeadlineExceeded
+
+
+class RequestHedger:
+    """Runs request attempts with a deadline and at most one hedge per request"""
+
+    def __init__(self, max_hedge_ratio: float = 0.1, percentile: float = 0.95,
+                 min_samples: int = 20, window: int = 200, min_delay: float = 1.0,
+                 max_workers: int = 32):
+        self.options = {
+            'max_hedge_ratio': max_hedge_ratio, 'percentile': percentile, 'min_samples': min_samples,
+            'window': window, 'min_delay': min_delay, 'max_workers': max_workers
+        }
+        self.max_hedge_ratio = max_hedge_ratio  # hedges may add at most this fraction of requests
+        self.percentile = percentile
+        self.min_samples = min_samples          # no hedging until a key has this many latencies
+        self.window = window
+        self.min_delay = min_delay              # never hedge earlier than this, in seconds
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+        self._stats = {
+            'requests': 0, 'hedged': 0, 'hedge_wins': 0, 'hedges_skipped': 0,
+            'cancelled': 0, 'deadline_exceeded': 0
+        }
+
+    def hedge_delay(self, key: Hashable) -> Optional[float]:
+        """Seconds to wait before hedging requests for key, or None while there are too few samples"""
+        with self._lock:
+            samples = sorted(self._latencies.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, math.ceil(self.percentile * len(samples)) - 1)
+        return max(self.min_delay, samples[index])
+
+    def _record_latency(self, key: Hashable, latency: float):
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=self.window)).append(latency)
+
+    def _reserve_hedge(self) -> bool:
+        """Count a hedge if it stays within the ratio cap"""
+        with self._lock:
+            if self._stats['hedged'] + 1 > self.max_hedge_ratio * self._stats['requests']:
+                self._stats['hedges_skipped'] += 1
+                return False
+            self._stats['hedged'] += 1
+            return True
+
+    def _submit(self, key: Hashable, attempt: Callable[[Optional[float]], Any],
+                remaining: Callable[[], Optional[float]]):
+        def timed():
+            # 在线程池中排队时截止时间仍在流逝，开始执行时才计算剩余时间
+            timeout = remaining()
+            if timeout is not None and timeout <= 0:
+                raise DeadlineExceeded("No time left before the request deadline")
+            start = time.monotonic()
+            result = attempt(timeout)
+            self._record_latency(key, time.monotonic() - start)
+            return result
+        return self._executor.submit(timed)
+
+    def call(self, key: Hashable, attempt: Callable[[Optional[float]], Any], deadline: float = None) -> Any:
+        """Run attempt(timeout) under the deadline, hedging once after the key's p95 latency
+
+        key groups latencies (e.g. the route name); attempt receives the remaining seconds.
+        Raises DeadlineExceeded when no attempt answered in time, otherwise re-raises the
+        error of the last failed attempt.
+        """
+        start = time.monotonic()
+        expires = start + deadline if deadline else None
+        with self._lock:
+            self._stats['requests'] += 1
+        hedge_at = self.hedge_delay(key)
+        if hedge_at is not None and deadline and hedge_at >= deadline:
+            hedge_at = None  # 对冲时刻已超过截止时间
+
+        def remaining():
+            return None if expires is None else max(0.0, expires - time.monotonic())
+
+        pending = {self._submit(key, attempt, remaining): 'primary'}
+        last_error = None
+        while pending:
+            timeout = remaining()
+            if hedge_at is not None:
+                until_hedge = max(0.0, start + hedge_at - time.monotonic())
+                timeout = until_hedge if timeout is None else min(timeout, until_hedge)
+
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if expires is not None and time.monotonic() >= expires:
+                    self._cancel(pending)
+                    with self._lock:
+                        self._stats['deadline_exceeded'] += 1
+                    raise DeadlineExceeded(f"No response within {deadline:.1f}s")
+                # 到达p95延迟仍未返回：在预算内发出一个重复请求，已无剩余时间时不再发出
+                time_left = remaining()
+                if (time_left is None or time_left > 0) and self._reserve_hedge():
+                    pending[self._submit(key, attempt, remaining)] = 'hedge'
+                hedge_at = None
+                continue
+
+            for future in done:
+                kind = pending.pop(future)
+                if future.exception() is None:
+                    self._cancel(pending)
+                    if kind == 'hedge':
+                        with self._lock:
+                            self._stats['hedge_wins'] += 1
+                    return future.result()
+                last_error = future.exception()
+
+        raise last_error
+
+    def _cancel(self, pending: Dict):
+        for future in pending:
+            if future.cancel():
+                with self._lock:
+                    self._stats['cancelled'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hedge counters plus the current hedge delay per key"""
+        with self._lock:
+            stats = dict(self._stats)
+            keys = list(self._latencies)
+        stats['hedge_ratio'] = stats['hedged'] / stats['requests'] if stats['requests'] else 0.0
+        stats['hedge_delay'] = {key: self.hedge_delay(key) for key in keys}
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
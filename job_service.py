@@ -0,0 +1,506 @@
+"""
+Headless HTTP job service around SmartDocumentTranslator
+Documents are submitted as asynchronous jobs and processed by a bounded worker pool;
+when the job queue is full, new submissions are rejected (HTTP 503) instead of piling up.
+
+    POST /jobs?target_lang=Chinese&file_name=report.docx   body: the .docx bytes -> 202 {"job_id": ...}
+    GET  /jobs/<job_id>                                      status, progress and untranslated segment ids
+    GET  /jobs/<job_id>/result                               translated .docx (streamed)
+    DELETE /jobs/<job_id>                                    cancel a queued or running job
+    GET  /health                                             queue and worker status
+
+Submit with keep_partial=1 to keep the segments finished before a cancellation as a
+downloadable partial document.
+
+Run locally without network access:
+    python job_service.py --backend offline --port 8600
+"""
+
+import argparse
+import io
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict
+from urllib.parse import urlparse, parse_qs, quote
+
+from api_client import OfflineChatClient
+from cancellation import CancellationToken
+from smart_translator import SemanticTranslator, SmartDocumentTranslator, SPILL_TO_DISK_THRESHOLD
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+CHUNK_SIZE = 64 * 1024
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+
+
+class QueueFullError(Exception):
+    """The job queue is at capacity"""
+
+
+class JobOutput:
+    """Finished document of a job, kept as bytes or, above SPILL_TO_DISK_THRESHOLD, as a file
+
+    Every download opens its own stream. A discarded output (evicted job) is deleted only
+    after the last running download has finished.
+    """
+
+    def __init__(self, stream):
+        stream.seek(0, os.SEEK_END)
+        self.size = stream.tell()
+        stream.seek(0)
+        self.data = None
+        self.path = None
+        if self.size <= SPILL_TO_DISK_THRESHOLD:
+            self.data = stream.read()
+        else:
+            fd, self.path = tempfile.mkstemp(suffix='.docx')
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(stream, f, CHUNK_SIZE)
+        self._readers = 0
+        self._discarded = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def open(self):
+        """Readable stream over the document, independent of other downloads"""
+        with self._lock:
+            if self._discarded:
+                raise FileNotFoundError("Job output was discarded")
+            self._readers += 1
+        try:
+            with (io.BytesIO(self.data) if self.path is None else open(self.path, 'rb')) as stream:
+                yield stream
+        finally:
+            with self._lock:
+                self._readers -= 1
+                self._remove_if_unused()
+
+    def discard(self):
+        with self._lock:
+            self._discarded = True
+            self._remove_if_unused()
+
+    def _remove_if_unused(self):
+        if self._discarded and not self._readers:
+            self.data = None
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def content_disposition(file_name: str) -> str:
+    """Content-Disposition for a download: RFC 5987 UTF-8 name plus an ASCII fallback"""
+    # 去掉控制字符（含CR/LF）、引号和反斜杠，防止响应头注入
+    file_name = ''.join(char for char in file_name if char.isprintable() and char not in '"\\')
+    fallback = file_name.encode('ascii', 'replace').decode('ascii').replace('?', '_')
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(file_name, safe='')}"
+
+
+class Job:
+    """One translation job and its progress"""
+
+    def __init__(self, source, options: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.source = source  # spooled upload
+        self.options = options
+        self.status = 'queued'
+        self.error = None
+        self.output = None  # JobOutput once a document was produced
+        self.untranslated_ids = []
+        self.cancel_token = CancellationToken()
+        self.segments_total = 0
+        self.segments_done = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'file_name': self.options.get('file_name'),
+            'target_lang': self.options.get('target_lang'),
+            'progress': {
+                'segments_done': self.segments_done,
+                'segments_total': self.segments_total
+            },
+            'untranslated_ids': self.untranslated_ids,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+class JobManager:
+    """Bounded job queue served by a fixed pool of worker threads"""
+
+    def __init__(self, translator_factory: Callable[[Dict[str, Any]], SmartDocumentTranslator],
+                 workers: int = 2, queue_size: int = 16, max_finished_jobs: int = 100):
+        self.translator_factory = translator_factory
+        self.max_finished_jobs = max_finished_jobs
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, source, options: Dict[str, Any]) -> Job:
+        """Queue a job; raises QueueFullError when the queue is at capacity"""
+        job = Job(source, options)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            source.close()
+            raise QueueFullError("Job queue is full, retry later")
+        return job
+
+    def get(self, job_id: str) -> Job:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            'workers': len(self._workers),
+            'queued': self._queue.qsize(),
+            'queue_capacity': self._queue.maxsize,
+            'running': statuses.count('running'),
+            'succeeded': statuses.count('succeeded'),
+            'partial': statuses.count('partial'),
+            'failed': statuses.count('failed'),
+            'cancelled': statuses.count('cancelled')
+        }
+
+    def cancel(self, job_id: str) -> Job:
+        """Cancel a job; a running job stops at its next request, None if the job is unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished_at:
+                return job
+            if job.status == 'queued':
+                # 仍在队列中：工作线程取出后直接跳过
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+        job.cancel_token.cancel()
+        return job
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+                self._evict_finished()
+
+    def _run(self, job: Job):
+        with self._lock:
+            if job.status == 'cancelled':
+                job.source.close()
+                return
+            job.status = 'running'
+        job.started_at = time.time()
+        try:
+            system = self.translator_factory(job.options)
+            source_bytes = job.source.read()
+
+            parsed_doc = system.parse_document(source_bytes)
+            if not parsed_doc:
+                raise ValueError("Document could not be parsed")
+            job.segments_total = sum(1 for item in parsed_doc['content_layer']
+                                     if item['type'] in ('paragraph', 'table_cell'))
+
+            def on_segment(item):
+                job.segments_done += 1
+
+            output = tempfile.SpooledTemporaryFile(max_size=SPILL_TO_DISK_THRESHOLD)
+            result = system.process_document(source_bytes, job.options['target_lang'], output,
+                                             parsed_doc=parsed_doc, on_segment=on_segment,
+                                             cancel_token=job.cancel_token,
+                                             keep_partial=job.options.get('keep_partial') == '1')
+            job.untranslated_ids = result.untranslated_ids
+            if result:
+                job.output = JobOutput(output)
+            output.close()
+            if result.status == 'cancelled':
+                job.status = 'cancelled'
+                return
+            if not result:
+                raise RuntimeError(result.error or "Translation failed")
+
+            # partial：文档可下载，untranslated_ids中的片段保留了原文
+            job.status = 'succeeded' if result.status == 'success' else 'partial'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.source.close()
+            job.finished_at = time.time()
+
+    def _evict_finished(self):
+        """Drop the oldest finished jobs beyond max_finished_jobs"""
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job.finished_at]
+            for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+                job = self._jobs.pop(job_id)
+                if job.output is not None:
+                    # 正在进行的下载结束后才删除
+                    job.output.discard()
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end; the JobManager is attached to the server"""
+
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def manager(self) -> JobManager:
+        return self.server.job_manager
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Dict[str, str] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = [part for part in urlparse(self.path).path.split('/') if part]
+
+        if parts == ['health']:
+            self._send_json(200, self.manager.stats())
+            return
+
+        if len(parts) in (2, 3) and parts[0] == 'jobs':
+            job = self.manager.get(parts[1])
+            if job is None:
+                self._send_json(404, {'error': 'Job not found'})
+            elif len(parts) == 2:
+                self._send_json(200, job.to_dict())
+            elif parts[2] == 'result':
+                self._send_result(job)
+            else:
+                self._send_json(404, {'error': 'Not found'})
+            return
+
+        self._send_json(404, {'error': 'Not found'})
+
+    def _send_result(self, job: Job):
+        if job.output is None:
+            self._send_json(409, {'error': f"Job is {job.status}", 'status': job.status})
+            return
+
+        file_name = f"translated_{job.options.get('file_name') or 'document.docx'}"
+        output = job.output
+        try:
+            with output.open() as stream:
+                self.send_response(200)
+                self.send_header('Content-Type', DOCX_MIME)
+                self.send_header('Content-Length', str(output.size))
+                self.send_header('Content-Disposition', content_disposition(file_name))
+                self.end_headers()
+                # 每个请求使用独立的流，分块发送，不一次性读入内存
+                shutil.copyfileobj(stream, self.wfile, CHUNK_SIZE)
+        except FileNotFoundError:
+            # 任务刚被淘汰，流在发送响应头之前打开
+            self._send_json(404, {'error': 'Job not found'})
+
+    def do_DELETE(self):
+        parts = [part for part in urlparse(self.path).path.split('/') if part]
+        if len(parts) != 2 or parts[0] != 'jobs':
+            self._send_json(404, {'error': 'Not found'})
+            return
+
+        job = self.manager.cancel(parts[1])
+        if job is None:
+            self._send_json(404, {'error': 'Job not found'})
+        else:
+            self._send_json(202, job.to_dict())
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if [part for part in url.path.split('/') if part] != ['jobs']:
+            self._send_json(404, {'error': 'Not found'})
+            return
+
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        target_lang = params.get('target_lang')
+        if not target_lang:
+            self._send_json(400, {'error': 'target_lang is required'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            self._send_json(411, {'error': 'Content-Length is required'})
+            return
+        if length <= 0:
+            self._send_json(400, {'error': 'Empty request body'})
+            return
+        if length > MAX_UPLOAD_BYTES:
+            self.close_connection = True
+            self._send_json(413, {'error': f'Upload exceeds {MAX_UPLOAD_BYTES} bytes'})
+            return
+
+        # 分块读取上传内容，大文件落盘
+        upload = tempfile.SpooledTemporaryFile(max_size=SPILL_TO_DISK_THRESHOLD)
+        remaining = length
+        while remaining > 0:
+            chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            upload.write(chunk)
+            remaining -= len(chunk)
+        if remaining:
+            upload.close()
+            self.close_connection = True
+            self._send_json(400, {'error': 'Incomplete upload'})
+            return
+        upload.seek(0)
+
+        options = dict(params)
+        try:
+            job = self.manager.submit(upload, options)
+        except QueueFullError as e:
+            self._send_json(503, {'error': str(e)}, headers={'Retry-After': '5'})
+            return
+
+        self._send_json(202, job.to_dict(), headers={'Location': f'/jobs/{job.id}'})
+
+
+def create_server(host: str, port: int, manager: JobManager) -> ThreadingHTTPServer:
+    """HTTP server bound to host:port serving the given JobManager"""
+    server = ThreadingHTTPServer((host, port), JobRequestHandler)
+    server.daemon_threads = True
+    server.job_manager = manager
+    return server
+
+
+class TranslatorFactory:
+    """Builds a SmartDocumentTranslator per job around one shared SemanticTranslator per API key
+
+    Jobs share the translator's connection pool, circuit breakers, hedge latency history and
+    router metrics, so they warm up across jobs; per-job state stays in the job's own
+    SmartDocumentTranslator and in the TranslationJob of each translate call.
+    With cache_dir the jobs also share an ArtifactCache. close() releases the connections.
+    """
+
+    def __init__(self, backend: str = 'openai', api_key: str = None, offline_latency: float = 0.0,
+                 deadline: float = None, hedge_ratio: float = 0.0, secondary_base_url: str = None,
+                 cache_dir: str = None, **client_options):
+        self.backend = backend
+        self.api_key = api_key
+        self.offline_latency = offline_latency
+        self.deadline = deadline
+        self.hedge_ratio = hedge_ratio
+        self.secondary_base_url = secondary_base_url
+        self.client_options = client_options
+        self.cache = None
+        if cache_dir:
+            from artifact_cache import ArtifactCache
+            self.cache = ArtifactCache(cache_dir)
+        self._translators = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, options: Dict[str, Any]) -> SmartDocumentTranslator:
+        system = SmartDocumentTranslator()
+        system.translator = self.translator_for(self.api_key)
+        system.set_artifact_cache(self.cache)
+        return system
+
+    def translator_for(self, api_key: str) -> SemanticTranslator:
+        """The shared translator for api_key, created on first use"""
+        with self._lock:
+            translator = self._translators.get(api_key)
+            if translator is None:
+                translator = self._translators[api_key] = self._build_translator(api_key)
+            return translator
+
+    def _build_translator(self, api_key: str) -> SemanticTranslator:
+        if self.backend == 'offline':
+            translator = SemanticTranslator(api_key or 'offline',
+                                            client=OfflineChatClient(latency=self.offline_latency))
+        else:
+            translator = SemanticTranslator(api_key, **self.client_options)
+        if self.deadline:
+            translator.request_deadline = self.deadline
+        if self.hedge_ratio > 0:
+            translator.set_hedging(max_hedge_ratio=self.hedge_ratio)
+        if self.secondary_base_url:
+            translator.set_secondary_backend(base_url=self.secondary_base_url)
+        return translator
+
+    def close(self):
+        with self._lock:
+            translators, self._translators = list(self._translators.values()), {}
+        for translator in translators:
+            translator.close()
+
+
+def make_translator_factory(backend: str = 'openai', api_key: str = None, offline_latency: float = 0.0,
+                            deadline: float = None, hedge_ratio: float = 0.0,
+                            secondary_base_url: str = None, cache_dir: str = None,
+                            **client_options) -> TranslatorFactory:
+    """Factory for JobManager; see TranslatorFactory"""
+    return TranslatorFactory(backend, api_key, offline_latency, deadline, hedge_ratio,
+                             secondary_base_url, cache_dir, **client_options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP job service for document translation")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--workers', type=int, default=2, help="Concurrent translation jobs")
+    parser.add_argument('--queue-size', type=int, default=16, help="Queued jobs before rejecting")
+    parser.add_argument('--backend', choices=['openai', 'offline'], default='openai')
+    parser.add_argument('--base-url', help="OpenAI-compatible API base URL")
+    parser.add_argument('--latency', type=float, default=0.0, help="Simulated per-request latency (offline backend)")
+    parser.add_argument('--deadline', type=float, help="Per-request deadline in seconds")
+    parser.add_argument('--hedge-ratio', type=float, default=0.0,
+                        help="Hedge requests slower than p95, adding at most this fraction of requests (0 = off)")
+    parser.add_argument('--secondary-base-url',
+                        help="OpenAI-compatible API used while the primary backend's circuit is open")
+    parser.add_argument('--cache-dir', help="Cache parsed documents and finished translations in this directory")
+    args = parser.parse_args()
+
+    api_key = os.environ.get('OPENAI_API_KEY')
+    if args.backend == 'openai' and not api_key:
+        parser.error("OPENAI_API_KEY must be set for the openai backend")
+
+    client_options = {'base_url': args.base_url} if args.base_url else {}
+    factory = make_translator_factory(args.backend, api_key, args.latency, args.deadline,
+                                      args.hedge_ratio, args.secondary_base_url, args.cache_dir, **client_options)
+    manager = JobManager(factory, workers=args.workers, queue_size=args.queue_size)
+    server = create_server(args.host, args.port, manager)
+    print(f"Job service listening on http://{args.host}:{args.port} ({args.backend} backend)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        factory.close()
+
+
+if __name__ == "__main__":
+    main()
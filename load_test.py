@@ -0,0 +1,251 @@
+"""
+Multi-user load test for the translation pipeline
+Simulates N concurrent app sessions, each running upload -> translate -> download the way
+smart_app.py does (parse on upload, process_document in memory, read the output), against
+the offline backend with configurable latency, or over HTTP against the local stub
+server (stub_server.py) with latency distributions and injected errors. Reports
+throughput, job latency percentiles, CPU use and RSS for sizing a shared deployment.
+
+    python load_test.py --sessions 8 --jobs 3 --latency 0.5 --jitter 0.2
+    python load_test.py --sessions 8 --backend stub --latency 0.3 --latency-dist lognormal --error-rate-429 0.02
+    python load_test.py --sessions 4 --docx report.docx --json results.json
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import resource
+import threading
+import time
+from typing import Any, Dict, List
+
+from api_client import OfflineChatClient
+from smart_translator import SmartDocumentTranslator
+
+RSS_SAMPLE_INTERVAL = 0.2
+
+
+def make_document(paragraphs: int = 200, tables: int = 4, rows: int = 5, cols: int = 4,
+                  label: str = 'A') -> bytes:
+    """Synthetic .docx with headings, body paragraphs and tables; label makes the text unique"""
+    from docx import Document
+
+    doc = Document()
+    for index in range(paragraphs):
+        if index % 25 == 0:
+            doc.add_heading(f"Chapter {index // 25 + 1}: Load test section", level=1)
+        doc.add_paragraph(f"Paragraph {index} of load test document {label}, with GitHub, "
+                          f"version 2.{index % 10} and https://example.com/{index} kept as written.")
+    for table_index in range(tables):
+        table = doc.add_table(rows=rows, cols=cols)
+        for row in range(rows):
+            for col in range(cols):
+                table.cell(row, col).text = f"Cell {label} {table_index}-{row}-{col} value"
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile; 0.0 for no samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def current_rss() -> int:
+    """Resident set size in bytes (Linux /proc; falls back to the peak elsewhere)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return peak_rss()
+
+
+def peak_rss() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024  # macOS reports bytes, Linux KiB
+
+
+class _RSSSampler(threading.Thread):
+    """Samples RSS while the load test runs"""
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        super().__init__(name='rss-sampler', daemon=True)
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.samples.append(current_rss())
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def run_session(session_index: int, documents: List[bytes], args, jobs: List[Dict[str, Any]]):
+    """One simulated user: its own translator system, jobs run one after another"""
+    system = SmartDocumentTranslator()
+    if args.base_url:
+        system.set_translator('load-test', base_url=args.base_url, max_workers=args.workers)
+    else:
+        system.set_translator('load-test', client=OfflineChatClient(latency=args.latency, jitter=args.jitter),
+                              max_workers=args.workers)
+    for job_index in range(args.jobs):
+        file_bytes = documents[(session_index + job_index) % len(documents)]
+        start = time.perf_counter()
+        # 与界面一致：上传时解析，翻译时复用解析结果，完成后读出文档供下载
+        parsed_doc = system.parser.parse_document(file_bytes)
+        parsed_at = time.perf_counter()
+        result = system.process_document(file_bytes, args.target_lang, parsed_doc=parsed_doc,
+                                          processes=args.processes)
+        translated_at = time.perf_counter()
+        output_bytes = 0
+        if result:
+            output_bytes = len(result.output.read())
+            result.output.close()
+        segments = sum(1 for item in parsed_doc['content_layer'] if item['type'] in ('paragraph', 'table_cell')) \
+            if parsed_doc else 0
+        jobs.append({
+            'session': session_index,
+            'status': result.status,
+            'seconds': time.perf_counter() - start,
+            'parse_seconds': parsed_at - start,
+            'translate_seconds': translated_at - parsed_at,
+            'segments': segments,
+            'output_bytes': output_bytes
+        })
+
+
+def run_load_test(args) -> Dict[str, Any]:
+    if args.docx:
+        documents = []
+        for path in args.docx:
+            with open(path, 'rb') as f:
+                documents.append(f.read())
+    else:
+        # 每个会话一份内容不同的文档，避免并发的相同请求在进程内被合并
+        documents = [make_document(args.paragraphs, args.tables, label=f"S{index}")
+                     for index in range(args.sessions)]
+
+    stub = None
+    args.base_url = None
+    if args.backend == 'stub':
+        from stub_server import StubServer
+        stub = StubServer(latency=args.latency, latency_dist=args.latency_dist, spread=args.spread,
+                          error_rate_429=args.error_rate_429, error_rate_500=args.error_rate_500,
+                          seed=args.seed).start()
+        args.base_url = stub.base_url
+
+    jobs = []
+    sampler = _RSSSampler()
+    rss_before = current_rss()
+    cpu_before = time.process_time()
+    start = time.perf_counter()
+    sampler.start()
+
+    threads = []
+    for session_index in range(args.sessions):
+        thread = threading.Thread(target=run_session, name=f"session-{session_index}",
+                                  args=(session_index, documents, args, jobs))
+        thread.start()
+        threads.append(thread)
+        if args.ramp_up:
+            time.sleep(args.ramp_up / args.sessions)
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.perf_counter() - start
+    cpu_seconds = time.process_time() - cpu_before
+    sampler.stop()
+    backend_stats = None
+    if stub:
+        # 桩服务器在同一进程内运行，其CPU占用也计入结果
+        backend_stats = stub.get_stats()
+        stub.stop()
+
+    latencies = [job['seconds'] for job in jobs]
+    succeeded = [job for job in jobs if job['status'] in ('success', 'partial')]
+    return {
+        'sessions': args.sessions,
+        'jobs': len(jobs),
+        'succeeded': len(succeeded),
+        'wall_seconds': round(elapsed, 3),
+        'throughput_jobs_per_s': round(len(succeeded) / elapsed, 3) if elapsed else 0.0,
+        'throughput_segments_per_s': round(sum(job['segments'] for job in succeeded) / elapsed, 1) if elapsed else 0.0,
+        'latency_s': {
+            'p50': round(percentile(latencies, 0.50), 3),
+            'p95': round(percentile(latencies, 0.95), 3),
+            'p99': round(percentile(latencies, 0.99), 3),
+            'max': round(max(latencies, default=0.0), 3)
+        },
+        'parse_p50_s': round(percentile([job['parse_seconds'] for job in jobs], 0.50), 3),
+        'translate_p50_s': round(percentile([job['translate_seconds'] for job in jobs], 0.50), 3),
+        'cpu_seconds': round(cpu_seconds, 2),
+        'cpu_utilisation': round(cpu_seconds / elapsed, 2) if elapsed else 0.0,  # 1.0 = one core busy
+        'cpu_count': os.cpu_count(),
+        'rss_mib': {
+            'before': round(rss_before / 2 ** 20, 1),
+            'mean': round(sum(sampler.samples) / len(sampler.samples) / 2 ** 20, 1) if sampler.samples else 0.0,
+            'peak': round(peak_rss() / 2 ** 20, 1)
+        },
+        'backend': args.backend,
+        'backend_stats': backend_stats,
+        'job_details': jobs
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    latency = report['latency_s']
+    rss = report['rss_mib']
+    print(f"Sessions: {report['sessions']}   jobs: {report['jobs']} ({report['succeeded']} succeeded)   "
+          f"wall: {report['wall_seconds']}s")
+    print(f"Throughput: {report['throughput_jobs_per_s']} jobs/s, {report['throughput_segments_per_s']} segments/s")
+    print(f"Job latency: p50 {latency['p50']}s  p95 {latency['p95']}s  p99 {latency['p99']}s  max {latency['max']}s")
+    print(f"  parse p50 {report['parse_p50_s']}s, translate+save p50 {report['translate_p50_s']}s")
+    print(f"CPU: {report['cpu_seconds']}s ({report['cpu_utilisation']} cores of {report['cpu_count']})")
+    print(f"RSS: {rss['before']} MiB before, {rss['mean']} MiB mean, {rss['peak']} MiB peak")
+    stats = report['backend_stats']
+    if stats:
+        print(f"Stub backend: {stats['requests']} requests {stats['status']}, max {stats['max_in_flight']} "
+              f"in flight, {stats['prompt_tokens']} prompt + {stats['completion_tokens']} completion tokens")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the translation pipeline with simulated sessions")
+    parser.add_argument('--sessions', type=int, default=4, help="Concurrent simulated users")
+    parser.add_argument('--jobs', type=int, default=2, help="Documents translated per session")
+    parser.add_argument('--ramp-up', type=float, default=0.0, help="Seconds over which sessions start")
+    parser.add_argument('--backend', choices=['offline', 'stub'], default='offline',
+                        help="offline: in-process client; stub: HTTP to a local stub server")
+    parser.add_argument('--latency', type=float, default=0.2, help="Backend latency per request (s; median for stub)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="+/- uniform latency jitter (s, offline backend)")
+    parser.add_argument('--latency-dist', default='fixed', help="Stub latency distribution (see stub_server.py)")
+    parser.add_argument('--spread', type=float, default=0.5, help="Stub latency distribution parameter")
+    parser.add_argument('--error-rate-429', type=float, default=0.0, help="Stub: fraction answered 429")
+    parser.add_argument('--error-rate-500', type=float, default=0.0, help="Stub: fraction answered 500")
+    parser.add_argument('--seed', type=int, help="Stub: seed for reproducible latencies and faults")
+    parser.add_argument('--workers', type=int, default=4, help="Translation threads per session")
+    parser.add_argument('--processes', type=int, help="Shard each job over this many processes")
+    parser.add_argument('--target-lang', default='Chinese')
+    parser.add_argument('--docx', nargs='+', help="Documents to translate (default: a synthetic document)")
+    parser.add_argument('--paragraphs', type=int, default=200, help="Synthetic document paragraphs")
+    parser.add_argument('--tables', type=int, default=4, help="Synthetic document tables")
+    parser.add_argument('--json', help="Also write the full report, with per-job details, to this file")
+    args = parser.parse_args()
+
+    report = run_load_test(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
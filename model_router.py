@@ -0,0 +1,150 @@
+"""
+Adaptive model routing - picks the model/endpoint for each segment
+Rules match on segment length, segment type and heading level (from the layout layer);
+routes whose observed error rate or latency degrade are skipped until they recover.
+"""
+
+import threading
+from collections import deque
+from typing import Dict, List, Any
+
+from api_client import ChatClient, DEFAULT_MODEL
+
+
+class Route:
+    """One routing rule: which segments it accepts and which model/endpoint serves them"""
+
+    def __init__(self, name: str, model: str = DEFAULT_MODEL, client: ChatClient = None,
+                 types: List[str] = None, min_chars: int = 0, max_chars: int = None,
+                 heading_levels: List[int] = None, max_error_rate: float = 0.5,
+                 max_latency: float = None):
+        self.name = name
+        self.model = model
+        self.client = client            # None = use the translator's own client
+        self.types = set(types) if types else None
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.heading_levels = set(heading_levels) if heading_levels else None
+        self.max_error_rate = max_error_rate
+        self.max_latency = max_latency  # seconds, compared with the moving average
+
+    def matches(self, item: Dict, layout: Dict) -> bool:
+        """Whether the segment satisfies this rule"""
+        length = len(item.get('text', ''))
+        if self.types is not None and item.get('type') not in self.types:
+            return False
+        if length < self.min_chars:
+            return False
+        if self.max_chars is not None and length > self.max_chars:
+            return False
+        if self.heading_levels is not None and layout.get('heading_level', 0) not in self.heading_levels:
+            return False
+        return True
+
+
+class RouteMetrics:
+    """Per-route counters plus a sliding window of recent outcomes"""
+
+    def __init__(self, window: int):
+        self.requests = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.ewma_latency = None
+        self.recent = deque(maxlen=window)  # True = success
+        self.skipped = 0                    # selections skipped while unhealthy
+
+    def record(self, latency: float, success: bool):
+        self.requests += 1
+        self.total_latency += latency
+        if not success:
+            self.errors += 1
+        self.recent.append(success)
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency = 0.8 * self.ewma_latency + 0.2 * latency
+
+    @property
+    def recent_error_rate(self) -> float:
+        if not self.recent:
+            return 0.0
+        return 1 - sum(self.recent) / len(self.recent)
+
+
+class ModelRouter:
+    """Selects a route per segment; the last route is the fallback and always matches"""
+
+    def __init__(self, routes: List[Route] = None, window: int = 50, min_samples: int = 10,
+                 probe_every: int = 20):
+        self.routes = list(routes or [])
+        self.routes.append(Route('default'))
+        self.window = window
+        self.min_samples = min_samples
+        self.probe_every = probe_every  # let one segment through per N skips so routes can recover
+        self._metrics = {route.name: RouteMetrics(window) for route in self.routes}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_rules(cls, rules: List[Dict[str, Any]], api_key: str = None, **router_options) -> 'ModelRouter':
+        """Build a router from plain rule dicts (e.g. loaded from JSON)
+
+        A rule with 'base_url' gets its own ChatClient; other keys map to Route arguments:
+            [{"name": "cells", "model": "gpt-4o-mini", "types": ["table_cell"], "max_chars": 200},
+             {"name": "prose", "model": "gpt-4o", "min_chars": 1500}]
+        """
+        routes = []
+        for rule in rules:
+            rule = dict(rule)
+            base_url = rule.pop('base_url', None)
+            if base_url:
+                rule['client'] = ChatClient(rule.pop('api_key', api_key), base_url=base_url)
+            routes.append(Route(**rule))
+        return cls(routes, **router_options)
+
+    def select(self, item: Dict, layout: Dict = None) -> Route:
+        """Pick the first matching, healthy route"""
+        layout = layout or {}
+        for route in self.routes[:-1]:
+            if route.matches(item, layout) and self._is_healthy(route):
+                return route
+        return self.routes[-1]
+
+    def _is_healthy(self, route: Route) -> bool:
+        with self._lock:
+            metrics = self._metrics[route.name]
+            if len(metrics.recent) < self.min_samples:
+                return True
+            degraded = metrics.recent_error_rate > route.max_error_rate or (
+                route.max_latency is not None and metrics.ewma_latency > route.max_latency
+            )
+            if not degraded:
+                return True
+            metrics.skipped += 1
+            return metrics.skipped % self.probe_every == 0
+
+    def record(self, route: Route, latency: float, success: bool):
+        """Record the outcome of one request on a route"""
+        with self._lock:
+            self._metrics[route.name].record(latency, success)
+
+    @property
+    def default_route(self) -> Route:
+        return self.routes[-1]
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Per-route request counts, error rates and latencies"""
+        with self._lock:
+            return {
+                route.name: {
+                    'model': route.model,
+                    'requests': metrics.requests,
+                    'errors': metrics.errors,
+                    'error_rate': metrics.errors / metrics.requests if metrics.requests else 0.0,
+                    'recent_error_rate': metrics.recent_error_rate,
+                    'avg_latency': metrics.total_latency / metrics.requests if metrics.requests else 0.0,
+                    'ewma_latency': metrics.ewma_latency or 0.0,
+                    'skipped': metrics.skipped
+                }
+                for route in self.routes
+                for metrics in [self._metrics[route.name]]
+            }
@@ -0,0 +1,196 @@
+"""
+Opt-in profiling for the translation pipeline
+Each stage of SmartDocumentTranslator.process_document runs under cProfile and tracemalloc,
+while a sampler thread records collapsed stacks of the job's threads (flamegraph.pl /
+speedscope format). Per job, the output directory holds:
+
+    <stage>.prof            cProfile stats of the calling thread (snakeviz, pstats)
+    <stage>.alloc.txt       top allocation sites by size growth during the stage
+    stacks.collapsed        sampled stacks of all job threads, prefixed with the stage name
+    summary.json            wall time and peak traced memory per stage
+
+Enable with process_document(..., profile=True or a directory) or by setting
+FREE_TRANSLATE_PROFILE=1 (or a directory). When disabled nothing here is imported.
+
+tracemalloc is process-wide: concurrent jobs share one trace, which stops when the last
+profiled stage ends. Peaks of stages that overlapped another job's stage include that
+job's allocations and are marked "peak_shared". Profiler errors are logged and never
+fail the job.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Union
+
+PROFILE_ENV_VAR = 'FREE_TRANSLATE_PROFILE'
+DEFAULT_PROFILE_DIR = 'profiles'
+SAMPLE_INTERVAL = 0.01    # seconds between stack samples
+TOP_ALLOCATIONS = 25
+TRACEMALLOC_FRAMES = 1     # allocation sites are reported by line
+
+logger = logging.getLogger(__name__)
+
+# 进程内正在记录的阶段数；最后一个结束时才停止tracemalloc
+_trace_lock = threading.Lock()
+_trace_users = 0
+_trace_starts = 0          # 累计开始的阶段数，用于判断阶段期间是否有其他阶段开始
+_trace_started = False     # tracemalloc由本模块启动（而不是-X tracemalloc等外部启动）
+
+
+def _acquire_tracing() -> int:
+    """Start or join process-wide tracing; returns a token for _release_tracing"""
+    global _trace_users, _trace_starts, _trace_started
+    with _trace_lock:
+        if _trace_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _trace_started = True
+        _trace_users += 1
+        _trace_starts += 1
+        if _trace_users == 1:
+            # 只有本阶段在记录时才重置峰值，不抹掉其他任务的峰值
+            tracemalloc.reset_peak()
+            return _trace_starts
+        return -1
+
+
+def _release_tracing(token: int) -> bool:
+    """Leave process-wide tracing; True if no other profiled stage overlapped this one"""
+    global _trace_users, _trace_started
+    with _trace_lock:
+        _trace_users -= 1
+        alone = _trace_users == 0 and token == _trace_starts
+        if _trace_users == 0 and _trace_started:
+            tracemalloc.stop()
+            _trace_started = False
+        return alone
+
+
+def profile_dir_from(option: Union[bool, str, None]) -> str:
+    """Output directory from a process_document option or the environment; None = disabled"""
+    if option is None:
+        option = os.environ.get(PROFILE_ENV_VAR, '')
+    if option is False or option in ('', '0', 'false', 'False'):
+        return None
+    if option is True or option in ('1', 'true', 'True'):
+        return DEFAULT_PROFILE_DIR
+    return str(option)
+
+
+class _StackSampler(threading.Thread):
+    """Samples the stacks of the profiled threads into collapsed-stack counts"""
+
+    def __init__(self, stage: str, caller_id: int, ignored_ids: set, counts: Counter,
+                 interval: float = SAMPLE_INTERVAL):
+        super().__init__(name=f"profile-sampler-{stage}", daemon=True)
+        self.stage = stage
+        self.caller_id = caller_id
+        self.ignored_ids = ignored_ids  # threads that existed before the stage (other sessions etc.)
+        self.counts = counts
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (thread_id in self.ignored_ids and thread_id != self.caller_id):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(self.stage)
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class PipelineProfiler:
+    """Collects per-stage profiles for one job and writes them to output_dir/<job_name>"""
+
+    def __init__(self, output_dir: str, job_name: str):
+        self.path = os.path.join(output_dir, job_name)
+        os.makedirs(self.path, exist_ok=True)
+        self.stack_counts = Counter()
+        self.summary: Dict[str, Dict[str, Any]] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Profile one pipeline stage; profiler failures are logged, the stage still runs"""
+        state = None
+        try:
+            state = self._start_stage(name)
+        except Exception as e:
+            logger.warning(f"Profiling of stage {name} disabled: {str(e)}")
+        try:
+            yield
+        finally:
+            if state is not None:
+                try:
+                    self._finish_stage(name, state)
+                except Exception as e:
+                    logger.warning(f"Profiling of stage {name} failed: {str(e)}")
+
+    def _start_stage(self, name: str) -> Dict[str, Any]:
+        token = _acquire_tracing()
+        try:
+            before = tracemalloc.take_snapshot()
+            sampler = _StackSampler(name, threading.get_ident(), set(sys._current_frames()), self.stack_counts)
+            sampler.start()
+        except Exception:
+            _release_tracing(token)
+            raise
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Python 3.12起同一时刻只能有一个cProfile在运行
+            logger.warning(f"cProfile unavailable for stage {name}: {str(e)}")
+            profiler = None
+        return {'token': token, 'before': before, 'sampler': sampler, 'profiler': profiler,
+                'start': time.perf_counter()}
+
+    def _finish_stage(self, name: str, state: Dict[str, Any]):
+        profiler = state['profiler']
+        try:
+            if profiler is not None:
+                profiler.disable()
+            elapsed = time.perf_counter() - state['start']
+            state['sampler'].stop()
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            alone = _release_tracing(state['token'])
+
+        if profiler is not None:
+            profiler.dump_stats(os.path.join(self.path, f"{name}.prof"))
+        self._write_allocations(name, state['before'], after, peak)
+        self.summary[name] = {'seconds': round(elapsed, 4), 'peak_traced_bytes': peak, 'peak_shared': not alone}
+        self._write_summary()
+
+    def _write_allocations(self, name: str, before, after, peak: int):
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+        with open(os.path.join(self.path, f"{name}.alloc.txt"), 'w', encoding='utf-8') as f:
+            f.write(f"Stage: {name}\nPeak traced memory: {peak / 1024 / 1024:.1f} MiB\n\n")
+            for stat in stats[:TOP_ALLOCATIONS]:
+                f.write(f"{stat}\n")
+
+    def _write_summary(self):
+        with open(os.path.join(self.path, 'stacks.collapsed'), 'w', encoding='utf-8') as f:
+            for stack, count in self.stack_counts.items():
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(self.path, 'summary.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.summary, f, indent=2)
@@ -0,0 +1,239 @@
+"""
+Local pre-classification of segments before translation
+Segments that a translation would return unchanged are passed through without an API
+call: text without letters (numbers, numeric dates, amounts), URLs, e-mail addresses,
+part numbers and other identifiers, code, and text already in the target language.
+
+Target-language detection uses the script of the text (Han, kana, Hangul, Cyrillic)
+and, for Latin-script targets, character trigram profiles. Detection is deliberately
+conservative: a segment is only skipped when the target language wins clearly, since a
+missed skip costs one request but a wrong skip leaves text untranslated. Han-only text
+counts as Chinese only with characters specific to the target's script (Simplified or
+Traditional) and none of the other script or of Japanese; code only when every line
+is a code statement and the text is dense in symbols.
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Optional
+
+from translation_memory import normalize_lang
+
+_URL = re.compile(r'^(?:[a-z][a-z0-9+.-]*://|www\.)\S+$', re.IGNORECASE)
+_EMAIL = re.compile(r'^[\w.+-]+@[\w-]+(?:\.[\w-]+)+$')
+# 型号、料号、版本号等：单个含数字的记号，如 AB-1234-X、SKU12345、v2.3.1
+_IDENTIFIER = re.compile(r'^(?=[^\s]*\d)[A-Za-z0-9][A-Za-z0-9._/\-#:+]*$')
+_ORDINAL = re.compile(r'^\d+(?:st|nd|rd|th|er|re|e|eme|ème)$', re.IGNORECASE)  # 序数词需要翻译
+# 整行都必须是代码语句；行内夹杂代码的说明文字（“Note: call foo(); then bar();”）仍需翻译
+_CODE_LINE = re.compile(
+    r'(?:import [\w.]+(?: as \w+)?(?:, ?[\w.]+(?: as \w+)?)*;?'
+    r'|from [\w.]+ import [\w., *()]+'
+    r'|(?:async )?def \w+\(.*\)(?: -> .+)?:'
+    r'|class \w+(?:\(.*\))?:'
+    r'|(?:export )?(?:async )?function \w*\(.*\) ?\{?'
+    r'|(?:var|let|const) [\w{}\[\], ]+ ?= ?.+'
+    r'|#include ?[<"].+[>"]'
+    r'|(?:SELECT|INSERT|UPDATE|DELETE) .+'
+    r'|\$ \S.*'
+    r'|(?:if|for|while|switch|catch) ?\(.*\) ?\{?'
+    r'|(?:return|throw|yield)\b.*'
+    r'|[\w.\[\]\'"]+ ?(?:[-+*/|&]?=) ?\S.*'
+    r'|[\w.]+\(.*\);'
+    r'|[\w<>\[\]*:]+ \**\w+\(.*\) ?\{'
+    r'|[{}()\[\];]+|\} ?else ?\{?'
+    r'|(?:<[^<>]+>)+)'  # 只有标签、没有文字的标记行
+)
+_CODE_CHARS = set('{}()[];=<>/*&|$\\_\'"')
+CODE_SYMBOL_RATIO = 0.1     # 代码：符号占非空白字符的最低比例
+
+MAX_IDENTIFIER_LENGTH = 40
+MIN_DETECTION_LETTERS = 20  # 拉丁字母语言检测所需的最少字母数
+SCRIPT_RATIO = 0.6          # 中日韩：目标文字占记号的最低比例
+CYRILLIC_RATIO = 0.9        # 俄语：西里尔字母占字母的最低比例
+LATIN_RATIO = 0.9
+TRIGRAM_MARGIN = 0.08       # 目标语言的相似度需领先第二名至少这么多
+
+# 只在简体中文中使用的常用字（不含与日文新字体相同的字形）
+_SIMPLIFIED_ONLY = set(
+    '们这个为说时对过发开关门问题经历电话实现产业务无传统处应该亲爱动进长样东车还从见两书么没认识让给'
+    '将种组织结构据库设计码户档译语义录网络页图标试验资议员报显输选择项单击钮键变换级类责负购买卖价钱'
+    '币费质运营销县华边远证许讯读视频听觉节剧乐兴办帮护预备杂简虽难谁错误总线联专术层达岁属归导带济'
+    '极际权创欢观规则闻阅韩汉纪约续练习丽亿儿风飞马鱼鸟龙齐齿仅众优伤'
+)
+# 繁体中文和日文汉字中使用、简体中文不用的常用字
+_TRADITIONAL_ONLY = set(
+    '們這個為會說時來對國過學發開關門問題經歷電話體點當實現產業務無傳統處應該親愛後動進長樣東車還與從'
+    '見兩書麼沒認識讓給機將種組織結構數據庫設計碼戶檔譯語義錄網絡頁圖標試驗資議員報顯輸選擇項單擊鈕鍵'
+    '變換條號級類責負購買賣價錢幣費質運營銷區縣華邊遠證許訊讀寫視頻聽覺節劇樂興辦幫護預準備復雜簡雖難'
+    '誰錯誤總線聯專術層達歲屬歸導帶濟極際權創劃歡觀規則聞閱韓漢紀約續練習麗萬億兒幾風飛馬魚鳥龍齊齒僅'
+    '眾優傷'
+)
+_JAPANESE_ONLY = set('図駅広売読変対応発気様楽歴実県経済関軽戦単価検証伝辺円鉄転労働込営覚窓弾拡払帰児桜黒歩続総絵縄薬')
+
+# 拉丁字母语言的三元组特征来自以下常见文本，首次检测时构建
+_LATIN_SAMPLES = {
+    'en': "the project is in the process of being reviewed and the results will be shared with all "
+          "of the members of the team when they are available. this document describes how the system "
+          "works and what you should do if something goes wrong. please read the following section "
+          "carefully before you start, and make sure that you have the right permissions for your account. "
+          "we would like to thank everyone who has contributed to this report and for their time.",
+    'fr': "le projet est en cours de révision et les résultats seront communiqués à tous les membres de "
+          "l'équipe dès qu'ils seront disponibles. ce document décrit le fonctionnement du système et ce "
+          "que vous devez faire en cas de problème. veuillez lire attentivement la section suivante avant "
+          "de commencer et assurez-vous que vous disposez des droits nécessaires pour votre compte. nous "
+          "tenons à remercier tous ceux qui ont contribué à ce rapport pour leur temps.",
+    'de': "das projekt wird derzeit überprüft und die ergebnisse werden allen mitgliedern des teams "
+          "mitgeteilt, sobald sie verfügbar sind. dieses dokument beschreibt, wie das system funktioniert "
+          "und was sie tun sollten, wenn etwas nicht stimmt. bitte lesen sie den folgenden abschnitt "
+          "sorgfältig durch, bevor sie beginnen, und stellen sie sicher, dass sie die richtigen "
+          "berechtigungen für ihr konto haben. wir danken allen, die zu diesem bericht beigetragen haben.",
+    'es': "el proyecto está en proceso de revisión y los resultados se compartirán con todos los miembros "
+          "del equipo cuando estén disponibles. este documento describe cómo funciona el sistema y qué "
+          "debe hacer si algo sale mal. por favor, lea con atención la siguiente sección antes de empezar "
+          "y asegúrese de que tiene los permisos adecuados para su cuenta. queremos agradecer a todas las "
+          "personas que han contribuido a este informe por su tiempo.",
+    'it': "il progetto è in fase di revisione e i risultati saranno condivisi con tutti i membri del "
+          "gruppo quando saranno disponibili. questo documento descrive come funziona il sistema e cosa "
+          "fare se qualcosa va storto. si prega di leggere attentamente la sezione seguente prima di "
+          "iniziare e di assicurarsi di avere le autorizzazioni corrette per il proprio account. "
+          "desideriamo ringraziare tutti coloro che hanno contribuito a questo rapporto per il loro tempo.",
+    'pt': "o projeto está em processo de revisão e os resultados serão partilhados com todos os membros "
+          "da equipa quando estiverem disponíveis. este documento descreve como funciona o sistema e o "
+          "que deve fazer se algo correr mal. por favor, leia com atenção a secção seguinte antes de "
+          "começar e certifique-se de que tem as permissões corretas para a sua conta. queremos agradecer "
+          "a todos os que contribuíram para este relatório pelo seu tempo.",
+    'nl': "het project wordt momenteel beoordeeld en de resultaten worden met alle leden van het team "
+          "gedeeld zodra ze beschikbaar zijn. dit document beschrijft hoe het systeem werkt en wat u moet "
+          "doen als er iets misgaat. lees het volgende gedeelte zorgvuldig voordat u begint en zorg ervoor "
+          "dat u de juiste rechten voor uw account hebt. wij willen iedereen bedanken die aan dit verslag "
+          "heeft bijgedragen voor hun tijd."
+}
+_profiles = {}
+
+
+def _trigrams(text: str) -> Counter:
+    counts = Counter()
+    for word in re.findall(r'[^\W\d_]+', text.lower()):
+        padded = f" {word} "
+        for index in range(len(padded) - 2):
+            counts[padded[index:index + 3]] += 1
+    return counts
+
+
+def _latin_profiles() -> Dict[str, Counter]:
+    if not _profiles:
+        _profiles.update({lang: _trigrams(sample) for lang, sample in _LATIN_SAMPLES.items()})
+    return _profiles
+
+
+def _cosine(a: Counter, b: Counter) -> float:
+    dot = sum(count * b[gram] for gram, count in a.items() if gram in b)
+    norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    return dot / norm if norm else 0.0
+
+
+def _script_counts(text: str) -> Counter:
+    """Letters per script; Han characters count individually, other scripts per letter"""
+    counts = Counter()
+    for char in text:
+        if not char.isalpha():
+            continue
+        code = ord(char)
+        if 0x4E00 <= code <= 0x9FFF or 0x3400 <= code <= 0x4DBF or 0xF900 <= code <= 0xFAFF:
+            counts['han'] += 1
+        elif 0x3040 <= code <= 0x30FF or 0x31F0 <= code <= 0x31FF:
+            counts['kana'] += 1
+        elif 0xAC00 <= code <= 0xD7AF or 0x1100 <= code <= 0x11FF or 0x3130 <= code <= 0x318F:
+            counts['hangul'] += 1
+        elif 0x0400 <= code <= 0x04FF:
+            counts['cyrillic'] += 1
+        elif unicodedata.name(char, '').startswith('LATIN'):
+            counts['latin'] += 1
+        else:
+            counts['other'] += 1
+    return counts
+
+
+def is_target_language(text: str, target_lang: str) -> bool:
+    """Whether text is (confidently) already written in target_lang"""
+    lang = normalize_lang(target_lang)
+    primary = lang.split('-')[0]
+    scripts = _script_counts(text)
+    letters = sum(scripts.values())
+    if not letters:
+        return False
+
+    if primary in ('zh', 'ja', 'ko'):
+        # 夹杂的英文单词按词计数，避免“使用GitHub管理”这类文本被按字母数判为外文
+        latin_words = len(re.findall(r'[A-Za-z]+', text))
+        tokens = max(1, scripts['han'] + scripts['kana'] + scripts['hangul'] + latin_words
+                     + scripts['cyrillic'] + scripts['other'])
+        if primary == 'zh':
+            if scripts['kana'] or scripts['han'] / tokens < SCRIPT_RATIO:
+                return False
+            return _matches_chinese_script(text, lang)
+        if lang == 'ja':
+            return scripts['kana'] > 0 and (scripts['han'] + scripts['kana']) / tokens >= SCRIPT_RATIO
+        return scripts['hangul'] / tokens >= SCRIPT_RATIO
+
+    if lang == 'ru':
+        return letters >= MIN_DETECTION_LETTERS and scripts['cyrillic'] / letters >= CYRILLIC_RATIO
+
+    profiles = _latin_profiles()
+    if lang not in profiles or letters < MIN_DETECTION_LETTERS or scripts['latin'] / letters < LATIN_RATIO:
+        return False
+    grams = _trigrams(text)
+    scores = sorted(((_cosine(grams, profile), name) for name, profile in profiles.items()), reverse=True)
+    (best_score, best), (second_score, _) = scores[0], scores[1]
+    return best == lang and best_score - second_score >= TRIGRAM_MARGIN
+
+
+def han_script(text: str) -> Optional[str]:
+    """'zh-hans' or 'zh-hant' when the text uses characters of only one Chinese script, else None"""
+    simplified = any(char in _SIMPLIFIED_ONLY for char in text)
+    traditional = any(char in _TRADITIONAL_ONLY for char in text)
+    if simplified == traditional:
+        return None
+    return 'zh-hans' if simplified else 'zh-hant'
+
+
+def _matches_chinese_script(text: str, lang: str) -> bool:
+    """Han text with characters specific to the target's script ('zh-hans'/'zh-hant') and none of the other's"""
+    # 只有汉字的日文（如“会議資料”）多含日文或繁体字形
+    if any(char in _JAPANESE_ONLY for char in text):
+        return False
+    return han_script(text) == lang
+
+
+def _looks_like_code(text: str) -> bool:
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if not all(_CODE_LINE.fullmatch(line) for line in lines):
+        return False
+    visible = [char for char in text if not char.isspace()]
+    symbols = sum(1 for char in visible if char in _CODE_CHARS)
+    return symbols / len(visible) >= CODE_SYMBOL_RATIO
+
+
+def classify_segment(text: str, target_lang: str) -> Optional[str]:
+    """Reason the segment needs no translation, or None if it should be translated
+
+    Reasons: 'no_letters', 'url', 'email', 'identifier', 'code', 'target_language'.
+    """
+    stripped = text.strip()
+    if not stripped:
+        return 'no_letters'
+    if not any(char.isalpha() for char in stripped):
+        return 'no_letters'
+    if _URL.match(stripped):
+        return 'url'
+    if _EMAIL.match(stripped):
+        return 'email'
+    if len(stripped) <= MAX_IDENTIFIER_LENGTH and _IDENTIFIER.match(stripped) and not _ORDINAL.match(stripped):
+        return 'identifier'
+    if _looks_like_code(stripped):
+        return 'code'
+    if is_target_language(stripped, target_lang):
+        return 'target_language'
+    return None
@@ -0,0 +1,283 @@
+"""
+Sharded processing of large documents
+The body is cut into independent shards at section breaks and Heading 1 paragraphs
+(taken from the layout layer). Each shard is parsed, translated and reconstructed in its
+own process, then its body elements are merged back into the original package, so styles,
+numbering, headers/footers and relationships are those of the source document.
+"""
+
+import os
+import pickle
+import re
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Tuple
+
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
+from lxml import etree
+
+from cancellation import CancellationToken, JobCancelled
+from smart_translator import (StructuralParser, SemanticTranslator, SmartReconstructor, TranslationJob,
+                              _load_document)
+
+_PARA_ID = re.compile(r'^para_(\d+)$')
+_TABLE_ID = re.compile(r'^table_(\d+)_(.*)$')
+
+
+def _body_blocks(doc) -> List[Any]:
+    """Top-level body elements in document order, without the final section properties"""
+    return [child for child in doc.element.body.iterchildren() if child.tag != qn('w:sectPr')]
+
+
+def _shift_item(item: Dict, para_offset: int, table_offset: int) -> Dict:
+    """Copy of a content/format/layout item with ids moved by the given offsets"""
+    shifted = dict(item)
+    item_id = item.get('id', '')
+    para_match = _PARA_ID.match(item_id)
+    table_match = _TABLE_ID.match(item_id)
+    if para_match:
+        shifted['id'] = f"para_{int(para_match.group(1)) + para_offset}"
+    elif table_match:
+        shifted['id'] = f"table_{int(table_match.group(1)) + table_offset}_{table_match.group(2)}"
+        if 'table_index' in item:
+            shifted['table_index'] = item['table_index'] + table_offset
+    return shifted
+
+
+def _heading_layout(doc) -> List[Dict]:
+    """Minimal layout layer (ids and heading levels) for planning without a full parse"""
+    style_names = {style.style_id: style.name for style in doc.styles}
+    parser = StructuralParser()
+    layout = []
+    for index, paragraph in enumerate(doc.element.body.iterchildren(qn('w:p'))):
+        style_name = style_names.get(paragraph.style, '')
+        layout.append({'id': f'para_{index}', 'heading_level': parser._get_heading_level(style_name)})
+    return layout
+
+
+def plan_shards(doc, layout_layer: List[Dict], max_shards: int) -> List[Dict[str, int]]:
+    """Split the body into at most max_shards contiguous ranges of body elements
+
+    Cuts are only made before Heading 1 paragraphs and after paragraphs that end a
+    section; adjacent sections are grouped so shards carry similar amounts of text.
+    """
+    heading_ids = {layout['id'] for layout in layout_layer if layout.get('heading_level') == 1}
+    blocks = _body_blocks(doc)
+
+    # 自然分段：每段记录 (起始元素, 结束元素, 文本量)
+    sections = []
+    para_index = 0
+    start = 0
+    weight = 0
+    for position, block in enumerate(blocks):
+        if block.tag == qn('w:p'):
+            if f'para_{para_index}' in heading_ids and position > start:
+                sections.append((start, position, weight))
+                start, weight = position, 0
+            weight += len(''.join(block.itertext()))
+            para_index += 1
+            if block.find(f"{qn('w:pPr')}/{qn('w:sectPr')}") is not None:
+                sections.append((start, position + 1, weight))
+                start, weight = position + 1, 0
+        elif block.tag == qn('w:tbl'):
+            weight += len(''.join(block.itertext()))
+    if start < len(blocks):
+        sections.append((start, len(blocks), weight))
+
+    # 按文本量合并相邻的自然分段
+    target = (sum(section[2] for section in sections) or 1) / max(1, max_shards)
+    shards = []
+    current_start, current_weight = None, 0
+    for section_start, section_end, section_weight in sections:
+        if current_start is None:
+            current_start = section_start
+        current_weight += section_weight
+        if current_weight >= target and len(shards) < max_shards - 1:
+            shards.append((current_start, section_end))
+            current_start, current_weight = None, 0
+    if current_start is not None:
+        shards.append((current_start, len(blocks)))
+
+    # 每个分片之前的段落、表格数量，即分片内id相对全文的偏移
+    planned = []
+    for shard_start, shard_end in shards:
+        preceding = blocks[:shard_start]
+        planned.append({
+            'start': shard_start,
+            'end': shard_end,
+            'para_offset': sum(1 for block in preceding if block.tag == qn('w:p')),
+            'table_offset': sum(1 for block in preceding if block.tag == qn('w:tbl'))
+        })
+    return planned
+
+
+def _split_layer(items: List[Dict], shards: List[Dict[str, int]]) -> List[List[Dict]]:
+    """Distribute already-parsed layer items over the shards by paragraph/table index"""
+    per_shard = [[] for _ in shards]
+    for item in items:
+        item_id = item.get('id', '')
+        para_match = _PARA_ID.match(item_id)
+        table_match = _TABLE_ID.match(item_id)
+        if para_match:
+            index, offset_key = int(para_match.group(1)), 'para_offset'
+        elif table_match:
+            index, offset_key = int(table_match.group(1)), 'table_offset'
+        else:
+            continue
+        shard_index = max(i for i, shard in enumerate(shards) if shard[offset_key] <= index)
+        per_shard[shard_index].append(item)
+    return per_shard
+
+
+# 工作进程内的状态，由_init_worker在进程启动时设置一次
+_worker_state = {}
+
+
+def _init_worker(source_bytes: bytes, translator_config: bytes):
+    # 配置显式序列化，fork启动时也不与父进程共享连接或锁
+    _worker_state['source_bytes'] = source_bytes
+    _worker_state['translator'] = SemanticTranslator.from_config(pickle.loads(translator_config))
+    _worker_state['parser'] = StructuralParser()
+    _worker_state['reconstructor'] = SmartReconstructor()
+
+
+def _process_shard(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Parse, translate and reconstruct one shard; returns its body elements as XML"""
+    doc = _load_document(_worker_state['source_bytes'])
+    for position, block in enumerate(_body_blocks(doc)):
+        if not task['start'] <= position < task['end']:
+            block.getparent().remove(block)
+
+    parsed_shard = task['parsed']
+    if parsed_shard is None:
+        parsed_shard = _worker_state['parser'].parse_document(doc, task['para_offset'], task['table_offset'])
+        if not parsed_shard:
+            raise ValueError(f"Shard {task['start']}-{task['end']} could not be parsed")
+
+    job = TranslationJob()
+    translated_content = _worker_state['translator'].translate_with_context(
+        parsed_shard['content_layer'], task['target_lang'], layout_layer=parsed_shard['layout_layer'], job=job
+    )
+
+    # 重建器按分片内的段落、表格序号定位，id换回本地编号
+    def to_local(items):
+        return [_shift_item(item, -task['para_offset'], -task['table_offset']) for item in items]
+
+    _worker_state['reconstructor'].build_document(
+        doc, to_local(translated_content), to_local(parsed_shard['format_layer']),
+        to_local(parsed_shard['layout_layer'])
+    )
+
+    return {
+        'elements': [etree.tostring(block) for block in _body_blocks(doc)],
+        'parsed': parsed_shard if task['parsed'] is None else None,
+        'translated_content': translated_content,
+        **job.report()
+    }
+
+
+def _merge_parsed(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine per-shard parse results in the order a full parse produces them"""
+    def ordered(layer):
+        # 完整解析的顺序：所有段落、所有表格单元格、图片
+        items = [item for result in results for item in result['parsed'][layer]]
+        paragraphs = [item for item in items if _PARA_ID.match(item.get('id', ''))]
+        cells = [item for item in items if _TABLE_ID.match(item.get('id', ''))]
+        # 图片属于整个文档包，每个分片都会解析到同样的图片，只取第一个分片的
+        images = [item for item in results[0]['parsed'][layer] if item.get('type') == 'image']
+        return paragraphs + cells + images
+
+    metadata = {key: sum(result['parsed']['metadata'][key] for result in results)
+                for key in results[0]['parsed']['metadata']}
+    metadata['total_images'] = results[0]['parsed']['metadata']['total_images']
+    return {
+        'content_layer': ordered('content_layer'),
+        'format_layer': ordered('format_layer'),
+        'layout_layer': ordered('layout_layer'),
+        'anchors': {},
+        'metadata': metadata
+    }
+
+
+def translate_sharded(system, source_bytes: bytes, target_lang: str, parsed_doc: Dict[str, Any] = None,
+                      processes: int = None, on_segment: Callable[[Dict], None] = None,
+                      cancel_token: CancellationToken = None) -> Tuple[Any, Dict[str, Any]]:
+    """Translate a document shard by shard in worker processes
+
+    With parsed_doc (e.g. parsed on upload) the shards reuse its layers; otherwise each
+    shard is parsed in its worker. Returns the merged, reconstructed document and the
+    results in the same shape as SmartDocumentTranslator.last_result.
+    Cancelling cancel_token drops shards that have not started and raises JobCancelled
+    without waiting for running shards.
+    """
+    processes = processes or os.cpu_count() or 1
+    doc = _load_document(source_bytes)
+    layout_layer = parsed_doc['layout_layer'] if parsed_doc else _heading_layout(doc)
+    shards = plan_shards(doc, layout_layer, processes)
+
+    if parsed_doc:
+        layers = {layer: _split_layer(parsed_doc[layer], shards)
+                  for layer in ('content_layer', 'format_layer', 'layout_layer')}
+        parsed_shards = [{layer: layers[layer][index] for layer in layers} for index in range(len(shards))]
+    else:
+        parsed_shards = [None] * len(shards)
+    tasks = [dict(shard, target_lang=target_lang, parsed=parsed_shards[index])
+             for index, shard in enumerate(shards)]
+
+    results = [None] * len(tasks)
+    translator_config = pickle.dumps(system.translator.export_config())
+    stop_waiters = {cancel_token.as_future()} if cancel_token else set()
+    executor = ProcessPoolExecutor(max_workers=min(processes, len(tasks)), initializer=_init_worker,
+                                   initargs=(source_bytes, translator_config))
+    try:
+        futures = {executor.submit(_process_shard, task): index for index, task in enumerate(tasks)}
+        pending = set(futures)
+        while pending:
+            done, not_done = wait(pending | stop_waiters, return_when=FIRST_COMPLETED)
+            if cancel_token is not None and cancel_token.cancelled:
+                raise JobCancelled("Job was cancelled")
+            pending = not_done - stop_waiters
+            for future in done:
+                result = future.result()
+                results[futures[future]] = result
+                if on_segment:
+                    for item in result['translated_content']:
+                        if 'translated_text' in item:
+                            on_segment(item)
+    finally:
+        # 取消时丢弃未开始的分片，也不等待运行中的分片（其结果被忽略）
+        executor.shutdown(wait=not (cancel_token is not None and cancel_token.cancelled), cancel_futures=True)
+
+    # 用各分片重建后的正文替换原正文，最终的节属性(sectPr)保留在末尾
+    body = doc.element.body
+    for block in _body_blocks(doc):
+        body.remove(block)
+    final_sect_pr = body.find(qn('w:sectPr'))
+    for result in results:
+        for xml in result['elements']:
+            element = parse_xml(xml)
+            if final_sect_pr is not None:
+                final_sect_pr.addprevious(element)
+            else:
+                body.append(element)
+
+    if parsed_doc is None:
+        parsed_doc = _merge_parsed(results)
+
+    translated_by_id = {item['id']: item for result in results for item in result['translated_content']}
+    usage = {}
+    passthrough_counts = {}
+    for result in results:
+        for reason, count in result['passthrough_counts'].items():
+            passthrough_counts[reason] = passthrough_counts.get(reason, 0) + count
+        for entry in result['terminology_usage']:
+            usage.setdefault(entry['source'], dict(entry, count=0))['count'] += entry['count']
+
+    return doc, {
+        'parsed_doc': parsed_doc,
+        'translated_content': [translated_by_id.get(item.get('id'), item) for item in parsed_doc['content_layer']],
+        'unresolved_segments': [segment for result in results for segment in result['unresolved_segments']],
+        'terminology_usage': sorted(usage.values(), key=lambda entry: entry['count'], reverse=True),
+        'memory_hits': sum(result['memory_hits'] for result in results),
+        'passthrough_counts': passthrough_counts
+    }
@@ -11,9 +11,14 @@ import os
 class SimpleDisplayInterface:
     """Simple display interface - only displays translation results"""
     
+    PAGE_SIZE_OPTIONS = [10, 20, 50, 100]
+    
     def __init__(self):
         self.original_paragraphs = []
         self.translated_paragraphs = []
+        self.rows = []           # 对照行：id / type / original / translated
+        self.job_id = None
+        self._job_cache = {}
     
     def load_documents(self, original_path: str, translated_path: str):
         """Load original and translated documents"""
@@ -25,6 +30,9 @@ class SimpleDisplayInterface:
             # Read translated document
             translated_doc = Document(translated_path)
             self.translated_paragraphs = [p.text.strip() for p in translated_doc.paragraphs if p.text.strip()]
+            self.rows = []
+            self.job_id = None
+            self._job_cache = {}
             
             st.success("✅ Documents loaded successfully!")
             return True
@@ -32,6 +40,61 @@ class SimpleDisplayInterface:
             st.error(f"❌ Failed to load documents: {str(e)}")
             return False
     
+    def load_from_items(self, translated_items: List[Dict[str, Any]], job_id: str = None) -> bool:
+        """Load comparison rows from already-parsed pipeline data, cached per job"""
+        cache = st.session_state.setdefault('simple_display_cache', {})
+        
+        # 同一文件重新翻译会得到新的译文列表，此时重建
+        if job_id and job_id in cache and cache[job_id]['items'] is translated_items:
+            entry = cache[job_id]
+        else:
+            rows = []
+            for item in translated_items or []:
+                if item.get('type') not in ('paragraph', 'table_cell'):
+                    continue
+                original = item.get('text', '').strip()
+                if not original:
+                    continue
+                rows.append({
+                    'id': item.get('id', ''),
+                    'type': item['type'],
+                    'original': original,
+                    'translated': item.get('translated_text', original).strip()
+                })
+            
+            entry = {
+                'items': translated_items,
+                'rows': rows,
+                'original_paragraphs': [row['original'] for row in rows],
+                'translated_paragraphs': [row['translated'] for row in rows],
+                'filters': {}
+            }
+            if job_id:
+                # 只保留当前任务的缓存，避免会话内存持续增长
+                cache.clear()
+                cache[job_id] = entry
+        
+        self.job_id = job_id
+        self._job_cache = entry
+        self.rows = entry['rows']
+        self.original_paragraphs = entry['original_paragraphs']
+        self.translated_paragraphs = entry['translated_paragraphs']
+        return bool(self.rows)
+    
+    def _filter_rows(self, query: str) -> List[Dict[str, Any]]:
+        """Filter rows by search text, memoized per job and query"""
+        query = query.strip().lower()
+        if not query:
+            return self.rows
+        
+        filters = self._job_cache.setdefault('filters', {})
+        if query not in filters:
+            filters[query] = [
+                row for row in self.rows
+                if query in row['original'].lower() or query in row['translated'].lower()
+            ]
+        return filters[query]
+    
     def display_simple_interface(self):
         """Display simple interface"""
         if not self.original_paragraphs or not self.translated_paragraphs:
@@ -56,38 +119,89 @@ class SimpleDisplayInterface:
         # Display translation results comparison
         st.markdown("### 📊 Translation Results Comparison")
         
-        # Use left-right column layout to display original and translated text
-        col1, col2 = st.columns(2)
+        if not self.rows:
+            # 旧接口：只有段落列表时按顺序配对
+            self.rows = [
+                {'id': f'para_{i}', 'type': 'paragraph', 'original': original, 'translated': translated}
+                for i, (original, translated) in enumerate(zip(self.original_paragraphs, self.translated_paragraphs))
+            ]
+        
+        key_prefix = f"simple_display_{self.job_id or 'default'}"
+        
+        # Search filter and page size
+        col1, col2 = st.columns([3, 1])
         
         with col1:
-            st.markdown("#### 📝 Original Text")
-            for i, paragraph in enumerate(self.original_paragraphs):
-                if paragraph.strip():
-                    st.markdown(f"**Paragraph {i+1}:**")
-                    st.text_area(
-                        f"Original Paragraph {i+1}",
-                        value=paragraph,
-                        height=100,
-                        key=f"original_display_{i}",
-                        disabled=True
-                    )
-                    st.markdown(f"Word count: {len(paragraph)}")
-                    st.markdown("---")
+            query = st.text_input(
+                "🔍 Search",
+                key=f"{key_prefix}_search",
+                placeholder="Filter paragraphs by original or translated text"
+            )
         
         with col2:
+            page_size = st.selectbox(
+                "Page Size",
+                options=self.PAGE_SIZE_OPTIONS,
+                index=1,
+                key=f"{key_prefix}_page_size"
+            )
+        
+        rows = self._filter_rows(query)
+        if not rows:
+            st.info("ℹ️ No paragraphs match the search")
+            self._display_translation_stats()
+            return
+        
+        total_pages = (len(rows) + page_size - 1) // page_size
+        
+        # Jump-to page
+        page = st.number_input(
+            f"Page (1-{total_pages})",
+            min_value=1,
+            max_value=total_pages,
+            value=1,
+            step=1,
+            key=f"{key_prefix}_page_{page_size}_{query.strip().lower()}"
+        )
+        
+        start = (int(page) - 1) * page_size
+        window = rows[start:start + page_size]
+        st.caption(f"Showing {start + 1}-{start + len(window)} of {len(rows)} paragraphs")
+        
+        # Only render the visible window, original and translation side by side
+        header_col1, header_col2 = st.columns(2)
+        with header_col1:
+            st.markdown("#### 📝 Original Text")
+        with header_col2:
             st.markdown("#### 🌐 Translated Text")
-            for i, paragraph in enumerate(self.translated_paragraphs):
-                if paragraph.strip():
-                    st.markdown(f"**Paragraph {i+1}:**")
-                    st.text_area(
-                        f"Translated Paragraph {i+1}",
-                        value=paragraph,
-                        height=100,
-                        key=f"translated_display_{i}",
-                        disabled=True
-                    )
-                    st.markdown(f"Word count: {len(paragraph)}")
-                    st.markdown("---")
+        
+        for offset, row in enumerate(window):
+            index = start + offset
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.markdown(f"**Paragraph {index + 1}:**")
+                st.text_area(
+                    f"Original Paragraph {index + 1}",
+                    value=row['original'],
+                    height=100,
+                    key=f"original_display_{row['id']}",
+                    disabled=True,
+                    label_visibility="collapsed"
+                )
+                st.caption(f"Word count: {len(row['original'])}")
+            
+            with col2:
+                st.markdown(f"**Paragraph {index + 1}:**")
+                st.text_area(
+                    f"Translated Paragraph {index + 1}",
+                    value=row['translated'],
+                    height=100,
+                    key=f"translated_display_{row['id']}",
+                    disabled=True,
+                    label_visibility="collapsed"
+                )
+                st.caption(f"Word count: {len(row['translated'])}")
         
         # Display translation statistics
         self._display_translation_stats()
@@ -97,8 +211,9 @@ class SimpleDisplayInterface:
         st.markdown("### 📈 Translation Statistics")
         
         # Calculate statistics
-        total_original_chars = sum(len(p) for p in self.original_paragraphs)
-        total_translated_chars = sum(len(p) for p in self.translated_paragraphs)
+        summary = self.get_translation_summary()
+        total_original_chars = summary['total_original_chars']
+        total_translated_chars = summary['total_translated_chars']
         
         col1, col2, col3, col4 = st.columns(4)
         
@@ -120,15 +235,21 @@ class SimpleDisplayInterface:
         if not self.original_paragraphs or not self.translated_paragraphs:
             return {}
         
+        if 'summary' in self._job_cache:
+            return self._job_cache['summary']
+        
         total_original_chars = sum(len(p) for p in self.original_paragraphs)
         total_translated_chars = sum(len(p) for p in self.translated_paragraphs)
         
-        return {
+        summary = {
             'total_paragraphs': len(self.original_paragraphs),
             'total_original_chars': total_original_chars,
             'total_translated_chars': total_translated_chars,
             'length_ratio': total_translated_chars / total_original_chars if total_original_chars > 0 else 1
         }
+        if self.job_id:
+            self._job_cache['summary'] = summary
+        return summary
     
     def display_translation_summary(self):
         """Display translation summary"""
@@ -0,0 +1,81 @@
+"""
+Process-wide in-flight request coalescing (single flight)
+Concurrent calls with the same key wait on one outstanding call and share its result,
+across Streamlit sessions and worker threads of the same server process. Errors that
+belong to the leader alone (e.g. its job was cancelled) are not handed to followers;
+they run the call again instead.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Call:
+    """One outstanding call that followers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.private = False  # error concerns the leader only
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls by key; nothing is cached after a call completes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'executed': 0, 'coalesced': 0, 'errors': 0, 'private_errors': 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any],
+           is_private_error: Callable[[BaseException], bool] = None) -> Any:
+        """Run fn once per key among concurrent callers and return its result to all of them
+
+        An error for which is_private_error returns True is raised only in the caller whose
+        fn raised it; callers waiting on that call start over and one of them runs fn.
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self._stats['executed'] += 1
+                else:
+                    self._stats['coalesced'] += 1
+
+            if not leader:
+                call.done.wait()
+                if call.error is None:
+                    return call.result
+                if call.private:
+                    continue
+                raise call.error
+
+            try:
+                call.result = fn()
+                return call.result
+            except BaseException as e:
+                call.error = e
+                call.private = bool(is_private_error and is_private_error(e))
+                with self._lock:
+                    self._stats['private_errors' if call.private else 'errors'] += 1
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Executed calls, coalesced followers and shared/private errors since start"""
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
+
+
+# Shared by every translator in this process
+translation_flight = SingleFlight()
@@ -4,11 +4,33 @@ Based on innovative hybrid strategy: Structural Layer Extraction + Semantic-Awar
 """
 
 import streamlit as st
-import tempfile
-import os
-from smart_translator import SmartDocumentTranslator, StructuralParser, SemanticTranslator, SmartReconstructor, FormatCorrector, DualViewEditor
+import io
+import hashlib
+import logging
+from smart_translator import SmartDocumentTranslator, StructuralParser, SemanticTranslator, SmartReconstructor, FormatCorrector
+from dual_view_editor import DualViewEditor
+from translation_memory import TranslationMemory
+from cancellation import CancellationToken
+from artifact_cache import ArtifactCache
 import json
 
+# Number of early-landing segments shown in the preview while a job runs
+PREVIEW_SEGMENTS = 15
+
+def report_to_streamlit(level: str, message: str):
+    """Show progress and errors from the translation core in the page"""
+    getattr(st, level)(message)
+
+@st.cache_resource
+def get_artifact_cache():
+    """Parse results and finished documents shared by all sessions of this server; None if unusable"""
+    try:
+        return ArtifactCache()
+    except OSError as e:
+        # Unsafe or unwritable cache directory: translate without caching
+        logging.getLogger(__name__).warning(f"Artifact cache disabled: {str(e)}")
+        return None
+
 def main():
     st.set_page_config(
         page_title="Intelligent Document Translation and Format Fidelity System",
@@ -231,6 +253,33 @@ def main():
                 help="Enter proper nouns to protect, one per line. The system has built-in common technical proper nouns."
             )
             st.info("ℹ️ Using built-in proper noun protection (GitHub, OpenAI, Python, etc.)")
+            use_ai_name_detection = st.checkbox(
+                "AI Special Name Detection",
+                value=False,
+                help="Detect repository, project and product names (e.g. naiveHobo/InvoiceNet) with a few document-level API calls"
+            )
+        
+        # Terminology locking
+        glossary_file = st.file_uploader(
+            "Glossary (CSV or TBX)",
+            type=['csv', 'tbx', 'xml'],
+            help="CSV with source,target columns or a TBX termbase. Only the terms found in each segment are sent with it."
+        )
+        
+        # Translation memory
+        memory_files = st.file_uploader(
+            "Translation Memory (TMX)",
+            type=['tmx'],
+            accept_multiple_files=True,
+            help="Segments found in the translation memory are reused instead of calling the API"
+        )
+        
+        # Tail latency
+        hedge_slow_requests = st.checkbox(
+            "Hedge Slow Requests",
+            value=False,
+            help="If a request is slower than the recent 95th-percentile latency, send one duplicate and use whichever answers first (at most 10% extra requests)"
+        )
         
         # Performance optimization
         use_performance_optimization = st.checkbox("Enable Performance Optimization", value=True, help="Use caching and batch processing to improve translation speed")
@@ -257,7 +306,7 @@ def main():
         
         if uploaded_file:
             st.success(f"✅ {uploaded_file.name} uploaded successfully")
-            st.info(f"📏 File size: {len(uploaded_file.getvalue())} bytes")
+            st.info(f"📏 File size: {uploaded_file.size} bytes")
     
     with col2:
         st.markdown("### 📊 Status")
@@ -269,16 +318,63 @@ def main():
     st.markdown('</div>', unsafe_allow_html=True)
     
     if uploaded_file is not None:
-        # Save uploaded file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            tmp_file_path = tmp_file.name
+        file_bytes = uploaded_file.getvalue()
+        job_id = hashlib.sha256(file_bytes + target_lang_code.encode('utf-8')).hexdigest()
+        
+        # Initialize intelligent translation system once per session, so the last job
+        # stays editable; the translator (and its pooled HTTP connections) is rebuilt
+        # only when the API key changes
+        if 'translator_system' not in st.session_state:
+            translator_system = SmartDocumentTranslator(reporter=report_to_streamlit)
+            translator_system.set_artifact_cache(get_artifact_cache())
+            st.session_state['translator_system'] = translator_system
+        translator_system = st.session_state['translator_system']
+        
+        system_key = hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+        if st.session_state.get('translator_system_key') != system_key:
+            previous_translator = translator_system.translator
+            translator_system.set_translator(api_key)
+            if previous_translator is not None:
+                # The loaded glossary and translation memory belong to the session, not to the key
+                translator_system.translator.set_terminology(previous_translator.terminology)
+                translator_system.translator.set_translation_memory(previous_translator.translation_memory)
+            st.session_state['translator_system_key'] = system_key
+        
+        # Hedging keeps its latency history, so only rebuild it when the setting changes
+        hedging_key = (system_key, hedge_slow_requests)
+        if st.session_state.get('hedging_key') != hedging_key:
+            translator_system.translator.set_hedging(hedge_slow_requests)
+            st.session_state['hedging_key'] = hedging_key
+        
+        # Load glossary once per uploaded file
+        glossary_key = glossary_file.file_id if glossary_file else None
+        if st.session_state.get('glossary_key') != glossary_key:
+            try:
+                if glossary_file:
+                    term_count = translator_system.translator.load_terminology(glossary_file, file_name=glossary_file.name)
+                    st.success(f"✅ Glossary loaded, {term_count} terms")
+                else:
+                    translator_system.translator.set_terminology({})
+                st.session_state['glossary_key'] = glossary_key
+            except Exception as e:
+                st.error(f"❌ Failed to load glossary: {str(e)}")
         
-        # Initialize intelligent translation system
-        translator_system = SmartDocumentTranslator()
-        translator_system.set_translator(api_key)
+        # Import translation memory once per set of uploaded files
+        memory_key = tuple(sorted(f.file_id for f in memory_files)) if memory_files else None
+        if st.session_state.get('memory_key') != memory_key:
+            memory = None
+            if memory_files:
+                memory = TranslationMemory()
+                try:
+                    imported = sum(memory.import_tmx(f) for f in memory_files)
+                    st.success(f"✅ Translation memory loaded, {imported} segments")
+                except Exception as e:
+                    st.error(f"❌ Failed to load translation memory: {str(e)}")
+            translator_system.translator.set_translation_memory(memory)
+            st.session_state['memory_key'] = memory_key
         
         # Set proper noun protection
+        translator_system.translator.use_ai_name_detection = use_proper_noun_protection and use_ai_name_detection
         if use_proper_noun_protection:
             if custom_proper_nouns:
                 try:
@@ -291,117 +387,208 @@ def main():
             else:
                 st.info("ℹ️ Using built-in proper noun protection (GitHub, OpenAI, Python, etc.)")
         
+        # Parse as soon as the file is uploaded, before the button is pressed
+        parse_key = hashlib.sha256(file_bytes).hexdigest()
+        if st.session_state.get('parsed_doc_key') != parse_key:
+            st.session_state['parsed_doc'] = translator_system.parse_document(file_bytes)
+            st.session_state['parsed_doc_key'] = parse_key
+        parsed_doc = st.session_state['parsed_doc']
+        
+        # A run that never finished was stopped by the cancel button
+        if st.session_state.pop('translation_running', False):
+            st.warning("⏹ Translation cancelled, remaining segments were not sent")
+        
         # Simple translation button
         if st.button("🚀 Start Translation", type="primary"):
             st.info("🔄 Processing document...")
+            # Clicking cancel makes Streamlit stop this run at its next UI update
+            st.button("⏹ Cancel Translation")
+            
+            # Early preview: headings and the first page are translated first
+            total_segments = 0
+            if parsed_doc:
+                total_segments = sum(1 for item in parsed_doc['content_layer'] if item['type'] in ('paragraph', 'table_cell'))
+            progress_bar = st.progress(0.0, text="Waiting for first results...")
+            preview_placeholder = st.empty()
+            landed_segments = []
+            
+            def show_preview(item):
+                landed_segments.append(item)
+                progress_bar.progress(
+                    min(len(landed_segments) / max(total_segments, 1), 1.0),
+                    text=f"Translated {len(landed_segments)}/{total_segments} segments"
+                )
+                if len(landed_segments) <= PREVIEW_SEGMENTS:
+                    preview_placeholder.markdown("#### 👀 Early Preview\n\n" + "\n\n".join(
+                        f"{segment['text'][:200]}  \n→ {segment['translated_text'][:200]}"
+                        for segment in landed_segments
+                    ))
             
             with st.spinner("Performing intelligent document translation..."):
-                # Create output file path
-                output_filename = f"translated_{uploaded_file.name}"
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as output_file:
-                    output_path = output_file.name
+                # Execute intelligent translation entirely in memory
+                cancel_token = CancellationToken()
+                st.session_state['translation_running'] = True
+                try:
+                    result = translator_system.process_document(
+                        file_bytes, target_lang_code, parsed_doc=parsed_doc, on_segment=show_preview,
+                        cancel_token=cancel_token
+                    )
+                except BaseException:
+                    # Streamlit interrupted the run: no further requests for this job
+                    cancel_token.cancel()
+                    raise
+                st.session_state['translation_running'] = False
                 
-                # Execute intelligent translation
-                success = translator_system.process_document(
-                    tmp_file_path, target_lang_code, output_path
-                )
+                if result:
+                    if result.status == 'partial':
+                        st.warning(f"⚠️ Translation completed with {len(result.untranslated_ids)} "
+                                   f"segments kept in the source language")
+                    else:
+                        st.success("🎉 Translation completed!")
+                    
+                    # Read generated document
+                    file_data = result.output.read()
+                    result.output.close()
+                    
+                    # Editor text areas of the previous job would read as edits of the new translations
+                    for key in [key for key in st.session_state if key.startswith(('trans_', 'orig_'))]:
+                        del st.session_state[key]
+                    
+                    # Keep the job in session state so reruns (paging, search) reuse it
+                    st.session_state['translation_job'] = {
+                        'job_id': job_id,
+                        'file_name': uploaded_file.name,
+                        'file_data': file_data,
+                        'translated_content': translator_system.last_result['translated_content'],
+                        'unresolved_segments': translator_system.last_result['unresolved_segments'],
+                        'terminology_usage': translator_system.last_result['terminology_usage'],
+                        'passthrough_counts': translator_system.last_result.get('passthrough_counts', {}),
+                        'hedge_stats': translator_system.translator.get_hedge_stats(),
+                        'breaker_stats': translator_system.translator.get_breaker_stats()
+                    }
+                else:
+                    st.error("❌ 智能翻译失败，请检查文档格式和API密钥")
+        
+        job = st.session_state.get('translation_job')
+        if job and job['job_id'] == job_id:
+            file_data = job['file_data']
+            output_filename = f"translated_{job['file_name']}"
+            
+            st.download_button(
+                label="📥 Download Translated Document",
+                data=file_data,
+                file_name=output_filename,
+                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+            )
+            
+            if job['terminology_usage']:
+                with st.expander(f"📚 {len(job['terminology_usage'])} glossary terms used", expanded=False):
+                    st.table(job['terminology_usage'])
+            
+            passthrough_counts = job.get('passthrough_counts')
+            if passthrough_counts:
+                st.caption(f"⚡ {sum(passthrough_counts.values())} API calls avoided, kept unchanged: " +
+                           ", ".join(f"{reason.replace('_', ' ')} {count}" for reason, count in passthrough_counts.items()))
+            
+            hedge_stats = job.get('hedge_stats')
+            if hedge_stats and hedge_stats['hedged']:
+                st.caption(f"⏱️ {hedge_stats['hedged']} slow requests hedged, "
+                           f"{hedge_stats['hedge_wins']} answered by the duplicate first")
+            
+            tripped = [breaker for breaker in job.get('breaker_stats', []) if breaker['trips']]
+            if tripped:
+                st.caption("🔌 Backend failing, requests were failed fast or sent to the secondary backend: " +
+                           ", ".join(f"{breaker['name']} ({breaker['rejected']} rejected)" for breaker in tripped))
+            
+            if job['unresolved_segments']:
+                with st.expander(f"⚠️ {len(job['unresolved_segments'])} segments kept in the source language", expanded=False):
+                    for segment in job['unresolved_segments']:
+                        st.markdown(f"**{segment['id']}**: {segment['text'][:200]}  \n_{'; '.join(segment['problems'])}_")
+            
+            # Display translation completion information and paragraph comparison
+            if show_dual_view:
+                st.markdown("---")
+                st.subheader("📊 Translation Completed")
+                
+                # Display translation statistics
+                col1, col2, col3 = st.columns(3)
+                
+                with col1:
+                    st.metric("Translation Status", "✅ Completed")
+                
+                with col2:
+                    st.metric("Target Language", target_lang)
                 
-                if success:
-                    st.success("🎉 Translation completed!")
+                with col3:
+                    st.metric("File Size", f"{len(file_data)} bytes")
+                
+                # Display success message
+                st.success("🎉 Document translation completed! You can download the translated document.")
+                
+                # Simple display interface
+                st.markdown("---")
+                st.subheader("📄 Translation Results Display")
+                
+                # Initialize simple display interface
+                from simple_display_interface import SimpleDisplayInterface
+                display_interface = SimpleDisplayInterface()
+                
+                # Load pipeline data for display (no need to re-open both documents)
+                if display_interface.load_from_items(job['translated_content'], job_id=job_id):
+                    # Display translation summary
+                    display_interface.display_translation_summary()
                     
-                    # Read generated file
-                    with open(output_path, 'rb') as f:
-                        file_data = f.read()
+                    # Display simple display interface
+                    display_interface.display_simple_interface()
                     
-                    st.download_button(
-                        label="📥 Download Translated Document",
-                        data=file_data,
-                        file_name=output_filename,
-                        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                    )
+                    # Edit translations: only the changed segments are patched into the document
+                    st.markdown("---")
+                    with st.expander("✏️ Edit Translations", expanded=False):
+                        editor = DualViewEditor()
+                        editor.display_page_comparison(job['translated_content'], job['translated_content'],
+                                                       parsed_doc['layout_layer'] if parsed_doc else None,
+                                                       job_id=job_id)
+                        # Widgets of other pages are dropped on rerun, so keep the edits in the job
+                        pending_edits = job.setdefault('pending_edits', {})
+                        pending_edits.update(editor.collect_edits(job['translated_content']))
+                        if pending_edits:
+                            st.caption(f"{len(pending_edits)} edited segments not yet applied")
                     
-                    # Display translation completion information and paragraph comparison
-                    if show_dual_view:
-                        st.markdown("---")
-                        st.subheader("📊 Translation Completed")
-                        
-                        # Display translation statistics
-                        col1, col2, col3 = st.columns(3)
-                        
-                        with col1:
-                            st.metric("Translation Status", "✅ Completed")
-                        
-                        with col2:
-                            st.metric("Target Language", target_lang)
-                        
-                        with col3:
-                            st.metric("File Size", f"{len(file_data)} bytes")
-                        
-                        # Display success message
-                        st.success("🎉 Document translation completed! You can download the translated document.")
-                        
-                        # Simple display interface
-                        st.markdown("---")
-                        st.subheader("📄 Translation Results Display")
-                        
-                        # Initialize simple display interface
-                        from simple_display_interface import SimpleDisplayInterface
-                        display_interface = SimpleDisplayInterface()
-                        
-                        # Load documents for display
-                        if display_interface.load_documents(tmp_file_path, output_path):
-                            # Display translation summary
-                            display_interface.display_translation_summary()
-                            
-                            # Display simple display interface
-                            display_interface.display_simple_interface()
-                            
-                            # Final output
-                            st.markdown("---")
-                            st.subheader("📤 Final Output")
-                            
-                            if st.button("📄 Generate Final Document", type="primary"):
-                                with st.spinner("Generating final document..."):
-                                    final_output_path = tempfile.mktemp(suffix='.docx')
-                                    
-                                    if edit_interface.create_final_document(final_output_path):
-                                        st.success("✅ Final document generated successfully!")
-                                        
-                                        # Read final document
-                                        with open(final_output_path, 'rb') as f:
-                                            final_data = f.read()
-                                        
-                                        # Provide download
-                                        st.download_button(
-                                            label="📥 Download Final Document",
-                                            data=final_data,
-                                            file_name=f"final_{uploaded_file.name}",
-                                            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                                        )
-                                        
-                                        # Clean up temporary files
-                                        try:
-                                            os.unlink(final_output_path)
-                                        except:
-                                            pass
-                                    else:
-                                        st.error("❌ Final document generation failed")
-                        else:
-                            st.warning("⚠️ Unable to load documents for editing")
-                        
-                        # Display usage tips
-                        st.info("💡 Tip: The translated document has maintained the original format and can be used directly.")
+                    # Final output
+                    st.markdown("---")
+                    st.subheader("📤 Final Output")
                     
-                    # Clean up temporary files
-                    try:
-                        os.unlink(tmp_file_path)
-                        os.unlink(output_path)
-                    except:
-                        pass
-                
+                    if st.button("📄 Generate Final Document", type="primary"):
+                        with st.spinner("Generating final document..."):
+                            final_output = io.BytesIO()
+                            result = translator_system.apply_edits(job.get('pending_edits', {}), final_output)
+                            
+                            if result:
+                                st.success("✅ Final document generated successfully!")
+                                
+                                final_data = final_output.getvalue()
+                                job['file_data'] = final_data
+                                job['pending_edits'] = {}
+                                # Comparison rows and page statistics are rebuilt from the edited items
+                                st.session_state.pop('simple_display_cache', None)
+                                st.session_state.pop('page_index', None)
+                                
+                                # Provide download
+                                st.download_button(
+                                    label="📥 Download Final Document",
+                                    data=final_data,
+                                    file_name=f"final_{job['file_name']}",
+                                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+                                )
+                            else:
+                                st.error(f"❌ Final document generation failed: {result.error}")
                 else:
-                    st.error("❌ 智能翻译失败，请检查文档格式和API密钥")
+                    st.warning("⚠️ Unable to load documents for editing")
+                
+                # Display usage tips
+                st.info("💡 Tip: The translated document has maintained the original format and can be used directly.")
     
+
     # Simple usage instructions
     with st.expander("📖 How to Use", expanded=False):
         st.markdown("""
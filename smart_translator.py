@@ -1,19 +1,185 @@
 """
 Intelligent Document Translation and Format Fidelity System
 Based on innovative hybrid strategy: Structural Layer Extraction + Semantic-Aware Translation + Smart Format Reconstruction
+
+The core is UI-agnostic: progress and errors go to logging and an optional reporter callback,
+and python-docx is imported on first use. The Streamlit editor lives in dual_view_editor.py.
 """
 
-import streamlit as st
 import tempfile
+import copy
+import io
 import os
-from docx import Document
-from docx.shared import Pt, Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.oxml.shared import OxmlElement, qn
 import json
+import logging
 import re
-from typing import Dict, List, Tuple, Any
-import openai
+import time
+import hashlib
+import shutil
+import threading
+from collections import Counter, OrderedDict
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Dict, List, Tuple, Any, Union, BinaryIO, Callable
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from api_client import APIError, ChatClient, get_message_content
+from circuit_breaker import CircuitBreaker, CircuitOpenError, is_backend_failure
+from cancellation import CancellationToken, JobCancelled
+from model_router import ModelRouter, Route
+from glossary import Glossary
+from single_flight import translation_flight
+
+if TYPE_CHECKING:
+    from docx.document import Document  # 只用于类型注解，运行时python-docx在首次使用时才导入
+
+logger = logging.getLogger(__name__)
+
+# reporter(level, message)：界面等调用方接收进度和错误消息，level为'info'/'warning'/'error'
+Reporter = Callable[[str, str], None]
+
+def _report(reporter: Reporter, level: str, message: str):
+    """写入日志，并转发给调用方提供的reporter"""
+    logger.log(getattr(logging, level.upper()), message)
+    if reporter:
+        reporter(level, message)
+
+# 输出超过该大小时才落盘，小文件全程在内存中处理
+SPILL_TO_DISK_THRESHOLD = 32 * 1024 * 1024
+
+DocumentSource = Union[str, bytes, bytearray, BinaryIO]
+
+def _is_document(obj) -> bool:
+    """是否为已加载的python-docx文档对象"""
+    return hasattr(obj, 'paragraphs') and hasattr(obj, 'save')
+
+def _read_source(source: DocumentSource) -> bytes:
+    """读取文档来源（路径、字节或文件对象）为字节"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if hasattr(source, 'read'):
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        return source.read()
+    with open(source, 'rb') as f:
+        return f.read()
+
+def _load_document(source: DocumentSource):
+    """从路径、字节或文件对象加载文档，不经过临时文件"""
+    if _is_document(source):
+        return source
+    from docx import Document
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Document(io.BytesIO(source))
+    if hasattr(source, 'read') and hasattr(source, 'seek'):
+        source.seek(0)
+    return Document(source)
+
+def _save_document(doc, output: Union[str, BinaryIO], source: bytes = None):
+    """保存文档到路径或可写文件对象，文件对象保存后回到起始位置
+    
+    传入源文档字节时，未修改的压缩包条目（图片等）按原压缩数据直接复制，只重写修改过的部分
+    """
+    if source is not None:
+        from docx_writer import save_docx
+        save_docx(doc, output, source)
+        return
+    doc.save(output)
+    if hasattr(output, 'seek'):
+        output.seek(0)
+
+def _no_profile(stage: str):
+    """未开启性能分析时的阶段包装器"""
+    return nullcontext()
+
+# 文档级特殊名称识别结果，按文本块哈希在进程内LRU缓存；只缓存成功的识别结果
+SPECIAL_NAME_CACHE_SIZE = 10000
+_SPECIAL_NAME_CACHE = OrderedDict()
+_SPECIAL_NAME_CACHE_LOCK = threading.Lock()
+
+# 提示词版本，修改翻译提示时递增，避免合并不同提示的请求
+PROMPT_VERSION = 2
+
+
+def _client_identity(client) -> Tuple:
+    """合并请求时区分后端：端点和API密钥都相同的客户端才共享回复，其他客户端按实例区分"""
+    identity = getattr(client, 'identity', None)
+    return identity() if identity else (type(client).__name__, id(client))
+
+
+def _is_private_error(error: BaseException) -> bool:
+    """只属于发起请求的任务的错误：取消、本翻译器的熔断、鉴权失败；合并的其他请求会重新发出"""
+    if isinstance(error, (JobCancelled, CircuitOpenError)):
+        return True
+    return isinstance(error, APIError) and error.status_code in (401, 403)
+
+# 译文校验用的模式
+PLACEHOLDER_PATTERN = re.compile(r'__PROPER_NOUN_\d+__')
+URL_PATTERN = re.compile(r'(?:https?://|www\.)[^\s<>"\']+')
+
+# 数字校验：阿拉伯数字后的数量级词，以及中文数字（“150万”“第一季度”与“1.5 million”“1st”等值）
+_SCALE_WORDS = {'thousand': 10 ** 3, 'million': 10 ** 6, 'billion': 10 ** 9, 'trillion': 10 ** 12,
+                '十': 10, '百': 100, '千': 10 ** 3, '万': 10 ** 4, '萬': 10 ** 4, '亿': 10 ** 8, '億': 10 ** 8}
+_SCALED_NUMBER_PATTERN = re.compile(
+    r'(\d+(?:[.,]\d+)*)(?:\s*(thousand|million|billion|trillion)\b|([十百千万萬亿億]+))?', re.IGNORECASE
+)
+_CJK_DIGITS = {'零': 0, '〇': 0, '一': 1, '二': 2, '两': 2, '兩': 2, '三': 3, '四': 4,
+               '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+_CJK_NUMBER_PATTERN = re.compile(r'[零〇一二两兩三四五六七八九十百千万萬亿億]+')
+
+
+def _decimal_candidates(token: str) -> set:
+    """阿拉伯数字的可能取值：千分位或小数点写法不确定时都算，另含去掉分隔符后的整数"""
+    from decimal import Decimal
+    values = {Decimal(re.sub(r'[.,]', '', token))}
+    if re.fullmatch(r'\d{1,3}(?:,\d{3})+(?:\.\d+)?', token):
+        values.add(Decimal(token.replace(',', '')))
+    elif re.fullmatch(r'\d{1,3}(?:\.\d{3})+(?:,\d+)?', token):
+        values.add(Decimal(token.replace('.', '').replace(',', '.')))
+    elif re.fullmatch(r'\d+[.,]\d+', token):
+        values.add(Decimal(token.replace(',', '.')))
+    return values
+
+
+def _cjk_number_value(text: str) -> int:
+    """中文数字的值；没有单位时按逐位读法（“二〇二四”为2024）"""
+    if not any(ch in _SCALE_WORDS for ch in text):
+        return int(''.join(str(_CJK_DIGITS[ch]) for ch in text))
+    total = section = number = 0
+    for ch in text:
+        if ch in _CJK_DIGITS:
+            number = _CJK_DIGITS[ch]
+        elif _SCALE_WORDS[ch] < 10 ** 4:
+            section += (number or 1) * _SCALE_WORDS[ch]
+            number = 0
+        elif _SCALE_WORDS[ch] == 10 ** 8:
+            total = (total + section + number) * 10 ** 8
+            section = number = 0
+        else:
+            total += (section + number or 1) * 10 ** 4
+            section = number = 0
+    return total + section + number
+
+
+def _scaled_number_values(match) -> set:
+    """_SCALED_NUMBER_PATTERN匹配到的数字的可能取值，带数量级时同时包含换算后的值"""
+    values = _decimal_candidates(match.group(1))
+    scale = match.group(2) or match.group(3)
+    if scale:
+        multiplier = 1
+        for word in ([scale] if match.group(2) else scale):
+            multiplier *= _SCALE_WORDS[word.lower()]
+        values |= {value * multiplier for value in values}
+    return values
+
+
+def _number_values(text: str) -> set:
+    """文本中全部数字（阿拉伯数字和中文数字）的可能取值"""
+    values = set()
+    for match in _SCALED_NUMBER_PATTERN.finditer(text):
+        values |= _scaled_number_values(match)
+    for match in _CJK_NUMBER_PATTERN.finditer(text):
+        if any(ch in _CJK_DIGITS for ch in match.group()):
+            values.add(_cjk_number_value(match.group()))
+    return values
 
 class StructuralParser:
     """Structural Layer Parser - Decomposes documents into content layer, format layer, layout layer"""
@@ -23,12 +189,19 @@ class StructuralParser:
         self.format_layer = []   # Format information
         self.layout_layer = []   # Layout information
         self.anchors = {}        # Anchor mappings
+        self.reporter = None     # Reporter for errors, see _report
     
-    def parse_document(self, doc_path: str) -> Dict[str, Any]:
-        """Parse Word document, extract three-layer information"""
+    def parse_document(self, doc_source: DocumentSource, para_offset: int = 0,
+                       table_offset: int = 0) -> Dict[str, Any]:
+        """Parse Word document, extract three-layer information
+        
+        doc_source可以是文件路径、字节或二进制文件对象（如BytesIO）
+        para_offset/table_offset用于解析文档分片：id和页码按分片之前的段落、表格数量顺延，
+        与解析完整文档的结果一致
+        """
         try:
             # Use safer document loading method
-            doc = Document(doc_path)
+            doc = _load_document(doc_source)
             
             # Initialize parsing results
             result = {
@@ -45,7 +218,7 @@ class StructuralParser:
             }
             
             # Parse paragraphs
-            for i, paragraph in enumerate(doc.paragraphs):
+            for i, paragraph in enumerate(doc.paragraphs, start=para_offset):
                 try:
                     if paragraph.text.strip():
                         # 内容层：纯文本
@@ -96,12 +269,12 @@ class StructuralParser:
                         result['metadata']['total_paragraphs'] += 1
                 except Exception as e:
                     # 如果单个段落解析失败，跳过该段落
-                    print(f"段落 {i} 解析失败: {str(e)}")
+                    logger.warning(f"段落 {i} 解析失败: {str(e)}")
                     continue
             
             # 解析表格
             try:
-                for i, table in enumerate(doc.tables):
+                for i, table in enumerate(doc.tables, start=table_offset):
                     try:
                         table_content = self._parse_table(table, i)
                         result['content_layer'].extend(table_content['content'])
@@ -109,10 +282,10 @@ class StructuralParser:
                         result['layout_layer'].extend(table_content['layout'])
                         result['metadata']['total_tables'] += 1
                     except Exception as e:
-                        print(f"表格 {i} 解析失败: {str(e)}")
+                        logger.warning(f"表格 {i} 解析失败: {str(e)}")
                         continue
             except Exception as e:
-                print(f"表格解析失败: {str(e)}")
+                logger.warning(f"表格解析失败: {str(e)}")
             
             # 解析图片
             try:
@@ -128,12 +301,12 @@ class StructuralParser:
                         result['metadata']['total_images'] += 1
             except Exception as e:
                 # 如果图片解析失败，继续处理其他内容
-                print(f"图片解析警告: {str(e)}")
+                logger.warning(f"图片解析警告: {str(e)}")
             
             return result
             
         except Exception as e:
-            st.error(f"文档解析失败: {str(e)}")
+            _report(self.reporter, 'error', f"文档解析失败: {str(e)}")
             return None
     
     def _get_heading_level(self, style_name: str) -> int:
@@ -239,20 +412,157 @@ class StructuralParser:
             'layout': layout_info
         }
 
+class TranslationJob:
+    """一次translate_with_context调用的状态和翻译报告
+    
+    每次调用使用自己的实例并沿调用链传递，同一翻译器上的并发任务互不覆盖；
+    已取消任务中仍在进行的请求只写入自己的实例。
+    """
+    
+    def __init__(self, cancel_token: CancellationToken = None):
+        self.cancel_token = cancel_token  # 取消后不再发出新请求
+        self.layout_by_id = {}
+        self.terminology = None           # 任务开始时的术语表，任务进行中替换术语表不影响本任务
+        self.term_usage = Counter()       # 本任务的术语使用次数
+        self.proper_nouns = set()         # 本文档由AI识别出的特殊名称
+        self.compiled_nouns = None        # 本任务的专有名词词表，按长度降序
+        self.passthrough_counts = {}      # 按原因统计免于请求的片段数，见segment_classifier
+        self.memory_hits = 0
+        self.unresolved_segments = []     # 重试后仍未通过校验的片段
+    
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_token is not None and self.cancel_token.cancelled
+    
+    def report(self) -> Dict[str, Any]:
+        """翻译报告，字段与SmartDocumentTranslator.last_result中的一致"""
+        return {
+            'unresolved_segments': list(self.unresolved_segments),
+            'terminology_usage': self.terminology.get_usage_report(self.term_usage) if self.terminology else [],
+            'memory_hits': self.memory_hits,
+            'passthrough_counts': dict(self.passthrough_counts)
+        }
+
+
 class SemanticTranslator:
     """语义增强翻译器 - 支持上下文记忆、术语锁定、风格模仿、专有名词保护"""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, client: ChatClient = None, max_workers: int = 4,
+                 router: ModelRouter = None, **client_options):
+        """client_options透传给ChatClient：base_url、connect_timeout、read_timeout、pool_size"""
         self.api_key = api_key
+        self.reporter = None  # 错误消息的接收方，见_report
+        self.max_workers = max_workers  # 并发翻译线程数
+        client_options.setdefault('pool_size', max(10, max_workers))
+        self.client = client or ChatClient(api_key, **client_options)  # 每个翻译器独享连接池
+        self.router = router or ModelRouter()  # 按片段选择模型/端点
+        self.request_deadline = 60.0    # 单个请求的截止时间（秒）
+        self.hedger = None              # 慢请求对冲，见set_hedging
+        self.breaker_options = {'failure_threshold': 5, 'recovery_timeout': 30.0}
+        self._breakers = {}             # 每个后端(client)一个熔断器
+        self._breakers_lock = threading.Lock()
+        self.secondary_client = None    # 主后端熔断时的备用后端，见set_secondary_backend
+        self.secondary_model = None
+        self.retry_budget = 50          # 每个文档最多重试的请求数
+        self.max_segment_retries = 2    # 单个片段最多重试次数
+        self.translation_memory = None  # 翻译记忆库，命中的片段不再请求API
+        self.skip_untranslatable = True  # 数字、网址、代码、已是目标语言等片段原样保留，不请求API
         self.context_memory = {}  # 上下文记忆
-        self.terminology = {}     # 术语锁定
+        self.terminology = Glossary()  # 术语锁定，按片段只发送命中的条目
         self.style_examples = {}  # 风格示例
         self.proper_nouns = set()  # 专有名词集合
+        self.use_ai_name_detection = False  # 文档级AI特殊名称识别
+        self._compiled_nouns = None  # 按长度排序的专有名词词表缓存
         self._init_proper_nouns()  # 初始化常见专有名词
         
-    def set_terminology(self, terms: Dict[str, str]):
-        """设置术语锁定"""
-        self.terminology = terms
+    def export_config(self) -> Dict[str, Any]:
+        """可序列化的翻译器配置，用于在其他进程中重建等价的翻译器（见from_config）"""
+        return {
+            'api_key': self.api_key,
+            'client': self.client,
+            'max_workers': self.max_workers,
+            'routes': self.router.routes[:-1],
+            'router_options': {
+                'window': self.router.window,
+                'min_samples': self.router.min_samples,
+                'probe_every': self.router.probe_every
+            },
+            'request_deadline': self.request_deadline,
+            'hedging': self.hedger.options if self.hedger else None,
+            'breaker_options': dict(self.breaker_options),
+            'secondary_client': self.secondary_client,
+            'secondary_model': self.secondary_model,
+            'retry_budget': self.retry_budget,
+            'max_segment_retries': self.max_segment_retries,
+            'terminology': dict(self.terminology.terms),
+            'terminology_case_sensitive': self.terminology.case_sensitive,
+            'style_examples': dict(self.style_examples),
+            'proper_nouns': set(self.proper_nouns),
+            'use_ai_name_detection': self.use_ai_name_detection,
+            'skip_untranslatable': self.skip_untranslatable,
+            'translation_memory': self.translation_memory
+        }
+    
+    def options_fingerprint(self) -> Union[Dict[str, Any], None]:
+        """影响译文的全部选项，作为文档级缓存键的一部分（见artifact_cache.py）
+        
+        翻译记忆库不提供content_version（无法判断内容是否变化）时返回None，不缓存译文。
+        """
+        memory = self.translation_memory
+        if memory is not None and not hasattr(memory, 'content_version'):
+            return None
+        return {
+            'prompt_version': PROMPT_VERSION,
+            'models': [[route.name, route.model] for route in self.router.routes],
+            'secondary_model': self.secondary_model,
+            'terminology': sorted(self.terminology.terms.items()),
+            'terminology_case_sensitive': self.terminology.case_sensitive,
+            'style_examples': sorted(self.style_examples.items()),
+            'proper_nouns': sorted(self.proper_nouns),
+            'use_ai_name_detection': self.use_ai_name_detection,
+            'skip_untranslatable': self.skip_untranslatable,
+            # 修改或替换任一条目都会改变内容版本
+            'translation_memory': None if memory is None else memory.content_version()
+        }
+    
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'SemanticTranslator':
+        """按export_config的结果重建翻译器"""
+        translator = cls(config['api_key'], client=config['client'], max_workers=config['max_workers'],
+                         router=ModelRouter(config['routes'], **config['router_options']))
+        translator.request_deadline = config['request_deadline']
+        if config['hedging'] is not None:
+            translator.set_hedging(**config['hedging'])
+        translator.set_circuit_breaker(**config['breaker_options'])
+        translator.secondary_client = config['secondary_client']
+        translator.secondary_model = config['secondary_model']
+        translator.retry_budget = config['retry_budget']
+        translator.max_segment_retries = config['max_segment_retries']
+        translator.terminology = Glossary(config['terminology'],
+                                          case_sensitive=config['terminology_case_sensitive'])
+        translator.style_examples = config['style_examples']
+        translator.proper_nouns = set(config['proper_nouns'])
+        translator.use_ai_name_detection = config['use_ai_name_detection']
+        translator.skip_untranslatable = config['skip_untranslatable']
+        translator.translation_memory = config['translation_memory']
+        return translator
+    
+    def set_terminology(self, terms: Union[Dict[str, str], Glossary]):
+        """设置术语锁定，可传入字典或已加载的Glossary（CSV/TBX）"""
+        self.terminology = terms if isinstance(terms, Glossary) else Glossary(terms)
+    
+    def load_terminology(self, source: Union[str, BinaryIO], file_name: str = None, **kwargs) -> int:
+        """从CSV或TBX文件加载术语表，返回条目数"""
+        self.terminology = Glossary.load(source, file_name=file_name, **kwargs)
+        return len(self.terminology)
+    
+    def set_translation_memory(self, memory):
+        """设置翻译记忆库（TranslationMemory或任何提供lookup(text, target_lang)的对象）"""
+        self.translation_memory = memory
+    
+    def get_coalescing_stats(self) -> Dict[str, int]:
+        """进程内请求合并计数：实际发出的请求、被合并的请求"""
+        return translation_flight.get_stats()
     
     def set_style_examples(self, examples: Dict[str, str]):
         """设置风格示例"""
@@ -294,17 +604,142 @@ class SemanticTranslator:
         all_proper_nouns = tech_companies + open_source + protocols + universities
         self.proper_nouns.update(all_proper_nouns)
     
+    def set_hedging(self, enabled: bool = True, **hedge_options):
+        """开启慢请求对冲：超过该路由p95延迟仍未返回时发出一个重复请求，先返回者胜出
+        
+        hedge_options透传给RequestHedger，如max_hedge_ratio（对冲请求占比上限）
+        """
+        if self.hedger:
+            self.hedger.shutdown()
+        self.hedger = None
+        if enabled:
+            from hedging import RequestHedger
+            self.hedger = RequestHedger(**hedge_options)
+    
+    def get_hedge_stats(self) -> Dict[str, Any]:
+        """对冲请求计数：请求数、对冲数、对冲胜出数、超时数"""
+        return self.hedger.get_stats() if self.hedger else {}
+    
+    def set_circuit_breaker(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        """熔断设置：后端连续失败failure_threshold次后熔断，recovery_timeout秒后放行一个探测请求"""
+        self.breaker_options = {'failure_threshold': failure_threshold, 'recovery_timeout': recovery_timeout}
+        with self._breakers_lock:
+            self._breakers = {}
+    
+    def set_secondary_backend(self, client: ChatClient = None, model: str = None, **client_options):
+        """设置备用后端：主后端熔断期间请求改发到这里；client为None时按client_options新建ChatClient
+        
+        model为None时沿用路由选择的模型名。
+        """
+        if client is None and client_options:
+            client = ChatClient(self.api_key, **client_options)
+        self.secondary_client = client
+        self.secondary_model = model
+    
+    def close(self):
+        """关闭全部后端的连接池和对冲线程池，翻译器不再使用时调用"""
+        clients = [self.client, self.secondary_client] + [route.client for route in self.router.routes]
+        for client in {id(client): client for client in clients if client is not None}.values():
+            if hasattr(client, 'close'):
+                client.close()
+        if self.hedger:
+            self.hedger.shutdown()
+    
+    def get_breaker_stats(self) -> List[Dict[str, Any]]:
+        """各后端熔断器的状态和计数：熔断次数、被拒绝的请求数"""
+        with self._breakers_lock:
+            breakers = list(self._breakers.values())
+        return [breaker.get_stats() for breaker in breakers]
+    
+    def _breaker_for(self, client: ChatClient, name: str) -> CircuitBreaker:
+        with self._breakers_lock:
+            breaker = self._breakers.get(client)
+            if breaker is None:
+                breaker = self._breakers[client] = CircuitBreaker(name, **self.breaker_options)
+            return breaker
+    
+    def set_router(self, router: ModelRouter):
+        """设置模型路由"""
+        self.router = router
+    
+    def _chat(self, messages: List[Dict[str, str]], max_tokens: int,
+              temperature: float = 0.1, route: Route = None,
+              cancel_token: CancellationToken = None) -> str:
+        """按路由选择的模型和端点发送请求，返回回复文本，并记录该路由的延迟和错误
+        
+        主后端熔断时改用备用后端，没有备用后端（或备用后端也已熔断）时立即抛出CircuitOpenError。
+        cancel_token已取消时不发出请求，抛出JobCancelled。
+        """
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        route = route or self.router.default_route
+        client = route.client or self.client
+        model = route.model
+        hedge_key = route.name
+        primary = True
+        breaker = self._breaker_for(client, route.name)
+        if not breaker.allow():
+            if self.secondary_client is None:
+                raise CircuitOpenError(f"Backend for route '{route.name}' is unavailable (circuit open)")
+            client, model, hedge_key, primary = (self.secondary_client, self.secondary_model or route.model,
+                                                 (route.name, 'secondary'), False)
+            breaker = self._breaker_for(client, 'secondary')
+            if not breaker.allow():
+                raise CircuitOpenError("Primary and secondary backends are unavailable (circuit open)")
+        
+        def attempt(timeout):
+            return client.chat_completion(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=timeout
+            )
+        
+        start = time.monotonic()
+        try:
+            # 开启对冲时截止时间按总耗时计算，否则作为HTTP读超时
+            if self.hedger:
+                response = self.hedger.call(hedge_key, attempt, self.request_deadline)
+            else:
+                response = attempt(self.request_deadline)
+            content = get_message_content(response)
+        except Exception as e:
+            if is_backend_failure(e):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if primary:
+                self.router.record(route, time.monotonic() - start, success=False)
+            raise
+        
+        breaker.record_success()
+        if primary:
+            self.router.record(route, time.monotonic() - start, success=True)
+        return content
+    
     def add_proper_nouns(self, nouns: List[str]):
         """添加自定义专有名词"""
         self.proper_nouns.update(nouns)
+        self._compiled_nouns = None
     
-    def _protect_proper_nouns(self, text: str) -> Tuple[str, Dict[str, str]]:
+    def _get_compiled_nouns(self, job: TranslationJob = None) -> List[str]:
+        """编译后的专有名词词表（内置+自定义，给出job时加上本文档识别的），按长度降序，变更时才重建"""
+        if job is not None and job.proper_nouns:
+            if job.compiled_nouns is None:
+                job.compiled_nouns = sorted(self.proper_nouns | job.proper_nouns, key=len, reverse=True)
+            return job.compiled_nouns
+        if self._compiled_nouns is None:
+            self._compiled_nouns = sorted(self.proper_nouns, key=len, reverse=True)
+        return self._compiled_nouns
+    
+    def _protect_proper_nouns(self, text: str, job: TranslationJob = None) -> Tuple[str, Dict[str, str]]:
         """保护专有名词，返回替换后的文本和映射表"""
         protected_text = text
         noun_mapping = {}
         
         # 按长度排序，优先匹配长专有名词
-        sorted_nouns = sorted(self.proper_nouns, key=len, reverse=True)
+        sorted_nouns = self._get_compiled_nouns(job)
         
         for noun in sorted_nouns:
             if noun in protected_text:
@@ -316,8 +751,9 @@ class SemanticTranslator:
         
         return protected_text, noun_mapping
     
-    def _identify_special_names_with_ai(self, text: str) -> List[str]:
-        """使用OpenAI智能识别特殊名称（GitHub库名、项目名等）"""
+    def _identify_special_names_with_ai(self, text: str,
+                                        cancel_token: CancellationToken = None) -> Union[List[str], None]:
+        """使用OpenAI智能识别特殊名称（GitHub库名、项目名等），请求失败时返回None"""
         try:
             # 构建识别提示
             prompt = f"""
@@ -337,19 +773,17 @@ class SemanticTranslator:
 如果文本中没有特殊名称，请返回空行。
 """
             
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
+            response_text = self._chat(
                 messages=[
                     {"role": "system", "content": "你是一个专业的文本分析助手，专门识别技术文档中的特殊名称。"},
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=500,
-                temperature=0.1
-            )
+                cancel_token=cancel_token
+            ).strip()
             
             # 解析返回的特殊名称
             identified_names = []
-            response_text = response.choices[0].message.content.strip()
             
             if response_text:
                 for line in response_text.split('\n'):
@@ -359,34 +793,77 @@ class SemanticTranslator:
             
             return identified_names
             
+        except JobCancelled:
+            raise
         except Exception as e:
-            print(f"AI识别特殊名称失败: {str(e)}")
-            return []
+            # 超时、限流、熔断等失败不能当作“没有特殊名称”
+            logger.warning(f"AI识别特殊名称失败: {str(e)}")
+            return None
     
-    def _protect_special_names_with_ai(self, text: str) -> Tuple[str, Dict[str, str]]:
-        """使用AI智能保护特殊名称"""
-        try:
-            # 使用AI识别特殊名称
-            special_names = self._identify_special_names_with_ai(text)
-            
-            protected_text = text
-            noun_mapping = {}
-            
-            # 保护AI识别的特殊名称
-            for name in special_names:
-                if name in protected_text:
-                    placeholder = f"__SPECIAL_NAME_{len(noun_mapping)}__"
-                    noun_mapping[placeholder] = name
-                    protected_text = protected_text.replace(name, placeholder)
-            
-            return protected_text, noun_mapping
-            
-        except Exception as e:
-            print(f"AI保护特殊名称失败: {str(e)}")
-            return text, {}
+    def detect_special_names(self, content_items: List[Dict], chunk_chars: int = 6000,
+                             job: TranslationJob = None) -> List[str]:
+        """文档级特殊名称识别：对去重后的文本分块批量识别，结果按内容哈希缓存
+        
+        每个文档只需少量请求；给出job时识别结果并入该任务的专有名词词表。
+        """
+        # 去重后按顺序拼接成块
+        unique_texts = list(dict.fromkeys(
+            item['text'].strip() for item in content_items
+            if item.get('type') in ('paragraph', 'table_cell') and item.get('text', '').strip()
+        ))
+        
+        chunks = []
+        current = []
+        current_len = 0
+        for text in unique_texts:
+            if current and current_len + len(text) > chunk_chars:
+                chunks.append("\n".join(current))
+                current, current_len = [], 0
+            current.append(text)
+            current_len += len(text) + 1
+        if current:
+            chunks.append("\n".join(current))
+        
+        # 命中缓存的块不再请求
+        names = set()
+        pending = {}
+        for chunk in chunks:
+            digest = hashlib.sha256(chunk.encode('utf-8')).hexdigest()
+            with _SPECIAL_NAME_CACHE_LOCK:
+                cached = _SPECIAL_NAME_CACHE.get(digest)
+                if cached is not None:
+                    _SPECIAL_NAME_CACHE.move_to_end(digest)
+            if cached is not None:
+                names.update(cached)
+            else:
+                pending[digest] = chunk
+        
+        if pending:
+            cancel_token = job.cancel_token if job else None
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                results = dict(zip(pending, executor.map(
+                    lambda chunk: self._identify_special_names_with_ai(chunk, cancel_token), pending.values()
+                )))
+            with _SPECIAL_NAME_CACHE_LOCK:
+                for digest, found in results.items():
+                    if found is None:
+                        continue  # 识别失败的块下次重新请求
+                    _SPECIAL_NAME_CACHE[digest] = found
+                    _SPECIAL_NAME_CACHE.move_to_end(digest)
+                while len(_SPECIAL_NAME_CACHE) > SPECIAL_NAME_CACHE_SIZE:
+                    _SPECIAL_NAME_CACHE.popitem(last=False)
+            for found in results.values():
+                names.update(found or [])
+        
+        # 过长或过短的结果多为误识别
+        names = {name for name in names if 2 <= len(name) <= 100}
+        if job is not None:
+            job.proper_nouns.update(names)
+            job.compiled_nouns = None
+        return sorted(names)
     
     def _restore_proper_nouns(self, text: str, noun_mapping: Dict[str, str]) -> str:
-        """恢复专有名词 - 改进版，避免重复恢复"""
+        """恢复专有名词，长占位符优先，避免短占位符误匹配"""
         restored_text = text
         
         # 按占位符长度排序，优先恢复长占位符
@@ -395,60 +872,201 @@ class SemanticTranslator:
         for placeholder in sorted_placeholders:
             if placeholder in restored_text:
                 noun = noun_mapping[placeholder]
-                # 确保只替换一次，避免重复
-                restored_text = restored_text.replace(placeholder, noun, 1)
+                # 模型重复了占位符时每一处都恢复，不在译文中留下占位符
+                restored_text = restored_text.replace(placeholder, noun)
         
         return restored_text
     
-    def translate_with_context(self, content_items: List[Dict], target_lang: str) -> List[Dict]:
-        """带上下文的翻译 - 修复重复内容问题"""
+    def translate_with_context(self, content_items: List[Dict], target_lang: str,
+                               layout_layer: List[Dict] = None,
+                               on_result: Callable[[Dict], None] = None,
+                               preview_pages: int = 1, max_workers: int = None,
+                               cancel_token: CancellationToken = None,
+                               job: TranslationJob = None) -> List[Dict]:
+        """带上下文的翻译 - 修复重复内容问题
+        
+        标题和前preview_pages页的片段优先调度，由线程池并发翻译；每个片段完成后
+        在调用线程上回调on_result（可安全更新界面），返回结果仍保持文档顺序。
+        cancel_token被取消后不再发出请求，排队中的片段被丢弃，也不再等待进行中的请求；
+        返回结果中只有已完成的片段带有translated_text。
+        
+        本次调用的状态和报告（未通过校验的片段、术语使用、记忆库命中、免请求统计）
+        记录在job中，调用方传入TranslationJob后用job.report()读取；未传入时新建一个。
+        """
+        if job is None:
+            job = TranslationJob(cancel_token)
+        elif cancel_token is not None:
+            job.cancel_token = cancel_token
+        cancel_token = job.cancel_token
         try:
-            openai.api_key = self.api_key
+            # 每个文档单独统计术语使用并识别特殊名称
+            job.terminology = self.terminology
+            if self.use_ai_name_detection:
+                self.detect_special_names(content_items, job=job)
             
             # 构建上下文记忆
             context_prompt = self._build_context_prompt(content_items, target_lang)
             
-            # 批量翻译，避免重复
-            translated_items = []
-            processed_texts = {}  # 用于避免重复翻译相同内容
+            # 按去重键分组，相同内容只翻译一次
+            groups = {}  # text_key -> 内容项下标列表
+            for index, item in enumerate(content_items):
+                text_key = self._dedup_key(item)
+                if text_key is not None:
+                    groups.setdefault(text_key, []).append(index)
+            
+            # 路由和优先级都依赖布局层
+            job.layout_by_id = {layout['id']: layout for layout in (layout_layer or []) if 'id' in layout}
+            
+            # 按优先级排序：标题 > 前几页 > 其余，同级保持文档顺序
+            priorities = self._segment_priorities(content_items, preview_pages, job.layout_by_id)
+            scheduled_keys = sorted(groups, key=lambda key: min(priorities[i] for i in groups[key]))
+            
+            translated_items = list(content_items)
+            
+            # 本地预分类：无需翻译的片段原样保留，不发出请求
+            if self.skip_untranslatable:
+                from segment_classifier import classify_segment
+                remaining_keys = []
+                for text_key in scheduled_keys:
+                    reason = classify_segment(content_items[groups[text_key][0]]['text'], target_lang)
+                    if reason is None:
+                        remaining_keys.append(text_key)
+                        continue
+                    job.passthrough_counts[reason] = job.passthrough_counts.get(reason, 0) + 1
+                    for index in groups[text_key]:
+                        translated_items[index] = {
+                            **content_items[index],
+                            'translated_text': content_items[index]['text'],
+                            'translation_source': 'passthrough',
+                            'passthrough_reason': reason
+                        }
+                        if on_result:
+                            on_result(translated_items[index])
+                scheduled_keys = remaining_keys
+                if job.passthrough_counts:
+                    logger.info(f"{sum(job.passthrough_counts.values())} API calls avoided by local "
+                                f"pre-classification: {job.passthrough_counts}")
+            
+            # 翻译记忆库命中的片段直接使用已有译文
+            if self.translation_memory is not None:
+                remaining_keys = []
+                for text_key in scheduled_keys:
+                    first = content_items[groups[text_key][0]]
+                    stored = self.translation_memory.lookup(first['text'], target_lang)
+                    if stored is None:
+                        remaining_keys.append(text_key)
+                        continue
+                    job.memory_hits += 1
+                    for index in groups[text_key]:
+                        translated_items[index] = {
+                            **content_items[index],
+                            'translated_text': stored,
+                            'translation_source': 'memory'
+                        }
+                        if on_result:
+                            on_result(translated_items[index])
+                scheduled_keys = remaining_keys
             
-            for item in content_items:
-                if item['type'] == 'paragraph':
-                    # 检查是否已经翻译过相同内容
-                    text_key = item['text'].strip()
-                    if text_key in processed_texts:
-                        translated_text = processed_texts[text_key]
-                    else:
-                        translated_text = self._translate_paragraph(item, context_prompt, target_lang)
-                        processed_texts[text_key] = translated_text
-                    
-                    translated_items.append({
-                        **item,
-                        'translated_text': translated_text
-                    })
+            retries_left = self.retry_budget
+            attempts = {}
+            problems_by_key = {}
+            
+            # 取消令牌对应的Future与片段一起等待，取消时立即停止等待
+            stop_waiters = {cancel_token.as_future()} if cancel_token else set()
+            
+            # 线程池按提交顺序取任务，提交顺序即优先级顺序
+            executor = ThreadPoolExecutor(max_workers=max_workers or self.max_workers)
+            try:
+                round_keys = scheduled_keys
+                while round_keys and not job.cancelled:
+                    futures = {}
+                    for text_key in round_keys:
+                        item = content_items[groups[text_key][0]]
+                        future = executor.submit(self._translate_segment, item, context_prompt,
+                                                 target_lang, problems_by_key.get(text_key), job)
+                        futures[future] = text_key
                     
-                elif item['type'] == 'table_cell':
-                    # 表格单元格特殊处理，避免重复翻译
-                    text_key = f"table_{item.get('table_index', 0)}_{item.get('row', 0)}_{item.get('col', 0)}_{item['text'].strip()}"
-                    if text_key in processed_texts:
-                        translated_text = processed_texts[text_key]
-                    else:
-                        translated_text = self._translate_table_cell(item, context_prompt, target_lang)
-                        processed_texts[text_key] = translated_text
+                    retry_keys = []
+                    pending = set(futures)
+                    while pending and not job.cancelled:
+                        done, not_done = wait(pending | stop_waiters, return_when=FIRST_COMPLETED)
+                        pending = not_done - stop_waiters
+                        for future in done - stop_waiters:
+                            text_key = futures[future]
+                            translated_text, problems, warnings = future.result()
+                            
+                            if problems:
+                                # 只重新排队校验失败的片段，受单片段次数和全文预算限制
+                                if attempts.get(text_key, 0) < self.max_segment_retries and retries_left > 0:
+                                    attempts[text_key] = attempts.get(text_key, 0) + 1
+                                    retries_left -= 1
+                                    problems_by_key[text_key] = problems
+                                    retry_keys.append(text_key)
+                                    continue
+                                # 仍未通过校验：保留模型的译文并报告；请求失败或译文为空时才使用原文
+                                if not translated_text.strip():
+                                    translated_text = content_items[groups[text_key][0]]['text']
+                            
+                            for index in groups[text_key]:
+                                translated_items[index] = {
+                                    **content_items[index],
+                                    'translated_text': translated_text
+                                }
+                                if warnings:
+                                    translated_items[index]['translation_warnings'] = warnings
+                                if problems:
+                                    translated_items[index]['translation_problems'] = problems
+                                    job.unresolved_segments.append({
+                                        'id': content_items[index].get('id'),
+                                        'text': content_items[index]['text'],
+                                        'problems': problems
+                                    })
+                                if on_result:
+                                    on_result(translated_items[index])
                     
-                    translated_items.append({
-                        **item,
-                        'translated_text': translated_text
-                    })
-                else:
-                    translated_items.append(item)
+                    round_keys = sorted(retry_keys, key=lambda key: min(priorities[i] for i in groups[key]))
+            finally:
+                # 丢弃排队中的片段；取消或出错时不等待进行中的请求，其结果被忽略
+                executor.shutdown(wait=False, cancel_futures=True)
             
             return translated_items
             
         except Exception as e:
-            st.error(f"语义翻译失败: {str(e)}")
+            _report(self.reporter, 'error', f"语义翻译失败: {str(e)}")
             return content_items
     
+    def _dedup_key(self, item: Dict):
+        """去重键：段落按文本去重，表格单元格按位置和文本去重；不需翻译的项返回None"""
+        if item['type'] == 'paragraph':
+            return ('paragraph', item['text'].strip())
+        if item['type'] == 'table_cell':
+            return ('table_cell', item.get('table_index', 0), item.get('row', 0),
+                    item.get('col', 0), item['text'].strip())
+        return None
+    
+    def _segment_priorities(self, content_items: List[Dict], preview_pages: int,
+                            layout_by_id: Dict[str, Dict]) -> List[Tuple[int, int]]:
+        """计算每个内容项的调度优先级 (级别, 文档位置)，越小越先翻译"""
+        priorities = []
+        for index, item in enumerate(content_items):
+            layout = layout_by_id.get(item.get('id'), {})
+            if layout.get('is_heading'):
+                tier = 0
+            elif layout.get('page_number', preview_pages + 1) <= preview_pages:
+                tier = 1
+            else:
+                tier = 2
+            priorities.append((tier, index))
+        return priorities
+    
+    def _translate_segment(self, item: Dict, context: str, target_lang: str,
+                           strict_problems: List[str] = None,
+                           job: TranslationJob = None) -> Tuple[str, List[str], List[str]]:
+        """在工作线程中翻译单个片段，按长度、类型和标题级别选择路由"""
+        layout = job.layout_by_id.get(item.get('id')) if job else None
+        route = self.router.select(item, layout)
+        return self._translate_text(item, context, target_lang, route, strict_problems, job)
+    
     def _build_context_prompt(self, content_items: List[Dict], target_lang: str) -> str:
         """构建上下文提示"""
         # 收集文档上下文
@@ -459,10 +1077,7 @@ class SemanticTranslator:
         
         context = " ".join(context_texts)
         
-        # 构建术语提示
-        term_prompt = ""
-        if self.terminology:
-            term_prompt = f"\n术语锁定：{json.dumps(self.terminology, ensure_ascii=False)}"
+        # 术语只按片段发送命中的条目，见_translate_text
         
         # 构建风格提示
         style_prompt = ""
@@ -471,19 +1086,23 @@ class SemanticTranslator:
         
         return f"""
         上下文文档：{context}
-        {term_prompt}
         {style_prompt}
         
         请将以下文本翻译为{target_lang}，保持专业术语一致性和文档风格。
         """
     
-    def _translate_paragraph(self, item: Dict, context: str, target_lang: str) -> str:
-        """翻译段落 - 简化版，移除AI智能识别"""
+    def _translate_text(self, item: Dict, context: str, target_lang: str, route: Route = None,
+                        strict_problems: List[str] = None,
+                        job: TranslationJob = None) -> Tuple[str, List[str], List[str]]:
+        """翻译单个片段并校验结果，返回 (译文, 问题列表, 提示列表)，见_validate_translation
+        
+        strict_problems为上一次尝试发现的问题，非空时使用更严格的提示重试。
+        给出job时使用该任务的术语表、专有名词和取消令牌，术语使用计入该任务。
+        """
+        original_text = item['text']
         try:
-            original_text = item['text']
-            
             # 只使用传统专有名词保护
-            protected_text, noun_mapping = self._protect_proper_nouns(original_text)
+            protected_text, noun_mapping = self._protect_proper_nouns(original_text, job)
             
             # 构建翻译提示
             proper_noun_instruction = ""
@@ -491,59 +1110,105 @@ class SemanticTranslator:
                 protected_names = list(noun_mapping.values())
                 proper_noun_instruction = f"\n重要：请保持以下专有名词不变：{', '.join(protected_names)}"
             
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": f"You are a professional document translator. {context}{proper_noun_instruction}"},
-                    {"role": "user", "content": f"Translate this paragraph to {target_lang}: {protected_text}"}
-                ],
-                max_tokens=1000,
-                temperature=0.1
+            # 只携带本片段中出现的术语
+            term_instruction = ""
+            terminology = job.terminology if job and job.terminology is not None else self.terminology
+            matched_terms = terminology.find(
+                original_text, count_usage=job is not None and not strict_problems,
+                usage=job.term_usage if job else None
+            ) if terminology else {}
+            if matched_terms:
+                term_instruction = f"\n术语锁定：{json.dumps(matched_terms, ensure_ascii=False)}"
+            
+            strict_instruction = ""
+            if strict_problems:
+                strict_instruction = (
+                    "\nSTRICT MODE: the previous translation was rejected "
+                    f"({'; '.join(strict_problems)}). Copy every token like __PROPER_NOUN_0__ "
+                    "exactly once and unchanged, keep all URLs exactly as written, "
+                    "and output only the translation."
+                )
+            
+            if item['type'] == 'table_cell':
+                kind, max_tokens = "table cell content", 500
+            else:
+                kind, max_tokens = "paragraph", 1000
+            
+            route = route or self.router.default_route
+            messages = [
+                {"role": "system", "content": f"You are a professional document translator. {context}{term_instruction}{proper_noun_instruction}{strict_instruction}"},
+                {"role": "user", "content": f"Translate this {kind} to {target_lang}: {protected_text}"}
+            ]
+            
+            # 进程内相同请求合并：共享的是含占位符的原始回复，各自用自己的映射恢复专有名词。
+            # 键包含后端身份（端点+密钥指纹，含备用后端）和完整的系统提示（上下文、风格、术语）
+            secondary = (_client_identity(self.secondary_client), self.secondary_model) \
+                if self.secondary_client is not None else None
+            flight_key = (
+                _client_identity(route.client or self.client), secondary, route.model, PROMPT_VERSION,
+                hashlib.sha256(messages[0]['content'].encode('utf-8')).hexdigest(),
+                kind, target_lang, ' '.join(protected_text.split())
             )
-            
-            translated_text = response.choices[0].message.content
-            
-            # 恢复专有名词
-            final_text = self._restore_proper_nouns(translated_text, noun_mapping)
-            
-            return final_text
-        except Exception as e:
-            st.warning(f"段落翻译失败: {str(e)}")
-            return item['text']
-    
-    def _translate_table_cell(self, item: Dict, context: str, target_lang: str) -> str:
-        """翻译表格单元格 - 简化版，移除AI智能识别"""
-        try:
-            original_text = item['text']
-            
-            # 只使用传统专有名词保护
-            protected_text, noun_mapping = self._protect_proper_nouns(original_text)
-            
-            # 构建翻译提示
-            proper_noun_instruction = ""
-            if noun_mapping:
-                protected_names = list(noun_mapping.values())
-                proper_noun_instruction = f"\n重要：请保持以下专有名词不变：{', '.join(protected_names)}"
-            
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": f"You are a professional document translator. {context}{proper_noun_instruction}"},
-                    {"role": "user", "content": f"Translate this table cell content to {target_lang}: {protected_text}"}
-                ],
-                max_tokens=500,
-                temperature=0.1
+            translated_text = translation_flight.do(
+                flight_key,
+                lambda: self._chat(messages=messages, max_tokens=max_tokens, route=route,
+                                   cancel_token=job.cancel_token if job else None),
+                is_private_error=_is_private_error
             )
             
-            translated_text = response.choices[0].message.content
+            problems, warnings = self._validate_translation(protected_text, translated_text, noun_mapping)
             
             # 恢复专有名词
             final_text = self._restore_proper_nouns(translated_text, noun_mapping)
             
-            return final_text
+            return final_text, problems, warnings
         except Exception as e:
-            st.warning(f"表格单元格翻译失败: {str(e)}")
-            return item['text']
+            logger.warning(f"片段翻译失败 ({item.get('id', '')}): {str(e)}")
+            return original_text, [f"request_failed: {str(e)}"], []
+    
+    def _validate_translation(self, protected_text: str, translated_text: str,
+                              noun_mapping: Dict[str, str]) -> Tuple[List[str], List[str]]:
+        """校验译文，返回 (问题, 提示)
+        
+        问题（译文为空、占位符缺失/重复/未知）会触发重试；数字、URL未保留或译文与原文相同
+        只作为提示，不重试也不影响任务状态——换算写法（“1.5 million”→“150万”）、
+        保持不译的品牌名都是正确的译文。
+        """
+        output = translated_text.strip()
+        if not output:
+            return ['empty_output'], []
+        
+        problems = []
+        warnings = []
+        for placeholder in noun_mapping:
+            count = translated_text.count(placeholder)
+            if count == 0:
+                problems.append(f"placeholder_missing: {placeholder}")
+            elif count > 1:
+                problems.append(f"placeholder_duplicated: {placeholder}")
+        for token in set(PLACEHOLDER_PATTERN.findall(translated_text)) - set(noun_mapping):
+            problems.append(f"placeholder_unknown: {token}")
+        
+        source_body = PLACEHOLDER_PATTERN.sub(' ', protected_text)
+        output_body = PLACEHOLDER_PATTERN.sub(' ', translated_text)
+        
+        for url in set(URL_PATTERN.findall(source_body)):
+            url = url.rstrip('.,;:!?)')
+            if url not in output_body:
+                warnings.append(f"url_missing: {url}")
+        
+        # 数字按数值比较：忽略千分位写法，换算数量级（million/万/亿）和中文数字
+        source_body = URL_PATTERN.sub(' ', source_body)
+        output_body = URL_PATTERN.sub(' ', output_body)
+        output_values = _number_values(output_body)
+        for match in _SCALED_NUMBER_PATTERN.finditer(source_body):
+            if not _scaled_number_values(match) & output_values:
+                warnings.append(f"number_missing: {match.group().strip()}")
+        
+        if output == protected_text.strip() and len(re.findall(r'[^\W\d_]', source_body)) >= 3:
+            warnings.append('echoed_source')
+        
+        return problems, list(dict.fromkeys(warnings))
 
 class SmartReconstructor:
     """格式智能重建器 - 利用锚点映射重组文档"""
@@ -551,38 +1216,51 @@ class SmartReconstructor:
     def __init__(self):
         self.anchors = {}
         self.format_preservation = True
+        self.reporter = None
+        self.segment_index = {}   # 片段id -> 重建后文档中的段落或单元格，供增量修改译文
     
-    def reconstruct_document(self, original_doc_path: str, translated_content: List[Dict], 
+    def reconstruct_document(self, original_doc: DocumentSource, translated_content: List[Dict], 
                            format_layer: List[Dict], layout_layer: List[Dict], 
-                           output_path: str) -> bool:
-        """重建文档"""
+                           output: Union[str, BinaryIO]) -> bool:
+        """重建文档，output可以是路径或可写文件对象"""
         try:
-            # 加载原文档
-            doc = Document(original_doc_path)
+            source_bytes = None if _is_document(original_doc) else _read_source(original_doc)
+            doc = self.build_document(original_doc if source_bytes is None else source_bytes,
+                                      translated_content, format_layer, layout_layer)
             
-            # 创建翻译映射
-            translation_map = {item['id']: item['translated_text'] for item in translated_content 
-                              if 'translated_text' in item}
-            
-            # 重建段落
-            self._reconstruct_paragraphs(doc, translation_map, format_layer)
-            
-            # 重建表格
-            self._reconstruct_tables(doc, translation_map, format_layer)
-            
-            # 保存文档
-            doc.save(output_path)
+            # 保存文档，未修改的条目直接从源文档复制
+            _save_document(doc, output, source_bytes)
             return True
             
         except Exception as e:
-            st.error(f"文档重建失败: {str(e)}")
+            _report(self.reporter, 'error', f"文档重建失败: {str(e)}")
             return False
     
-    def _reconstruct_paragraphs(self, doc: Document, translation_map: Dict, format_layer: List[Dict]):
+    def build_document(self, original_doc: DocumentSource, translated_content: List[Dict],
+                       format_layer: List[Dict], layout_layer: List[Dict]):
+        """在内存中重建文档并返回文档对象，不保存"""
+        # 加载原文档
+        doc = _load_document(original_doc)
+        self.segment_index = {}
+        
+        # 创建翻译映射
+        translation_map = {item['id']: item['translated_text'] for item in translated_content 
+                          if 'translated_text' in item}
+        
+        # 重建段落
+        self._reconstruct_paragraphs(doc, translation_map, format_layer)
+        
+        # 重建表格
+        self._reconstruct_tables(doc, translation_map, format_layer)
+        
+        return doc
+    
+    def _reconstruct_paragraphs(self, doc: 'Document', translation_map: Dict, format_layer: List[Dict]):
         """重建段落，保持格式"""
         for i, paragraph in enumerate(doc.paragraphs):
             if paragraph.text.strip():
                 para_id = f'para_{i}'
+                self.segment_index[para_id] = paragraph
                 if para_id in translation_map:
                     # 获取原格式信息
                     format_info = None
@@ -602,7 +1280,7 @@ class SmartReconstructor:
                         # 长度变化大，需要智能调整
                         self._smart_text_replacement(paragraph, translated_text, format_info)
     
-    def _reconstruct_tables(self, doc: Document, translation_map: Dict, format_layer: List[Dict]):
+    def _reconstruct_tables(self, doc: 'Document', translation_map: Dict, format_layer: List[Dict]):
         """重建表格 - 修复重复问题"""
         table_index = 0
         for table in doc.tables:
@@ -610,6 +1288,7 @@ class SmartReconstructor:
                 for col_idx, cell in enumerate(row.cells):
                     # 创建单元格ID
                     cell_id = f'table_{table_index}_row_{row_idx}_col_{col_idx}'
+                    self.segment_index[cell_id] = cell
                     
                     # 查找对应的翻译
                     if cell_id in translation_map:
@@ -626,22 +1305,45 @@ class SmartReconstructor:
                                     self._smart_cell_replacement(cell, translated_text)
             table_index += 1
     
+    def index_document(self, doc: 'Document') -> Dict[str, Any]:
+        """按解析时的编号为已重建的文档（如分片合并的结果）建立片段id索引"""
+        self.segment_index = {}
+        for i, paragraph in enumerate(doc.paragraphs):
+            if paragraph.text.strip():
+                self.segment_index[f'para_{i}'] = paragraph
+        for table_index, table in enumerate(doc.tables):
+            for row_idx, row in enumerate(table.rows):
+                for col_idx, cell in enumerate(row.cells):
+                    self.segment_index[f'table_{table_index}_row_{row_idx}_col_{col_idx}'] = cell
+        return self.segment_index
+    
+    def patch_segment(self, segment_id: str, element, translated_text: str):
+        """只替换一个片段的译文，沿用该片段现有run的格式模板"""
+        if segment_id.startswith('table_'):
+            self._smart_cell_replacement(element, translated_text)
+        else:
+            self._replace_text_preserve_format(element, translated_text, None)
+    
+    def _run_template(self, run):
+        """原run的格式(w:rPr)，用作新run的格式模板；run没有格式时返回None
+        
+        直接返回原元素不复制：清空段落后被移除的run仍持有它，由_add_run为每个新run复制一次。
+        """
+        return run._r.rPr
+    
+    def _add_run(self, paragraph, text: str, template):
+        """添加run并复制格式模板，保留高亮、大小写、语言、东亚字体等全部属性"""
+        new_run = paragraph.add_run(text)
+        if template is not None:
+            new_run._r.insert(0, copy.deepcopy(template))
+        return new_run
+    
     def _smart_cell_replacement(self, cell, translated_text: str):
         """智能单元格文本替换，保持格式"""
         try:
             # 保存原格式信息
-            original_runs = []
-            for paragraph in cell.paragraphs:
-                for run in paragraph.runs:
-                    original_runs.append({
-                        'text': run.text,
-                        'bold': run.bold,
-                        'italic': run.italic,
-                        'underline': run.underline,
-                        'font_name': run.font.name,
-                        'font_size': run.font.size,
-                        'font_color': run.font.color.rgb if run.font.color.rgb else None
-                    })
+            original_runs = [(run.text, self._run_template(run))
+                             for paragraph in cell.paragraphs for run in paragraph.runs]
             
             # 清空单元格内容
             cell.text = ""
@@ -649,16 +1351,7 @@ class SmartReconstructor:
             # 添加翻译文本，保持格式
             if original_runs:
                 # 使用第一个run的格式作为默认格式
-                default_format = original_runs[0]
-                paragraph = cell.paragraphs[0]
-                new_run = paragraph.add_run(translated_text)
-                new_run.bold = default_format['bold']
-                new_run.italic = default_format['italic']
-                new_run.underline = default_format['underline']
-                new_run.font.name = default_format['font_name']
-                new_run.font.size = default_format['font_size']
-                if default_format['font_color']:
-                    new_run.font.color.rgb = default_format['font_color']
+                self._add_run(cell.paragraphs[0], translated_text, original_runs[0][1])
             else:
                 # 如果没有原格式信息，直接添加文本
                 cell.text = translated_text
@@ -671,17 +1364,7 @@ class SmartReconstructor:
         """替换文本并保持格式"""
         try:
             # 保存原格式信息
-            original_runs = []
-            for run in paragraph.runs:
-                original_runs.append({
-                    'text': run.text,
-                    'bold': run.bold,
-                    'italic': run.italic,
-                    'underline': run.underline,
-                    'font_name': run.font.name,
-                    'font_size': run.font.size,
-                    'font_color': run.font.color.rgb if run.font.color.rgb else None
-                })
+            original_runs = [(run.text, self._run_template(run)) for run in paragraph.runs]
             
             # 清空段落内容
             paragraph.text = ""
@@ -689,45 +1372,31 @@ class SmartReconstructor:
             # 添加翻译文本，保持格式
             if original_runs:
                 # 如果有多个run，按比例分配翻译文本
-                total_original_length = sum(len(run['text']) for run in original_runs)
+                total_original_length = sum(len(run_text) for run_text, _ in original_runs)
                 if total_original_length > 0:
                     current_pos = 0
-                    for i, run_info in enumerate(original_runs):
+                    # 按比例取整会丢掉末尾几个字符，剩余文本都归最后一个有文本的run
+                    last_index = max(index for index, (run_text, _) in enumerate(original_runs) if run_text)
+                    for index, (run_text, template) in enumerate(original_runs):
                         # 计算这个run应该包含多少翻译文本
-                        run_ratio = len(run_info['text']) / total_original_length
+                        run_ratio = len(run_text) / total_original_length
                         run_text_length = int(len(translated_text) * run_ratio)
                         
                         # 获取这个run的翻译文本
                         start_pos = current_pos
                         end_pos = min(current_pos + run_text_length, len(translated_text))
-                        run_text = translated_text[start_pos:end_pos]
+                        if index == last_index:
+                            end_pos = len(translated_text)
+                        new_text = translated_text[start_pos:end_pos]
                         
-                        if run_text:
-                            # 创建新的run并应用格式
-                            new_run = paragraph.add_run(run_text)
-                            new_run.bold = run_info['bold']
-                            new_run.italic = run_info['italic']
-                            new_run.underline = run_info['underline']
-                            new_run.font.name = run_info['font_name']
-                            new_run.font.size = run_info['font_size']
-                            if run_info['font_color']:
-                                new_run.font.color.rgb = run_info['font_color']
+                        if new_text:
+                            # 创建新的run并复制原格式
+                            self._add_run(paragraph, new_text, template)
                         
                         current_pos = end_pos
                 else:
                     # 如果没有原文本，使用第一个run的格式
-                    if original_runs:
-                        run_info = original_runs[0]
-                        new_run = paragraph.add_run(translated_text)
-                        new_run.bold = run_info['bold']
-                        new_run.italic = run_info['italic']
-                        new_run.underline = run_info['underline']
-                        new_run.font.name = run_info['font_name']
-                        new_run.font.size = run_info['font_size']
-                        if run_info['font_color']:
-                            new_run.font.color.rgb = run_info['font_color']
-                    else:
-                        paragraph.text = translated_text
+                    self._add_run(paragraph, translated_text, original_runs[0][1])
             else:
                 # 如果没有原格式信息，直接添加文本
                 paragraph.text = translated_text
@@ -740,17 +1409,7 @@ class SmartReconstructor:
         """智能文本替换，保持格式"""
         try:
             # 保存原格式信息
-            original_runs = []
-            for run in paragraph.runs:
-                original_runs.append({
-                    'text': run.text,
-                    'bold': run.bold,
-                    'italic': run.italic,
-                    'underline': run.underline,
-                    'font_name': run.font.name,
-                    'font_size': run.font.size,
-                    'font_color': run.font.color.rgb if run.font.color.rgb else None
-                })
+            original_runs = [(run.text, self._run_template(run)) for run in paragraph.runs]
             
             # 清空段落内容
             paragraph.text = ""
@@ -758,15 +1417,7 @@ class SmartReconstructor:
             # 添加翻译文本，保持格式
             if original_runs:
                 # 使用第一个run的格式作为默认格式
-                default_format = original_runs[0]
-                new_run = paragraph.add_run(translated_text)
-                new_run.bold = default_format['bold']
-                new_run.italic = default_format['italic']
-                new_run.underline = default_format['underline']
-                new_run.font.name = default_format['font_name']
-                new_run.font.size = default_format['font_size']
-                if default_format['font_color']:
-                    new_run.font.color.rgb = default_format['font_color']
+                self._add_run(paragraph, translated_text, original_runs[0][1])
             else:
                 # 如果没有原格式信息，直接添加文本
                 paragraph.text = translated_text
@@ -780,12 +1431,13 @@ class FormatCorrector:
     
     def __init__(self):
         self.correction_rules = []
+        self.reporter = None
     
-    def detect_format_issues(self, doc_path: str) -> List[Dict]:
-        """检测格式问题"""
+    def detect_format_issues(self, doc_source) -> List[Dict]:
+        """检测格式问题，doc_source可以是路径、字节、文件对象或已加载的文档"""
         issues = []
         try:
-            doc = Document(doc_path)
+            doc = _load_document(doc_source)
             
             # 检测表格溢出
             for table in doc.tables:
@@ -813,13 +1465,18 @@ class FormatCorrector:
             return issues
             
         except Exception as e:
-            st.error(f"格式检测失败: {str(e)}")
+            _report(self.reporter, 'error', f"格式检测失败: {str(e)}")
             return []
     
-    def auto_fix_issues(self, doc_path: str, issues: List[Dict]) -> bool:
-        """自动修复格式问题"""
+    def auto_fix_issues(self, target, issues: List[Dict]) -> bool:
+        """自动修复格式问题
+        
+        target为已加载的文档时原地修复、不保存；为路径或文件对象时修复后写回。
+        """
         try:
-            doc = Document(doc_path)
+            in_memory = _is_document(target)
+            source_bytes = None if in_memory else _read_source(target)
+            doc = target if in_memory else _load_document(source_bytes)
             
             for issue in issues:
                 if issue['type'] == 'table_overflow':
@@ -829,14 +1486,18 @@ class FormatCorrector:
                     # 删除空标题
                     self._fix_empty_headings(doc)
             
-            doc.save(doc_path)
+            if not in_memory:
+                if hasattr(target, 'truncate'):
+                    target.seek(0)
+                    target.truncate()
+                _save_document(doc, target, source_bytes)
             return True
             
         except Exception as e:
-            st.error(f"自动修复失败: {str(e)}")
+            _report(self.reporter, 'error', f"自动修复失败: {str(e)}")
             return False
     
-    def _fix_table_overflow(self, doc: Document):
+    def _fix_table_overflow(self, doc: 'Document'):
         """修复表格溢出"""
         for table in doc.tables:
             for row in table.rows:
@@ -850,7 +1511,7 @@ class FormatCorrector:
                             if split_point > 0:
                                 cell.text = text[:split_point] + '\n' + text[split_point+1:]
     
-    def _fix_empty_headings(self, doc: Document):
+    def _fix_empty_headings(self, doc: 'Document'):
         """修复空标题"""
         paragraphs_to_remove = []
         for paragraph in doc.paragraphs:
@@ -861,359 +1522,339 @@ class FormatCorrector:
             p = paragraph._element
             p.getparent().remove(p)
 
-class DualViewEditor:
-    """双视图编辑器 - 左右对比显示"""
-    
-    def __init__(self):
-        self.original_content = []
-        self.translated_content = []
-    
-    def display_dual_view(self, original_items: List[Dict], translated_items: List[Dict]):
-        """显示双视图 - 修复重复内容问题"""
-        st.subheader("📖 双视图编辑器")
-        
-        # 添加视图模式选择
-        view_mode = st.radio(
-            "选择查看模式",
-            ["整体对比", "页面对比"],
-            horizontal=True
-        )
-        
-        if view_mode == "页面对比":
-            self.display_page_comparison(original_items, translated_items)
-        else:
-            # 去重处理
-            original_unique = self._deduplicate_items(original_items)
-            translated_unique = self._deduplicate_items(translated_items)
-            
-            # 创建两列布局
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.markdown("### 📄 原文")
-                self._display_content(original_unique, "original")
-            
-            with col2:
-                st.markdown("### 🌐 译文")
-                self._display_content(translated_unique, "translated")
-    
-    def display_page_comparison(self, original_items, translated_items):
-        """显示页面对比视图"""
-        st.subheader("📖 页面内容对比")
-        
-        # 按页面组织内容
-        original_pages = self._organize_by_pages(original_items)
-        translated_pages = self._organize_by_pages(translated_items)
-        
-        # 获取所有页面
-        all_pages = set(original_pages.keys()) | set(translated_pages.keys())
-        
-        if not all_pages:
-            st.info("📄 未检测到分页信息，显示整体内容对比")
-            self._display_content_comparison(original_items, translated_items)
-            return
-        
-        # 页面选择器
-        selected_page = st.selectbox(
-            "选择页面查看",
-            options=sorted(all_pages),
-            format_func=lambda x: f"第 {x} 页" if x > 0 else "封面/前言"
-        )
-        
-        # 显示选中页面的内容
-        if selected_page in original_pages and selected_page in translated_pages:
-            self._display_page_content(selected_page, original_pages[selected_page], translated_pages[selected_page])
-        elif selected_page in original_pages:
-            st.warning(f"第 {selected_page} 页只有原文，没有译文")
-            self._display_original_page(selected_page, original_pages[selected_page])
-        elif selected_page in translated_pages:
-            st.warning(f"第 {selected_page} 页只有译文，没有原文")
-            self._display_translated_page(selected_page, translated_pages[selected_page])
-    
-    def _organize_by_pages(self, items):
-        """按页面组织内容项"""
-        pages = {}
-        
-        for item in items:
-            # 尝试从布局信息中获取页面信息
-            page_num = item.get('layout', {}).get('page_number', 0)
-            
-            if page_num not in pages:
-                pages[page_num] = []
-            
-            pages[page_num].append(item)
-        
-        return pages
+# 主应用类
+class ProcessResult:
+    """process_document的结果：status为'success'、'partial'、'failed'或'cancelled'
     
-    def _display_page_content(self, page_num, original_items, translated_items):
-        """显示页面内容对比"""
-        st.markdown(f"### 📄 第 {page_num} 页内容对比")
-        
-        # 创建两列布局
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            st.markdown("**📝 原文**")
-            self._display_page_items(original_items, "original")
-        
-        with col2:
-            st.markdown("**🌐 译文**")
-            self._display_page_items(translated_items, "translated")
-        
-        # 显示页面统计
-        self._display_page_stats(page_num, original_items, translated_items)
-    
-    def _display_page_items(self, items, view_type):
-        """显示页面内容项"""
-        if not items:
-            st.info("该页面没有内容")
-            return
-        
-        # 按类型分组显示
-        paragraphs = [item for item in items if item.get('type') == 'paragraph']
-        table_cells = [item for item in items if item.get('type') == 'table_cell']
-        
-        # 显示段落
-        if paragraphs:
-            st.markdown("**段落内容:**")
-            for i, item in enumerate(paragraphs):
-                with st.expander(f"段落 {i+1}", expanded=False):
-                    if view_type == "original":
-                        st.text_area("原文", value=item.get('text', ''), height=100, key=f"orig_para_{i}")
-                    else:
-                        st.text_area("译文", value=item.get('translated_text', item.get('text', '')), height=100, key=f"trans_para_{i}")
-        
-        # 显示表格
-        if table_cells:
-            st.markdown("**表格内容:**")
-            self._display_table_content(table_cells, view_type)
-    
-    def _display_table_content(self, table_cells, view_type):
-        """显示表格内容"""
-        import pandas as pd
-        
-        # 按表格分组
-        tables = {}
-        for cell in table_cells:
-            table_idx = cell.get('table_index', 0)
-            if table_idx not in tables:
-                tables[table_idx] = []
-            tables[table_idx].append(cell)
-        
-        for table_idx, cells in tables.items():
-            st.markdown(f"**表格 {table_idx + 1}:**")
-            
-            # 构建表格数据
-            table_data = {}
-            for cell in cells:
-                row = cell.get('row', 0)
-                col = cell.get('col', 0)
-                
-                if row not in table_data:
-                    table_data[row] = {}
-                
-                if view_type == "original":
-                    table_data[row][col] = cell.get('text', '')
-                else:
-                    table_data[row][col] = cell.get('translated_text', cell.get('text', ''))
-            
-            # 转换为DataFrame显示
-            if table_data:
-                df = pd.DataFrame.from_dict(table_data, orient='index')
-                df = df.fillna('')  # 填充空值
-                st.dataframe(df, use_container_width=True)
-    
-    def _display_original_page(self, page_num, original_items):
-        """显示只有原文的页面"""
-        st.markdown(f"### 📄 第 {page_num} 页原文")
-        st.warning("该页面只有原文，没有对应的译文")
-        
-        self._display_page_items(original_items, "original")
+    partial表示文档已生成，但untranslated_ids中的片段（请求失败、后端熔断或未通过校验）
+    保留了原文；failed时没有输出文档；cancelled时只有要求保留部分结果才输出文档。
+    结果为真当且仅当生成了文档。
+    """
     
-    def _display_translated_page(self, page_num, translated_items):
-        """显示只有译文的页面"""
-        st.markdown(f"### 📄 第 {page_num} 页译文")
-        st.warning("该页面只有译文，没有对应的原文")
-        
-        self._display_page_items(translated_items, "translated")
+    def __init__(self, status: str, output: Union[str, BinaryIO] = None,
+                 untranslated_ids: List[str] = None, error: str = None):
+        self.status = status
+        self.output = output
+        self.untranslated_ids = untranslated_ids or []
+        self.error = error
     
-    def _display_page_stats(self, page_num, original_items, translated_items):
-        """显示页面统计信息"""
-        # 计算统计信息
-        orig_para_count = len([item for item in original_items if item.get('type') == 'paragraph'])
-        trans_para_count = len([item for item in translated_items if item.get('type') == 'paragraph'])
-        
-        orig_table_count = len(set(item.get('table_index', 0) for item in original_items if item.get('type') == 'table_cell'))
-        trans_table_count = len(set(item.get('table_index', 0) for item in translated_items if item.get('type') == 'table_cell'))
-        
-        # 计算字符数
-        orig_chars = sum(len(item.get('text', '')) for item in original_items)
-        trans_chars = sum(len(item.get('translated_text', item.get('text', ''))) for item in translated_items)
-        
-        # 显示统计
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            st.metric("段落数", f"{orig_para_count} → {trans_para_count}")
-        
-        with col2:
-            st.metric("表格数", f"{orig_table_count} → {trans_table_count}")
-        
-        with col3:
-            st.metric("字符数", f"{orig_chars} → {trans_chars}")
-        
-        with col4:
-            if orig_chars > 0:
-                ratio = trans_chars / orig_chars
-                st.metric("长度比例", f"{ratio:.2f}")
-    
-    def _display_content_comparison(self, original_items, translated_items):
-        """显示整体内容对比（无分页信息时）"""
-        st.markdown("### 📄 整体内容对比")
-        
-        # 创建两列布局
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            st.markdown("**📝 原文**")
-            self._display_content(original_items, "original")
-        
-        with col2:
-            st.markdown("**🌐 译文**")
-            self._display_content(translated_items, "translated")
-    
-    def _deduplicate_items(self, items: List[Dict]) -> List[Dict]:
-        """去重处理，避免重复显示"""
-        seen_texts = set()
-        unique_items = []
-        
-        for item in items:
-            text_key = item.get('text', '').strip()
-            if text_key and text_key not in seen_texts:
-                seen_texts.add(text_key)
-                unique_items.append(item)
-            elif not text_key:  # 保留空内容项
-                unique_items.append(item)
-        
-        return unique_items
+    def __bool__(self) -> bool:
+        return self.output is not None
     
-    def _display_content(self, items: List[Dict], view_type: str):
-        """显示内容 - 优化显示逻辑"""
-        # 按类型分组显示
-        paragraphs = [item for item in items if item['type'] == 'paragraph']
-        table_cells = [item for item in items if item['type'] == 'table_cell']
-        
-        # 显示段落
-        if paragraphs:
-            st.markdown("**📝 段落内容:**")
-            for i, item in enumerate(paragraphs):
-                if item['text'].strip():  # 只显示非空段落
-                    if view_type == "translated" and 'translated_text' in item:
-                        st.text_area(f"段落 {i+1}", value=item['translated_text'], height=80, key=f"para_{view_type}_{i}")
-                    else:
-                        st.text_area(f"段落 {i+1}", value=item['text'], height=80, key=f"para_{view_type}_{i}")
-        
-        # 显示表格单元格 - 修复重复问题
-        if table_cells:
-            st.markdown("**📊 表格内容:**")
-            # 按表格分组
-            tables = {}
-            for item in table_cells:
-                table_idx = item.get('table_index', 0)
-                if table_idx not in tables:
-                    tables[table_idx] = []
-                tables[table_idx].append(item)
-            
-            for table_idx, cells in tables.items():
-                st.markdown(f"**表格 {table_idx + 1}:**")
-                
-                # 去重处理：使用集合跟踪已显示的单元格
-                displayed_cells = set()
-                
-                # 按行列组织
-                rows = {}
-                for cell in cells:
-                    row = cell.get('row', 0)
-                    col = cell.get('col', 0)
-                    cell_text = cell['text'].strip()
-                    
-                    # 跳过空单元格和重复内容
-                    if not cell_text or cell_text in displayed_cells:
-                        continue
-                    
-                    displayed_cells.add(cell_text)
-                    
-                    if row not in rows:
-                        rows[row] = {}
-                    rows[row][col] = cell
-                
-                # 显示表格内容
-                for row_idx in sorted(rows.keys()):
-                    cols = rows[row_idx]
-                    if cols:  # 只显示有内容的行
-                        st.markdown(f"**第 {row_idx + 1} 行:**")
-                        for col_idx in sorted(cols.keys()):
-                            cell = cols[col_idx]
-                            if cell['text'].strip():  # 只显示非空单元格
-                                if view_type == "translated" and 'translated_text' in cell:
-                                    st.text_input(f"列{col_idx+1}", value=cell['translated_text'], key=f"cell_{view_type}_{table_idx}_{row_idx}_{col_idx}")
-                                else:
-                                    st.text_input(f"列{col_idx+1}", value=cell['text'], key=f"cell_{view_type}_{table_idx}_{row_idx}_{col_idx}")
+    def __repr__(self) -> str:
+        return f"ProcessResult(status={self.status!r}, untranslated={len(self.untranslated_ids)})"
+
+
+def _untranslated_ids(translated_content: List[Dict]) -> Tuple[List[str], int]:
+    """未翻译片段的id及需翻译的片段总数"""
+    segments = [item for item in translated_content if item['type'] in ('paragraph', 'table_cell')]
+    untranslated = [item.get('id') for item in segments
+                    if 'translated_text' not in item or item.get('translation_problems')]
+    return untranslated, len(segments)
+
 
-# 主应用类
 class SmartDocumentTranslator:
     """智能文档翻译与格式保真系统主类"""
     
-    def __init__(self):
+    def __init__(self, reporter: Reporter = None):
         self.parser = StructuralParser()
         self.translator = None
         self.reconstructor = SmartReconstructor()
         self.corrector = FormatCorrector()
-        self.editor = DualViewEditor()
+        self._editor = None
+        self.artifact_cache = None  # 文档级缓存（解析结果、完成的文档），见set_artifact_cache
+        self.last_result = None  # 最近一次任务的解析与翻译数据，供界面直接复用
+        self._edit_state = None  # 最近一次输出的文档对象、片段索引和源文档字节，见apply_edits
+        self.set_reporter(reporter)
+    
+    @property
+    def editor(self):
+        """双视图编辑器，首次使用时才导入Streamlit"""
+        if self._editor is None:
+            from dual_view_editor import DualViewEditor
+            self._editor = DualViewEditor()
+        return self._editor
+    
+    def set_reporter(self, reporter: Reporter):
+        """设置进度和错误消息的接收方（如界面），所有组件共用"""
+        self.reporter = reporter
+        for component in (self.parser, self.translator, self.reconstructor, self.corrector):
+            if component is not None:
+                component.reporter = reporter
+    
+    def set_translator(self, api_key: str, **client_options):
+        """Set translator, client_options are passed to the translator's ChatClient"""
+        self.translator = SemanticTranslator(api_key, **client_options)
+        self.translator.reporter = self.reporter
     
-    def set_translator(self, api_key: str):
-        """Set translator"""
-        self.translator = SemanticTranslator(api_key)
+    def set_artifact_cache(self, cache):
+        """设置文档级缓存（ArtifactCache）：相同文件直接返回解析结果，相同文件和选项直接返回译文"""
+        self.artifact_cache = cache
     
-    def process_document(self, doc_path: str, target_lang: str, output_path: str) -> bool:
-        """Complete document processing workflow"""
+    def parse_document(self, doc_source: DocumentSource) -> Dict[str, Any]:
+        """结构分层解析；设置了文档级缓存时，相同的文件只解析一次"""
+        if self.artifact_cache is None:
+            return self.parser.parse_document(doc_source)
+        
+        from artifact_cache import parse_key, source_hash
+        source_bytes = _read_source(doc_source)
+        key = parse_key(source_hash(source_bytes))
+        parsed_doc = self.artifact_cache.get(key)
+        if parsed_doc is None:
+            parsed_doc = self.parser.parse_document(source_bytes)
+            if parsed_doc:
+                self.artifact_cache.put(key, parsed_doc)
+        return parsed_doc
+    
+    def process_document(self, doc_source: DocumentSource, target_lang: str,
+                         output: Union[str, BinaryIO] = None, parsed_doc: Dict[str, Any] = None,
+                         on_segment: Callable[[Dict], None] = None, processes: int = None,
+                         profile: Union[bool, str] = None, cancel_token: CancellationToken = None,
+                         keep_partial: bool = False):
+        """Complete document processing workflow
+        
+        doc_source可以是路径、字节或二进制文件对象；output可以是路径或可写文件对象，
+        省略时使用内存缓冲区，仅在超过SPILL_TO_DISK_THRESHOLD时落盘。
+        parsed_doc为上传时预先解析的结果，传入则跳过解析；on_segment在每个片段
+        翻译完成时回调，用于提前预览。
+        processes大于1时按分节符和一级标题把正文切分为分片，在多个进程中并行翻译和重建
+        （见sharding.py）。
+        profile为True或目录时（或设置环境变量FREE_TRANSLATE_PROFILE）按阶段记录cProfile、
+        tracemalloc和调用栈采样结果（见profiling.py），未开启时没有额外开销。
+        返回ProcessResult：全部译出为success；部分片段保留原文时为partial，
+        untranslated_ids列出这些片段；没有任何片段译出或处理出错时为failed，不输出文档。
+        成功时result.output为output（文件对象已回到起始位置）。
+        cancel_token被取消后停止发出请求并返回cancelled；keep_partial为True时仍用已完成的
+        片段生成文档（其余片段保留原文，分片模式下不支持）。
+        设置了文档级缓存时，相同文件和翻译选项的完整译文直接从缓存返回，last_result一并恢复。
+        生成的文档对象保留在内存中，之后可用apply_edits只修改个别片段的译文。
+        """
+        self.last_result = None
+        self._edit_state = None
         try:
-            # 1. 结构分层解析
-            st.info("🔍 Performing structural layer extraction...")
-            parsed_doc = self.parser.parse_document(doc_path)
-            if not parsed_doc:
-                return False
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            
+            # 只读取一次源文档，解析和重建共用同一份字节
+            source_bytes = _read_source(doc_source)
+            
+            # 相同文件和选项已有完整译文时直接返回
+            cache_key = None
+            if self.artifact_cache is not None and self.translator:
+                from artifact_cache import output_key, source_hash
+                fingerprint = self.translator.options_fingerprint()
+                if fingerprint is not None:
+                    cache_key = output_key(source_hash(source_bytes), target_lang, fingerprint)
+                    cached = self._load_cached_output(cache_key, output)
+                    if cached is not None:
+                        # 缓存中只有保存后的文档，首次修改译文时才重建文档对象
+                        self._edit_state = {'doc': None, 'segments': None, 'source_bytes': source_bytes}
+                        return cached
+            
+            stage = self._profiler_stage(profile, source_bytes)
+            
+            # 1. 结构分层解析（分片模式下由各分片进程分别解析）
+            sharded = bool(processes and processes > 1)
+            if parsed_doc is None and not sharded:
+                _report(self.reporter, 'info', "🔍 Performing structural layer extraction...")
+                with stage('parse_document'):
+                    parsed_doc = self.parse_document(source_bytes)
+                if not parsed_doc:
+                    return ProcessResult('failed', error="Document could not be parsed")
             
             # 2. 语义增强翻译
-            st.info("🤖 Performing semantic-enhanced translation...")
+            _report(self.reporter, 'info', "🤖 Performing semantic-enhanced translation...")
             if not self.translator:
-                st.error("Please set translator first")
-                return False
-            
-            translated_content = self.translator.translate_with_context(
-                parsed_doc['content_layer'], target_lang
-            )
-            
-            # 3. 格式智能重建
-            st.info("🔧 Performing intelligent format reconstruction...")
-            success = self.reconstructor.reconstruct_document(
-                doc_path, translated_content, 
-                parsed_doc['format_layer'], parsed_doc['layout_layer'], 
-                output_path
-            )
-            
-            if success:
-                # 4. 格式纠错
-                st.info("🔍 Performing format correction...")
-                issues = self.corrector.detect_format_issues(output_path)
-                if issues:
-                    st.warning(f"Found {len(issues)} format issues, automatically repairing...")
-                    self.corrector.auto_fix_issues(output_path, issues)
+                _report(self.reporter, 'error', "Please set translator first")
+                return ProcessResult('failed', error="Translator is not set")
+            
+            if sharded:
+                # 分片模式：解析、翻译和重建在各分片进程中完成，合并后得到完整文档
+                from sharding import translate_sharded
+                with stage('translate_sharded'):
+                    doc, self.last_result = translate_sharded(
+                        self, source_bytes, target_lang, parsed_doc=parsed_doc,
+                        processes=processes, on_segment=on_segment, cancel_token=cancel_token
+                    )
+                # 在格式纠错删除空标题之前建立索引，与解析时的编号一致
+                segments = self.reconstructor.index_document(doc)
+            else:
+                job = TranslationJob(cancel_token)
+                with stage('translate_with_context'):
+                    translated_content = self.translator.translate_with_context(
+                        parsed_doc['content_layer'], target_lang,
+                        layout_layer=parsed_doc['layout_layer'], on_result=on_segment, job=job
+                    )
                 
-                return True
-            
-            return False
+                self.last_result = {
+                    'parsed_doc': parsed_doc,
+                    'translated_content': translated_content,
+                    **job.report()
+                }
+                
+                # 3. 格式智能重建（在内存中完成）
+                _report(self.reporter, 'info', "🔧 Performing intelligent format reconstruction...")
+                with stage('reconstruct_document'):
+                    doc = self.reconstructor.build_document(
+                        source_bytes, translated_content,
+                        parsed_doc['format_layer'], parsed_doc['layout_layer']
+                    )
+                segments = self.reconstructor.segment_index
+            
+            untranslated_ids, total_segments = _untranslated_ids(self.last_result['translated_content'])
+            cancelled = cancel_token is not None and cancel_token.cancelled
+            if cancelled:
+                _report(self.reporter, 'warning',
+                        f"Translation cancelled, {total_segments - len(untranslated_ids)} of "
+                        f"{total_segments} segments were finished")
+                if not keep_partial:
+                    return ProcessResult('cancelled', untranslated_ids=untranslated_ids)
+            elif total_segments and len(untranslated_ids) == total_segments:
+                # 一个片段都没有译出（如后端不可用），不把原文当作译文输出
+                message = f"None of the {total_segments} segments could be translated"
+                _report(self.reporter, 'error', message)
+                return ProcessResult('failed', untranslated_ids=untranslated_ids, error=message)
+            if untranslated_ids and not cancelled:
+                _report(self.reporter, 'warning',
+                        f"{len(untranslated_ids)} segments could not be translated "
+                        f"and were kept in the source language")
+            
+            # 4. 格式纠错，直接作用于内存中的文档，避免保存后再重新加载
+            self._correct_format(doc, stage)
+            
+            if output is None:
+                output = tempfile.SpooledTemporaryFile(max_size=SPILL_TO_DISK_THRESHOLD)
+            with stage('save_document'):
+                _save_document(doc, output, source_bytes)
+            self._edit_state = {'doc': doc, 'segments': segments, 'source_bytes': source_bytes}
+            if cancelled:
+                return ProcessResult('cancelled', output, untranslated_ids)
+            if untranslated_ids:
+                return ProcessResult('partial', output, untranslated_ids)
+            if cache_key is not None:
+                # 只缓存完整译文，部分失败的结果下次重新翻译
+                self._store_cached_output(cache_key, output)
+            return ProcessResult('success', output)
+            
+        except JobCancelled:
+            _report(self.reporter, 'warning', "Translation cancelled")
+            return ProcessResult('cancelled')
+        except Exception as e:
+            _report(self.reporter, 'error', f"文档处理失败: {str(e)}")
+            return ProcessResult('failed', error=str(e))
+    
+    def _correct_format(self, doc: 'Document', stage=_no_profile):
+        """检测并修复内存中文档的格式问题"""
+        _report(self.reporter, 'info', "🔍 Performing format correction...")
+        with stage('detect_format_issues'):
+            issues = self.corrector.detect_format_issues(doc)
+        if issues:
+            _report(self.reporter, 'warning', f"Found {len(issues)} format issues, automatically repairing...")
+            with stage('auto_fix_issues'):
+                self.corrector.auto_fix_issues(doc, issues)
+    
+    def apply_edits(self, edits: Dict[str, str], output: Union[str, BinaryIO] = None) -> ProcessResult:
+        """把用户修改过的译文写入最近一次生成的文档，只替换edits中的片段
+        
+        edits为片段id -> 新译文。文档对象、片段索引和格式模板沿用process_document的结果，
+        不重新解析或重建，耗时只取决于修改的片段数和保存。last_result中的译文同步更新。
+        output省略时使用内存缓冲区；没有可修改的文档或存在未知片段id时返回failed，文档不变。
+        """
+        if self._edit_state is None or self.last_result is None:
+            return ProcessResult('failed', error="No translated document to edit")
+        try:
+            state = self._edit_state
+            if state['doc'] is None:
+                self._rebuild_for_edits(state)
+            
+            unknown = [segment_id for segment_id in edits if segment_id not in state['segments']]
+            if unknown:
+                message = f"Unknown segment ids: {', '.join(unknown[:10])}"
+                _report(self.reporter, 'error', message)
+                return ProcessResult('failed', error=message)
+            
+            items = {item.get('id'): item for item in self.last_result['translated_content']}
+            for segment_id, text in edits.items():
+                self.reconstructor.patch_segment(segment_id, state['segments'][segment_id], text)
+                item = items.get(segment_id)
+                if item is not None:
+                    item['translated_text'] = text
+                    item['translation_source'] = 'edit'
+                    item.pop('translation_problems', None)
+                    item.pop('translation_warnings', None)
+            
+            if output is None:
+                output = tempfile.SpooledTemporaryFile(max_size=SPILL_TO_DISK_THRESHOLD)
+            _save_document(state['doc'], output, state['source_bytes'])
+            _report(self.reporter, 'info', f"✏️ Applied {len(edits)} edited segments")
+            return ProcessResult('success', output)
             
         except Exception as e:
-            st.error(f"文档处理失败: {str(e)}")
-            return False
+            _report(self.reporter, 'error', f"修改译文失败: {str(e)}")
+            return ProcessResult('failed', error=str(e))
+    
+    def _rebuild_for_edits(self, state: Dict[str, Any]):
+        """缓存命中的任务没有文档对象，按缓存的译文重建一次（与缓存的文档相同）"""
+        parsed_doc = self.last_result['parsed_doc']
+        doc = self.reconstructor.build_document(
+            state['source_bytes'], self.last_result['translated_content'],
+            parsed_doc['format_layer'], parsed_doc['layout_layer']
+        )
+        state['segments'] = self.reconstructor.segment_index
+        self._correct_format(doc)
+        state['doc'] = doc
+    
+    def _load_cached_output(self, cache_key: str, output: Union[str, BinaryIO, None]):
+        """缓存命中时把文档写入output并恢复last_result，返回ProcessResult；未命中返回None"""
+        last_result = self.artifact_cache.get(cache_key)
+        if last_result is None:
+            return None
+        cached = self.artifact_cache.open_file(cache_key)
+        if cached is None:
+            return None
+        with cached:
+            if output is None:
+                output = tempfile.SpooledTemporaryFile(max_size=SPILL_TO_DISK_THRESHOLD)
+            if isinstance(output, str):
+                with open(output, 'wb') as f:
+                    shutil.copyfileobj(cached, f)
+            else:
+                shutil.copyfileobj(cached, output)
+                output.seek(0)
+        self.last_result = last_result
+        _report(self.reporter, 'info', "♻️ Same document and options translated before, using the cached result")
+        return ProcessResult('success', output)
+    
+    def _store_cached_output(self, cache_key: str, output: Union[str, BinaryIO]):
+        try:
+            if isinstance(output, str):
+                with open(output, 'rb') as f:
+                    self.artifact_cache.put_file(cache_key, f)
+            else:
+                self.artifact_cache.put_file(cache_key, output)
+            # 文档先写入，结果数据存在即表示条目完整
+            self.artifact_cache.put(cache_key, self.last_result)
+        except OSError as e:
+            logger.warning(f"缓存写入失败: {str(e)}")
+    
+    def _profiler_stage(self, profile: Union[bool, str, None], source_bytes: bytes):
+        """返回阶段包装器：开启性能分析时为PipelineProfiler.stage，否则为空上下文"""
+        if profile is None and not os.environ.get('FREE_TRANSLATE_PROFILE'):
+            return _no_profile
+        
+        from profiling import PipelineProfiler, profile_dir_from
+        output_dir = profile_dir_from(profile)
+        if output_dir is None:
+            return _no_profile
+        job_name = f"{time.strftime('%Y%m%d-%H%M%S')}-{hashlib.sha256(source_bytes).hexdigest()[:12]}"
+        profiler = PipelineProfiler(output_dir, job_name)
+        _report(self.reporter, 'info', f"Profiling enabled, writing to {profiler.path}")
+        return profiler.stage
+
+
+def __getattr__(name):
+    # 兼容旧的导入方式 from smart_translator import DualViewEditor
+    if name in ('DualViewEditor', '_build_page_index'):
+        import dual_view_editor
+        return getattr(dual_view_editor, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,244 @@
+"""
+Local OpenAI-compatible stub of the Chat Completions API
+Answers POST /v1/chat/completions over real HTTP with deterministic pseudo-translations
+(see api_client.pseudo_translate) and token usage, after a latency drawn from a
+configurable distribution. A fraction of requests can be answered with 429 or 500 to
+exercise retries, circuit breaking and hedging without network access.
+
+    python stub_server.py --port 8700 --latency 0.3 --latency-dist lognormal --error-rate-429 0.05
+    OPENAI_API_KEY=stub python job_service.py --base-url http://127.0.0.1:8700/v1
+
+In tests and benchmarks:
+    with StubServer(latency=0.1, error_rate_500=0.1) as stub:
+        client = ChatClient('stub', base_url=stub.base_url)
+
+    GET /v1/models      the served model names
+    GET /stats          request, status, token and concurrency counters
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+from urllib.parse import urlparse
+
+from api_client import OfflineChatClient, DEFAULT_MODEL
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'lognormal', 'pareto')
+
+
+class FaultProfile:
+    """Latency distribution and error injection, drawn from one seeded random generator"""
+
+    def __init__(self, latency: float = 0.0, latency_dist: str = 'fixed', spread: float = 0.5,
+                 error_rate_429: float = 0.0, error_rate_500: float = 0.0, retry_after: float = 1.0,
+                 seed: int = None):
+        if latency_dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency_dist}")
+        self.latency = latency            # 中位数延迟（秒）
+        self.latency_dist = latency_dist
+        self.spread = spread              # uniform：±比例；lognormal：sigma；pareto：形状参数alpha
+        self.error_rate_429 = error_rate_429
+        self.error_rate_500 = error_rate_500
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """(latency in seconds, injected HTTP status or None) for one request"""
+        with self._lock:
+            roll = self._random.random()
+            if self.latency_dist == 'uniform':
+                delay = self.latency * (1 + self._random.uniform(-self.spread, self.spread))
+            elif self.latency_dist == 'lognormal':
+                delay = self.latency * math.exp(self._random.gauss(0.0, self.spread))
+            elif self.latency_dist == 'pareto':
+                # 重尾：中位数为latency，alpha越小尾部越长
+                delay = self.latency / 2 ** (1 / self.spread) * self._random.paretovariate(self.spread)
+            else:
+                delay = self.latency
+        if roll < self.error_rate_429:
+            return max(0.0, delay), 429
+        if roll < self.error_rate_429 + self.error_rate_500:
+            return max(0.0, delay), 500
+        return max(0.0, delay), None
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """Chat Completions endpoint; the FaultProfile and counters are attached to the server"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Dict[str, str] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path.rstrip('/')
+        if path in ('/v1/models', '/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': DEFAULT_MODEL, 'object': 'model'}]})
+        elif path == '/stats':
+            self._send_json(200, self.server.get_stats())
+        else:
+            self._send_json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+
+    def do_POST(self):
+        path = urlparse(self.path).path.rstrip('/')
+        try:
+            # 先读完请求体，否则保持连接时剩余的字节会被当作下一个请求
+            body = self.rfile.read(int(self.headers.get('Content-Length', '0')))
+        except ValueError:
+            self.close_connection = True
+            self._send_json(400, {'error': {'message': 'Invalid Content-Length', 'type': 'invalid_request_error'}})
+            return
+        if path not in ('/v1/chat/completions', '/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+            return
+
+        try:
+            payload = json.loads(body or b'{}')
+            messages = payload['messages']
+        except (ValueError, KeyError, TypeError):
+            self._send_json(400, {'error': {'message': 'Invalid request body', 'type': 'invalid_request_error'}})
+            return
+
+        delay, injected_status = self.server.faults.draw()
+        self.server.request_started()
+        try:
+            time.sleep(delay)
+        finally:
+            self.server.request_finished()
+
+        if injected_status == 429:
+            self.server.record(429)
+            self._send_json(429, {'error': {'message': 'Rate limit reached (injected)', 'type': 'rate_limit_error'}},
+                            headers={'Retry-After': f"{self.server.faults.retry_after:g}"})
+            return
+        if injected_status == 500:
+            self.server.record(500)
+            self._send_json(500, {'error': {'message': 'Internal server error (injected)', 'type': 'server_error'}})
+            return
+
+        response = self.server.backend.chat_completion(
+            model=payload.get('model') or DEFAULT_MODEL, messages=messages,
+            max_tokens=payload.get('max_tokens'), temperature=payload.get('temperature')
+        )
+        self.server.record(200, response['usage'])
+        self._send_json(200, response)
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    """Threading HTTP server holding the fault profile and request counters"""
+
+    daemon_threads = True
+
+    def __init__(self, address, faults: FaultProfile, verbose: bool = False):
+        super().__init__(address, StubRequestHandler)
+        self.faults = faults
+        self.verbose = verbose
+        self.backend = OfflineChatClient()  # 伪翻译和token用量与离线后端一致
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0, 'status': {}, 'prompt_tokens': 0, 'completion_tokens': 0,
+            'in_flight': 0, 'max_in_flight': 0
+        }
+
+    def request_started(self):
+        with self._lock:
+            self._stats['in_flight'] += 1
+            self._stats['max_in_flight'] = max(self._stats['max_in_flight'], self._stats['in_flight'])
+
+    def request_finished(self):
+        with self._lock:
+            self._stats['in_flight'] -= 1
+
+    def record(self, status: int, usage: Dict[str, int] = None):
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['status'][str(status)] = self._stats['status'].get(str(status), 0) + 1
+            if usage:
+                self._stats['prompt_tokens'] += usage['prompt_tokens']
+                self._stats['completion_tokens'] += usage['completion_tokens']
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, status=dict(self._stats['status']))
+
+
+class StubServer:
+    """Stub server on a background thread; port 0 picks a free port"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, verbose: bool = False, **fault_options):
+        self.httpd = StubHTTPServer((host, port), FaultProfile(**fault_options), verbose=verbose)
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self.httpd.get_stats()
+
+    def start(self) -> 'StubServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='stub-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> 'StubServer':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible Chat Completions stub with fault injection")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8700)
+    parser.add_argument('--latency', type=float, default=0.0, help="Median response latency in seconds")
+    parser.add_argument('--latency-dist', choices=LATENCY_DISTRIBUTIONS, default='fixed')
+    parser.add_argument('--spread', type=float, default=0.5,
+                        help="uniform: +/- fraction, lognormal: sigma, pareto: alpha (smaller = heavier tail)")
+    parser.add_argument('--error-rate-429', type=float, default=0.0, help="Fraction of requests answered 429")
+    parser.add_argument('--error-rate-500', type=float, default=0.0, help="Fraction of requests answered 500")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="Retry-After seconds sent with 429")
+    parser.add_argument('--seed', type=int, help="Seed for reproducible latencies and faults")
+    parser.add_argument('--verbose', action='store_true', help="Log every request")
+    args = parser.parse_args()
+
+    server = StubServer(args.host, args.port, verbose=args.verbose, latency=args.latency,
+                        latency_dist=args.latency_dist, spread=args.spread,
+                        error_rate_429=args.error_rate_429, error_rate_500=args.error_rate_500,
+                        retry_after=args.retry_after, seed=args.seed)
+    print(f"Stub Chat Completions API on {server.base_url} ({args.latency_dist} latency {args.latency}s)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
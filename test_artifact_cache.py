@@ -0,0 +1,127 @@
+"""
+Tests for artifact_cache.py
+"""
+
+import os
+import pickle
+import time
+
+import pytest
+from docx import Document
+
+from api_client import OfflineChatClient
+from artifact_cache import ArtifactCache
+from load_test import make_document
+from smart_translator import SemanticTranslator, SmartDocumentTranslator
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ArtifactCache(str(tmp_path / 'cache'))
+
+
+class _Renamed:
+    pass
+
+
+@pytest.mark.parametrize('payload', [
+    b'',                                          # EOFError
+    b'not a pickle at all',                       # UnpicklingError
+    pickle.dumps({'a': [1, 2, 3]})[:-4],          # truncated by a crashed writer
+    pickle.dumps(_Renamed()).replace(b'_Renamed', b'_Missing'),  # AttributeError: class renamed since
+])
+def test_unreadable_entry_is_a_miss_and_removed(cache, payload):
+    path = os.path.join(cache.directory, 'key.pickle')
+    with open(path, 'wb') as f:
+        f.write(payload)
+
+    assert cache.get('key') is None
+    assert not os.path.exists(path)
+    assert cache.get_stats()['misses'] == 1
+
+    cache.put('key', {'ok': True})
+    assert cache.get('key') == {'ok': True}
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'), ttl=60)
+    cache.put('key', 'value')
+    path = os.path.join(cache.directory, 'key.pickle')
+    os.utime(path, (time.time() - 120, time.time() - 120))
+
+    assert cache.get('key') is None
+    assert not os.path.exists(path)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'), max_bytes=2500)
+    for index, key in enumerate(['old', 'used', 'new']):
+        cache.put(key, b'x' * 1000)
+        path = os.path.join(cache.directory, key + '.pickle')
+        os.utime(path, (time.time() - 100 + index, time.time() - 100 + index))
+    assert cache.get('used') is not None  # 命中刷新时间戳
+
+    cache.put('newest', b'x' * 1000)
+
+    assert cache.get('old') is None
+    assert cache.get('used') is not None
+    assert cache.get_stats()['evictions'] >= 1
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason="POSIX permissions only")
+def test_group_writable_directory_is_refused(tmp_path):
+    directory = tmp_path / 'shared'
+    directory.mkdir()
+    directory.chmod(0o775)
+
+    with pytest.raises(PermissionError):
+        ArtifactCache(str(directory))
+
+
+class _CountingClient(OfflineChatClient):
+    def __init__(self):
+        super().__init__()
+        self.requests = 0
+
+    def chat_completion(self, *args, **kwargs):
+        self.requests += 1
+        return super().chat_completion(*args, **kwargs)
+
+
+def _system(cache, client):
+    system = SmartDocumentTranslator()
+    system.translator = SemanticTranslator('offline', client=client)
+    system.set_artifact_cache(cache)
+    return system
+
+
+def test_same_document_and_options_are_served_from_cache(cache):
+    source = make_document(5, 1, rows=2, cols=2)
+    first_client, second_client = _CountingClient(), _CountingClient()
+    first = _system(cache, first_client).process_document(source, 'Chinese')
+
+    second_system = _system(cache, second_client)
+    second = second_system.process_document(source, 'Chinese')
+
+    assert first.status == second.status == 'success'
+    assert first_client.requests > 0 and second_client.requests == 0
+    assert second.output.read() == first.output.read()
+    assert second_system.last_result['translated_content']
+
+    # 选项不同（目标语言）时重新翻译
+    assert _system(cache, second_client).process_document(source, 'German').status == 'success'
+    assert second_client.requests > 0
+
+
+def test_edits_after_a_cache_hit_rebuild_the_document(cache):
+    source = make_document(5, 0)
+    _system(cache, OfflineChatClient()).process_document(source, 'Chinese')
+    system = _system(cache, OfflineChatClient())
+    system.process_document(source, 'Chinese')
+    segment_id = next(item['id'] for item in system.last_result['translated_content']
+                      if item['text'].startswith('Paragraph 2'))
+
+    result = system.apply_edits({segment_id: '第二段'})
+
+    assert result.status == 'success'
+    assert '第二段' in [paragraph.text for paragraph in Document(result.output).paragraphs]
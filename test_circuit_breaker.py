@@ -0,0 +1,107 @@
+"""
+Tests for circuit_breaker.py and its use in SemanticTranslator, over HTTP against stub_server.py
+"""
+
+import time
+
+import pytest
+
+from api_client import APIError
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, is_backend_failure
+from smart_translator import SemanticTranslator
+from stub_server import StubServer
+
+MESSAGES = [{'role': 'user', 'content': 'Translate this paragraph to Chinese: Hello world'}]
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=60)
+    for _ in range(2):
+        breaker.record_failure()
+    breaker.record_success()  # 成功后重新计数
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.get_stats()['trips'] == 1
+    assert breaker.get_stats()['rejected'] == 1
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # 探测请求返回前其余请求仍被拒绝
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+@pytest.mark.parametrize('error, failure', [
+    (APIError('HTTP 500: boom', 500), True),
+    (APIError('HTTP 429: slow down', 429), True),
+    (APIError('Request failed: connection refused'), True),
+    (APIError('HTTP 400: bad request', 400), False),
+    (APIError('HTTP 401: bad key', 401), False),
+    (CircuitOpenError('circuit open'), False),
+])
+def test_is_backend_failure(error, failure):
+    assert is_backend_failure(error) is failure
+
+
+def test_translator_stops_calling_a_failing_backend():
+    with StubServer(error_rate_500=1.0) as stub:
+        translator = SemanticTranslator('stub', base_url=stub.base_url)
+        translator.set_circuit_breaker(failure_threshold=2, recovery_timeout=60)
+        try:
+            for _ in range(2):
+                with pytest.raises(APIError, match='HTTP 500'):
+                    translator._chat(MESSAGES, max_tokens=50)
+            with pytest.raises(CircuitOpenError):
+                translator._chat(MESSAGES, max_tokens=50)
+        finally:
+            translator.close()
+
+        assert stub.get_stats()['requests'] == 2
+        assert translator.get_breaker_stats()[0]['state'] == OPEN
+
+
+def test_open_circuit_fails_over_to_secondary_backend():
+    with StubServer(error_rate_500=1.0) as primary, StubServer() as secondary:
+        translator = SemanticTranslator('stub', base_url=primary.base_url)
+        translator.set_circuit_breaker(failure_threshold=1, recovery_timeout=60)
+        translator.set_secondary_backend(base_url=secondary.base_url)
+        try:
+            with pytest.raises(APIError):
+                translator._chat(MESSAGES, max_tokens=50)
+            assert translator._chat(MESSAGES, max_tokens=50) == '[Chinese] Hello world'
+        finally:
+            translator.close()
+
+        assert primary.get_stats()['requests'] == 1
+        assert secondary.get_stats()['status'] == {'200': 1}
+
+
+def test_client_errors_do_not_trip_the_circuit():
+    with StubServer() as stub:
+        # 错误的路径返回404：请求本身有问题，后端是健康的
+        translator = SemanticTranslator('stub', base_url=stub.base_url.replace('/v1', '/missing'))
+        translator.set_circuit_breaker(failure_threshold=1, recovery_timeout=60)
+        try:
+            for _ in range(2):
+                with pytest.raises(APIError, match='HTTP 404'):
+                    translator._chat(MESSAGES, max_tokens=50)
+        finally:
+            translator.close()
+
+    assert translator.get_breaker_stats()[0]['state'] == CLOSED
@@ -0,0 +1,76 @@
+"""
+Tests for docx_writer.py
+"""
+
+import io
+import struct
+import zipfile
+import zlib
+
+import pytest
+from docx import Document
+
+from docx_writer import save_docx
+
+
+def _png(width=64, height=64) -> bytes:
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    # 渐变图像，压缩后仍有一定大小
+    raw = b''.join(b'\x00' + b''.join(bytes((x * 4 % 256, y * 4 % 256, 128)) for x in range(width))
+                   for y in range(height))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b''))
+
+
+@pytest.fixture
+def source():
+    doc = Document()
+    doc.add_paragraph('Hello')
+    doc.add_picture(io.BytesIO(_png()))
+    stream = io.BytesIO()
+    doc.save(stream)
+    return stream.getvalue()
+
+
+def test_unchanged_entries_are_copied_raw(source):
+    doc = Document(io.BytesIO(source))
+    doc.paragraphs[0].text = '你好'
+    output = io.BytesIO()
+
+    stats = save_docx(doc, output, source)
+
+    assert stats['rewritten'] >= 1 and stats['copied'] >= 1
+    with zipfile.ZipFile(io.BytesIO(source)) as before, zipfile.ZipFile(output) as after:
+        assert after.testzip() is None
+        image = next(name for name in before.namelist() if name.startswith('word/media/'))
+        old, new = before.getinfo(image), after.getinfo(image)
+        assert (new.CRC, new.compress_size, new.compress_type) == (old.CRC, old.compress_size, old.compress_type)
+        assert after.read(image) == before.read(image)
+    assert Document(output).paragraphs[0].text == '你好'
+
+
+def test_same_members_as_document_save(source):
+    doc = Document(io.BytesIO(source))
+    doc.add_paragraph('Added')
+    reference, output = io.BytesIO(), io.BytesIO()
+    doc.save(reference)
+
+    save_docx(doc, output, source)
+
+    with zipfile.ZipFile(reference) as expected, zipfile.ZipFile(output) as actual:
+        assert actual.namelist() == expected.namelist()
+        for name in expected.namelist():
+            assert actual.read(name) == expected.read(name)
+
+
+def test_unmodified_document_copies_every_entry(source):
+    output = io.BytesIO()
+    stats = save_docx(Document(io.BytesIO(source)), output, source)
+
+    assert output.tell() == 0
+    with zipfile.ZipFile(io.BytesIO(source)) as before:
+        # python-docx重新序列化的XML可能与原字节不同，媒体文件必定原样复制
+        assert stats['copied'] + stats['rewritten'] == len(before.namelist())
+    assert stats['copied'] >= 1
@@ -0,0 +1,37 @@
+"""
+Tests for dual_view_editor.py, rendered with Streamlit's AppTest
+"""
+
+from streamlit.testing.v1 import AppTest
+
+
+def _overall_view_app():
+    from dual_view_editor import DualViewEditor
+
+    items = [
+        {'id': 'para_0', 'type': 'paragraph', 'text': 'Hello', 'translated_text': '你好'},
+        {'id': 'para_1', 'type': 'paragraph', 'text': 'Hello', 'translated_text': '你好'},
+        {'id': 'para_2', 'type': 'paragraph', 'text': 'World', 'translated_text': '世界'},
+    ]
+    layout = [{'id': item['id'], 'page_number': 1} for item in items]
+    DualViewEditor().display_dual_view(items, items, layout, job_id='job-1')
+
+
+def test_overall_view_with_job_id_uses_cached_index():
+    app = AppTest.from_function(_overall_view_app)
+    app.run()
+
+    assert not app.exception
+    values = [text_area.value for text_area in app.text_area]
+    # 重复段落只显示一次：原文两段，译文两段
+    assert values == ['Hello', 'World', '你好', '世界']
+    assert app.session_state['page_index']['job_id'] == 'job-1'
+
+
+def test_overall_view_survives_rerun():
+    app = AppTest.from_function(_overall_view_app)
+    app.run()
+    app.run()
+
+    assert not app.exception
+    assert len(app.text_area) == 4
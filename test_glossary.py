@@ -0,0 +1,68 @@
+"""
+Tests for glossary.py
+"""
+
+import io
+from collections import Counter
+
+import pytest
+
+from glossary import Glossary
+
+
+@pytest.fixture
+def glossary():
+    return Glossary({'cat': '猫', 'category': '类别', 'he': '他', 'she': '她', 'hers': '她的',
+                     'machine learning': '机器学习', '数据库': 'database'})
+
+
+def test_overlapping_terms_are_all_found():
+    # 中文没有词边界，重叠和嵌套的术语都应通过失败链接找到
+    glossary = Glossary({'数据': 'data', '据库': 'x', '数据库': 'database', '库存': 'stock'})
+    assert set(glossary.find('数据库存', count_usage=False)) == {'数据', '据库', '数据库', '库存'}
+
+
+def test_embedded_words_are_rejected(glossary):
+    # 'he'嵌在'she'和'hers'里，'she'和'hers'嵌在'ushers'里
+    assert glossary.find('she, hers', count_usage=False) == {'she': '她', 'hers': '她的'}
+    assert glossary.find('ushers', count_usage=False) == {}
+
+
+def test_terms_match_on_word_boundaries_only(glossary):
+    assert glossary.find('A cat in a category', count_usage=False) == {'cat': '猫', 'category': '类别'}
+    assert glossary.find('concatenate', count_usage=False) == {}
+    assert glossary.find('Machine Learning models', count_usage=False) == {'machine learning': '机器学习'}
+
+
+def test_cjk_terms_match_inside_text(glossary):
+    assert glossary.find('连接数据库失败', count_usage=False) == {'数据库': 'database'}
+
+
+def test_case_sensitive_glossary():
+    glossary = Glossary({'Go': '围棋'}, case_sensitive=True)
+    assert glossary.find('Go rules', count_usage=False) == {'Go': '围棋'}
+    assert glossary.find('go home', count_usage=False) == {}
+
+
+def test_usage_is_counted_per_counter(glossary):
+    job_usage = Counter()
+    glossary.find('cat and cat', usage=job_usage)
+    glossary.find('a category')
+
+    assert job_usage == {'cat': 2}
+    assert glossary.get_usage_report() == [{'source': 'category', 'target': '类别', 'count': 1}]
+    assert glossary.get_usage_report(job_usage) == [{'source': 'cat', 'target': '猫', 'count': 2}]
+
+
+def test_added_terms_rebuild_the_matcher(glossary):
+    assert glossary.find('dog', count_usage=False) == {}
+    glossary.add('dog', '狗')
+    assert glossary.find('dog', count_usage=False) == {'dog': '狗'}
+
+
+def test_load_csv_with_and_without_header():
+    with_header = Glossary.load_csv(io.BytesIO('target,source\n服务器,server\n'.encode('utf-8')))
+    without_header = Glossary.load_csv(io.BytesIO('server,服务器\nclient,客户端\n'.encode('utf-8')))
+
+    assert with_header.terms == {'server': '服务器'}
+    assert without_header.terms == {'server': '服务器', 'client': '客户端'}
@@ -0,0 +1,119 @@
+"""
+Tests for hedging.py and request deadlines, partly over HTTP against stub_server.py
+"""
+
+import threading
+import time
+
+import pytest
+
+from api_client import APIError, ChatClient, DeadlineExceeded
+from hedging import RequestHedger
+from stub_server import StubServer
+
+MESSAGES = [{'role': 'user', 'content': 'Translate this paragraph to Chinese: Hello world'}]
+
+
+@pytest.fixture
+def hedger():
+    hedger = RequestHedger(max_hedge_ratio=1.0, min_samples=3, min_delay=0.0)
+    yield hedger
+    hedger.shutdown()
+
+
+def _warm_up(hedger, key, latency):
+    for _ in range(hedger.min_samples):
+        hedger.call(key, lambda timeout: time.sleep(latency))
+
+
+def test_slow_request_is_hedged_and_the_fast_copy_wins(hedger):
+    _warm_up(hedger, 'route', 0.01)
+    attempts = []
+
+    def attempt(timeout):
+        attempts.append(timeout)
+        if len(attempts) == 1:
+            time.sleep(0.5)  # 主请求卡住
+            return 'primary'
+        return 'hedge'
+
+    started = time.monotonic()
+    assert hedger.call('route', attempt, deadline=5) == 'hedge'
+    assert time.monotonic() - started < 0.4
+    stats = hedger.get_stats()
+    assert (stats['hedged'], stats['hedge_wins']) == (1, 1)
+
+
+def test_deadline_raises_without_waiting_for_the_attempt(hedger):
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        hedger.call('route', lambda timeout: time.sleep(0.5), deadline=0.1)
+
+    assert time.monotonic() - started < 0.3
+    assert hedger.get_stats()['deadline_exceeded'] == 1
+
+
+def test_attempts_receive_the_remaining_deadline(hedger):
+    timeouts = []
+    hedger.call('route', timeouts.append, deadline=2)
+    assert 0 < timeouts[0] <= 2
+
+
+def test_no_hedge_when_p95_is_beyond_the_deadline(hedger):
+    _warm_up(hedger, 'route', 0.2)
+
+    with pytest.raises(DeadlineExceeded):
+        hedger.call('route', lambda timeout: time.sleep(0.5), deadline=0.1)
+    assert hedger.get_stats()['hedged'] == 0
+
+
+def test_queued_attempt_does_not_start_after_the_deadline():
+    hedger = RequestHedger(max_workers=1)
+    release = threading.Event()
+    hedger._executor.submit(release.wait, 1)  # 占住唯一的线程，请求在队列中等到截止时间之后
+    calls = []
+    try:
+        with pytest.raises(DeadlineExceeded):
+            hedger.call('route', calls.append, deadline=0.1)
+        release.set()
+        time.sleep(0.05)
+    finally:
+        hedger.shutdown()
+    assert calls == []
+
+
+def test_hedge_ratio_cap(hedger):
+    hedger.max_hedge_ratio = 0.0
+    _warm_up(hedger, 'route', 0.01)
+
+    assert hedger.call('route', lambda timeout: time.sleep(0.1) or 'slow', deadline=5) == 'slow'
+    stats = hedger.get_stats()
+    assert (stats['hedged'], stats['hedges_skipped']) == (0, 1)
+
+
+def test_client_does_not_send_a_request_without_time_left():
+    with StubServer() as stub:
+        client = ChatClient('stub', base_url=stub.base_url)
+        try:
+            with pytest.raises(DeadlineExceeded):
+                client.chat_completion('gpt-3.5-turbo', MESSAGES, timeout=0)
+        finally:
+            client.close()
+        assert stub.get_stats()['requests'] == 0
+
+
+def test_read_timeout_is_capped_by_the_deadline():
+    with StubServer(latency=0.5) as stub:
+        client = ChatClient('stub', base_url=stub.base_url)
+        hedger = RequestHedger()
+        try:
+            started = time.monotonic()
+            with pytest.raises(DeadlineExceeded):
+                hedger.call('route', lambda timeout: client.chat_completion('gpt-3.5-turbo', MESSAGES,
+                                                                            timeout=timeout), deadline=0.2)
+            assert time.monotonic() - started < 0.4
+            with pytest.raises(APIError, match='timed out'):
+                client.chat_completion('gpt-3.5-turbo', MESSAGES, timeout=0.1)
+        finally:
+            hedger.shutdown()
+            client.close()
@@ -0,0 +1,76 @@
+"""
+Tests for job_service.py, driven over HTTP
+"""
+
+import http.client
+import json
+import threading
+import time
+from urllib.parse import quote
+
+import pytest
+
+from job_service import JobManager, create_server, make_translator_factory
+from load_test import make_document
+
+
+@pytest.fixture
+def service():
+    factory = make_translator_factory('offline')
+    manager = JobManager(factory, workers=2)
+    server = create_server('127.0.0.1', 0, manager)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address[1], factory
+    server.shutdown()
+    server.server_close()
+    factory.close()
+
+
+def _request(port, method, path, body=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    headers = {'Content-Length': str(len(body))} if body is not None else {}
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    return response.status, dict(response.getheaders()), response.read()
+
+
+def _wait_finished(port, job_id):
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        status, _, body = _request(port, 'GET', f'/jobs/{job_id}')
+        job = json.loads(body)
+        if job['finished_at']:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def _submit(port, file_name='report.docx'):
+    status, _, body = _request(port, 'POST', f'/jobs?target_lang=Chinese&file_name={quote(file_name)}',
+                               make_document(20, 1))
+    assert status == 202
+    return json.loads(body)['job_id']
+
+
+def test_jobs_share_one_translator(service):
+    port, factory = service
+    job_ids = [_submit(port) for _ in range(3)]
+
+    assert [_wait_finished(port, job_id)['status'] for job_id in job_ids] == ['succeeded'] * 3
+    translator = factory.translator_for(None)
+    assert factory({}).translator is translator
+    # 三个任务的请求都经过同一个翻译器，路由统计在任务之间累积
+    requests = sum(metrics['requests'] for metrics in translator.router.get_metrics().values())
+    assert requests >= 20
+
+
+def test_result_download_with_unicode_name(service):
+    port, _ = service
+    job_id = _submit(port, '报告.docx')
+    _wait_finished(port, job_id)
+
+    status, headers, body = _request(port, 'GET', f'/jobs/{job_id}/result')
+
+    assert status == 200
+    assert body[:2] == b'PK'
+    assert "filename*=UTF-8''translated_%E6%8A%A5%E5%91%8A.docx" in headers['Content-Disposition']
@@ -0,0 +1,55 @@
+"""
+Tests for sharding.py: sharded and in-process translation produce the same document
+"""
+
+import pytest
+from docx import Document
+
+from api_client import OfflineChatClient
+from load_test import make_document
+from smart_translator import SemanticTranslator, SmartDocumentTranslator
+
+
+def _translate(source, processes, parse_first=False):
+    system = SmartDocumentTranslator()
+    system.translator = SemanticTranslator('offline', client=OfflineChatClient())
+    parsed_doc = system.parse_document(source) if parse_first else None
+    result = system.process_document(source, 'Chinese', parsed_doc=parsed_doc, processes=processes)
+    assert result.status == 'success'
+    doc = Document(result.output)
+    return system, ([paragraph.text for paragraph in doc.paragraphs],
+                    [[cell.text for row in table.rows for cell in row.cells] for table in doc.tables])
+
+
+@pytest.fixture(scope='module')
+def source():
+    # 60段正文含3个一级标题，切分为多个分片
+    return make_document(60, 2)
+
+
+@pytest.fixture(scope='module')
+def expected(source):
+    return _translate(source, None)
+
+
+@pytest.mark.parametrize('parse_first', [False, True])
+def test_sharded_output_matches_in_process_output(source, expected, parse_first):
+    system, document = _translate(source, 2, parse_first)
+    expected_system, expected_document = expected
+
+    assert document == expected_document
+    assert any(text.startswith('[Chinese]') for text in document[0])
+    translated = {item['id']: item.get('translated_text') for item in system.last_result['translated_content']}
+    assert translated == {item['id']: item.get('translated_text')
+                          for item in expected_system.last_result['translated_content']}
+
+
+def test_edits_apply_to_a_sharded_document(source):
+    system, _ = _translate(source, 2)
+    segment_id = next(item['id'] for item in system.last_result['translated_content']
+                      if item['id'].startswith('para_') and item['text'].startswith('Paragraph'))
+
+    result = system.apply_edits({segment_id: '修改后的译文'})
+
+    assert result.status == 'success'
+    assert '修改后的译文' in [paragraph.text for paragraph in Document(result.output).paragraphs]
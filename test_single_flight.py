@@ -0,0 +1,134 @@
+"""
+Tests for single_flight.py and request coalescing in SemanticTranslator
+"""
+
+import threading
+import time
+
+import pytest
+
+from api_client import APIError, ChatClient, OfflineChatClient, pseudo_translate
+from cancellation import JobCancelled
+from single_flight import SingleFlight
+from smart_translator import SemanticTranslator, _client_identity, _is_private_error
+
+
+def _run_concurrently(flight, key, functions, **kwargs):
+    """Start one caller per function, the first one leading, and collect results or errors"""
+    results = [None] * len(functions)
+
+    def caller(index, fn):
+        try:
+            results[index] = flight.do(key, fn, **kwargs)
+        except BaseException as e:
+            results[index] = e
+
+    threads = []
+    for index, fn in enumerate(functions):
+        threads.append(threading.Thread(target=caller, args=(index, fn)))
+        threads[-1].start()
+        time.sleep(0.02)  # the leader's call takes longer than all callers need to join
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return 'result'
+
+    results = _run_concurrently(flight, 'key', [slow] * 5)
+
+    assert results == ['result'] * 5
+    assert len(calls) == 1
+    assert flight.get_stats() == {'executed': 1, 'coalesced': 4, 'errors': 0, 'private_errors': 0,
+                                  'in_flight': 0}
+
+
+def test_shared_errors_reach_followers():
+    flight = SingleFlight()
+
+    def failing():
+        time.sleep(0.2)
+        raise APIError('HTTP 500: boom', 500)
+
+    results = _run_concurrently(flight, 'key', [failing, lambda: 'unused'])
+
+    assert all(isinstance(result, APIError) for result in results)
+
+
+@pytest.mark.parametrize('error', [JobCancelled('cancelled'), APIError('HTTP 401: bad key', 401)])
+def test_private_errors_make_a_follower_run_the_call(error):
+    flight = SingleFlight()
+
+    def leader():
+        time.sleep(0.2)
+        raise error
+
+    results = _run_concurrently(flight, 'key', [leader, lambda: 'own result'],
+                                is_private_error=_is_private_error)
+
+    assert results[0] is error
+    assert results[1] == 'own result'
+    assert flight.get_stats()['private_errors'] == 1
+
+
+def test_client_identity_separates_keys_and_endpoints():
+    first = ChatClient('key-a', base_url='http://localhost:1/v1')
+    same = ChatClient('key-a', base_url='http://localhost:1/v1/')
+    other_key = ChatClient('key-b', base_url='http://localhost:1/v1')
+    try:
+        assert _client_identity(first) == _client_identity(same)
+        assert _client_identity(first) != _client_identity(other_key)
+        assert 'key-a' not in repr(_client_identity(first))
+    finally:
+        for client in (first, same, other_key):
+            client.close()
+
+    # 没有identity()的客户端按实例区分
+    assert _client_identity(_RecordingClient(0)) != _client_identity(_RecordingClient(0))
+
+
+class _RecordingClient:
+    def __init__(self, delay):
+        self.delay = delay
+        self.requests = 0
+
+    def chat_completion(self, model, messages, max_tokens=None, temperature=None, timeout=None):
+        self.requests += 1
+        time.sleep(self.delay)
+        return {'choices': [{'message': {'content': pseudo_translate(messages[-1]['content'])}}]}
+
+
+def test_translators_with_different_clients_do_not_share_replies():
+    items = [{'id': 'para_0', 'type': 'paragraph', 'text': 'The same sentence in two sessions'}]
+    clients = [_RecordingClient(0.2), _RecordingClient(0.2)]
+    translators = [SemanticTranslator('key', client=client) for client in clients]
+
+    threads = [threading.Thread(target=translator.translate_with_context, args=(items, 'Chinese'))
+               for translator in translators]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert [client.requests for client in clients] == [1, 1]
+
+
+def test_offline_clients_share_replies():
+    items = [{'id': 'para_0', 'type': 'paragraph', 'text': 'Shared between offline sessions'}]
+    translators = [SemanticTranslator('key', client=OfflineChatClient(latency=0.2)) for _ in range(3)]
+    before = translators[0].get_coalescing_stats()
+    threads = [threading.Thread(target=translator.translate_with_context, args=(items, 'Chinese'))
+               for translator in translators]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert translators[0].get_coalescing_stats()['executed'] - before['executed'] == 1
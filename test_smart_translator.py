@@ -0,0 +1,103 @@
+"""
+Tests for the translation checks and apply_edits in smart_translator.py
+"""
+
+import pytest
+from docx import Document
+
+from api_client import OfflineChatClient
+from load_test import make_document
+from smart_translator import SemanticTranslator, SmartDocumentTranslator, TranslationJob
+
+
+@pytest.fixture
+def translator():
+    return SemanticTranslator('test-key', client=OfflineChatClient())
+
+
+@pytest.mark.parametrize('source, output', [
+    ("Revenue was 1.5 million in the 1st quarter", "第一季度收入为150万"),
+    ("10,000 dollars", "1万美元"),
+    ("一亿五千万 users", "150,000,000 users"),
+    ("Year 2024", "二〇二四年"),
+    ("Paid 1,234.5 on 2024-01-05", "于2024-01-05支付1,234.5"),
+])
+def test_converted_numbers_are_accepted(translator, source, output):
+    assert translator._validate_translation(source, output, {}) == ([], [])
+
+
+def test_number_and_echo_checks_are_warnings(translator):
+    assert translator._validate_translation("Paid 42 items", "支付了若干件", {}) == ([], ['number_missing: 42'])
+    assert translator._validate_translation("Acme Widget Pro", "Acme Widget Pro", {}) == ([], ['echoed_source'])
+
+
+def test_placeholder_problems_block(translator):
+    problems, _ = translator._validate_translation(
+        "__PROPER_NOUN_0__ is great", "很棒", {'__PROPER_NOUN_0__': 'GitHub'})
+    assert problems == ['placeholder_missing: __PROPER_NOUN_0__']
+    assert translator._validate_translation("text", "  ", {}) == (['empty_output'], [])
+
+
+class _DroppingClient(OfflineChatClient):
+    """Always drops protected names, so every attempt fails validation"""
+
+    def chat_completion(self, model, messages, max_tokens=None, temperature=None, timeout=None):
+        return {'choices': [{'message': {'content': 'translated without the name'}}]}
+
+
+def test_model_output_is_kept_after_retries():
+    translator = SemanticTranslator('test-key', client=_DroppingClient())
+    translator.add_proper_nouns(['GitHub'])
+    job = TranslationJob()
+    items = [{'id': 'para_0', 'type': 'paragraph', 'text': 'Hosted on GitHub today'}]
+
+    result = translator.translate_with_context(items, 'Chinese', job=job)
+
+    assert result[0]['translated_text'] == 'translated without the name'
+    assert result[0]['translation_problems'] == ['placeholder_missing: __PROPER_NOUN_0__']
+    assert [segment['id'] for segment in job.unresolved_segments] == ['para_0']
+
+
+def _translated_system(source):
+    system = SmartDocumentTranslator()
+    system.translator = SemanticTranslator('test-key', client=OfflineChatClient())
+    assert system.process_document(source, 'Chinese').status == 'success'
+    return system
+
+
+def _texts(output):
+    doc = Document(output)
+    return ([paragraph.text for paragraph in doc.paragraphs],
+            [cell.text for table in doc.tables for row in table.rows for cell in row.cells])
+
+
+def test_apply_edits_changes_only_the_edited_segments():
+    system = _translated_system(make_document(5, 1, rows=2, cols=2))
+    items = system.last_result['translated_content']
+    paragraph = next(item for item in items if item['text'].startswith('Paragraph 3'))
+    cell = next(item for item in items if item['id'].startswith('table_'))
+    paragraphs_before, cells_before = _texts(system.apply_edits({}).output)
+
+    result = system.apply_edits({paragraph['id']: '第三段（已修改）', cell['id']: '单元格（已修改）'})
+
+    assert result.status == 'success'
+    paragraphs, cells = _texts(result.output)
+    assert [text for text in paragraphs if text not in paragraphs_before] == ['第三段（已修改）']
+    assert [text for text in cells if text not in cells_before] == ['单元格（已修改）']
+    assert paragraph['translated_text'] == '第三段（已修改）'
+    assert paragraph['translation_source'] == 'edit'
+
+
+def test_apply_edits_rejects_unknown_ids():
+    system = _translated_system(make_document(3, 0))
+    before = _texts(system.apply_edits({}).output)
+
+    result = system.apply_edits({'para_999': 'x'})
+
+    assert result.status == 'failed'
+    assert 'para_999' in result.error
+    assert _texts(system.apply_edits({}).output) == before
+
+
+def test_apply_edits_without_a_document():
+    assert SmartDocumentTranslator().apply_edits({'para_0': 'x'}).status == 'failed'
@@ -0,0 +1,113 @@
+"""
+Tests for translation_memory.py
+"""
+
+import io
+import sqlite3
+
+import pytest
+from docx import Document
+
+from translation_memory import TranslationMemory, normalize_lang
+
+
+def _docx(paragraphs, heading_at=None):
+    doc = Document()
+    for index, text in enumerate(paragraphs):
+        if index == heading_at:
+            doc.add_heading(text, level=1)
+        else:
+            doc.add_paragraph(text)
+    stream = io.BytesIO()
+    doc.save(stream)
+    return stream.getvalue()
+
+
+@pytest.mark.parametrize('lang, expected', [
+    ('Chinese', 'zh-hans'), ('zh', 'zh-hans'), ('zh-CN', 'zh-hans'), ('zh_SG', 'zh-hans'),
+    ('zh-TW', 'zh-hant'), ('zh-Hant-HK', 'zh-hant'), ('Traditional Chinese', 'zh-hant'),
+    ('English', 'en'), ('en-US', 'en'), ('FR_fr', 'fr'), ('', ''),
+])
+def test_normalize_lang(lang, expected):
+    assert normalize_lang(lang) == expected
+
+
+def test_simplified_and_traditional_entries_are_separate():
+    memory = TranslationMemory()
+    memory.add('Settings', '设置', 'en', 'zh-CN')
+    memory.add('Settings', '設定', 'en', 'zh-TW')
+
+    assert memory.lookup('Settings', 'Chinese') == '设置'
+    assert memory.lookup('Settings', 'zh-Hant') == '設定'
+    assert memory.stats() == {'en->zh-hans': 1, 'en->zh-hant': 1}
+
+
+def test_legacy_zh_entries_are_relabelled_by_script(tmp_path):
+    path = str(tmp_path / 'memory.db')
+    TranslationMemory(path).close()
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT INTO segments VALUES (?, ?, ?, ?, ?, ?)', [
+        ('en', 'zh', 'h1', 'Network', '网络', ''),
+        ('en', 'zh', 'h2', 'Network settings', '網絡設定', ''),
+    ])
+    conn.commit()
+    conn.close()
+
+    memory = TranslationMemory(path)
+    assert memory.stats() == {'en->zh-hans': 1, 'en->zh-hant': 1}
+    memory.close()
+
+
+def test_tmx_round_trip(tmp_path):
+    memory = TranslationMemory()
+    memory.add('Hello <world> & "friends"', '你好 <世界> & "朋友"', 'en', 'zh-CN')
+    memory.add('Thank you', 'Danke', 'en', 'de')
+    path = str(tmp_path / 'memory.tmx')
+
+    assert memory.export_tmx(path) == 2
+
+    restored = TranslationMemory()
+    assert restored.import_tmx(path) == 2
+    assert restored.lookup('Hello <world> & "friends"', 'Chinese') == '你好 <世界> & "朋友"'
+    assert restored.lookup('Thank you', 'German') == 'Danke'
+    assert restored.content_version() == memory.content_version()
+
+
+def test_tmx_import_skips_inline_codes():
+    tmx = '''<?xml version="1.0"?>
+<tmx version="1.4"><header srclang="en"/><body>
+  <tu><tuv xml:lang="en"><seg>Press <bpt i="1">&lt;b&gt;</bpt>OK<ept i="1">&lt;/b&gt;</ept></seg></tuv>
+      <tuv xml:lang="zh-CN"><seg>按<bpt i="1">&lt;b&gt;</bpt>确定<ept i="1">&lt;/b&gt;</ept></seg></tuv></tu>
+</body></tmx>'''.encode('utf-8')
+    memory = TranslationMemory()
+
+    assert memory.import_tmx(io.BytesIO(tmx)) == 1
+    assert memory.lookup('Press OK', 'zh-CN') == '按确定'
+
+
+def test_docx_pair_import_aligns_segments():
+    memory = TranslationMemory()
+    source = _docx(['Title', 'First paragraph', 'Second paragraph'], heading_at=0)
+    translated = _docx(['标题', '第一段', '第二段'], heading_at=0)
+
+    assert memory.import_docx_pair(source, translated, 'en', 'zh') == 3
+    assert memory.lookup('Second paragraph', 'Chinese') == '第二段'
+
+
+def test_docx_pair_import_rejects_shifted_documents():
+    memory = TranslationMemory()
+    source = _docx(['First paragraph', 'Second paragraph'])
+    translated = _docx(['第一段', '译者补充的说明', '第二段'])
+
+    with pytest.raises(ValueError, match='do not align'):
+        memory.import_docx_pair(source, translated, 'en', 'zh')
+    assert len(memory) == 0
+
+
+def test_docx_pair_import_rejects_different_headings():
+    memory = TranslationMemory()
+    source = _docx(['Title', 'Body'], heading_at=0)
+    translated = _docx(['标题', '正文'])
+
+    with pytest.raises(ValueError, match='heading levels differ'):
+        memory.import_docx_pair(source, translated, 'en', 'zh')
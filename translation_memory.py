@@ -0,0 +1,373 @@
+"""
+Translation memory - an indexed store of existing human translations
+Bulk-imports TMX files and aligned source/translated .docx pairs, exports back to TMX,
+and lets SemanticTranslator reuse stored segments instead of calling the API.
+
+Command line:
+    python translation_memory.py import-tmx memory.db file1.tmx [file2.tmx ...]
+    python translation_memory.py import-docx memory.db source.docx translated.docx --source-lang en --target-lang zh
+    python translation_memory.py export-tmx memory.db output.tmx [--source-lang en --target-lang zh]
+"""
+
+import argparse
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, Optional, Tuple, Union, BinaryIO
+from xml.sax.saxutils import escape, quoteattr
+
+logger = logging.getLogger(__name__)
+
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+# 界面使用语言名称，TMX使用语言代码
+LANGUAGE_CODES = {
+    'chinese': 'zh', 'english': 'en', 'japanese': 'ja', 'korean': 'ko',
+    'french': 'fr', 'german': 'de', 'spanish': 'es', 'russian': 'ru'
+}
+
+# 标记繁体中文的子标签或名称中的词，其余中文按简体
+_TRADITIONAL_SUBTAGS = {'hant', 'tw', 'hk', 'mo', 'traditional'}
+
+# TMX行内标记中属于原始格式代码的元素，其文本不属于译文
+_TMX_CODE_TAGS = {'bpt', 'ept', 'ph', 'it', 'ut'}
+
+
+def normalize_lang(lang: str) -> str:
+    """'English' / 'en-US' -> 'en'; 'Chinese' / 'zh-CN' -> 'zh-hans'; 'zh-TW' / 'zh-Hant' -> 'zh-hant'
+
+    Other languages keep only the primary subtag; Chinese keeps its script, so Simplified
+    and Traditional entries never overwrite or stand in for each other.
+    """
+    lang = (lang or '').strip().lower()
+    tokens = [token for token in re.split(r'[-_\s()]+', lang) if token]
+    if not tokens:
+        return ''
+    primary = LANGUAGE_CODES.get(lang) or next(
+        (LANGUAGE_CODES[token] for token in tokens if token in LANGUAGE_CODES), tokens[0])
+    if primary != 'zh':
+        return primary
+    return 'zh-hant' if _TRADITIONAL_SUBTAGS & set(tokens) else 'zh-hans'
+
+
+def normalize_segment(text: str) -> str:
+    """Collapse whitespace so lookups ignore layout differences"""
+    return ' '.join((text or '').split())
+
+
+def _segment_hash(text: str) -> str:
+    return hashlib.sha1(normalize_segment(text).encode('utf-8')).hexdigest()
+
+
+def _structure_mismatch(source_parsed: Dict, translated_parsed: Dict) -> Optional[str]:
+    """Why two parsed documents cannot be aligned by segment id, or None if they can
+
+    Both must have the same segment ids (non-empty paragraphs at the same positions, the
+    same table cells) and the same heading levels; a missing or extra paragraph shifts ids.
+    """
+    def segments(parsed):
+        levels = {layout['id']: layout.get('heading_level', 0) for layout in parsed['layout_layer']
+                  if 'id' in layout}
+        return {item['id']: levels.get(item['id'], 0) for item in parsed['content_layer']
+                if item.get('type') in ('paragraph', 'table_cell')}
+
+    source, translated = segments(source_parsed), segments(translated_parsed)
+    only_source = [segment_id for segment_id in source if segment_id not in translated]
+    only_translated = [segment_id for segment_id in translated if segment_id not in source]
+    if only_source or only_translated:
+        return (f"{len(only_source)} segments only in the source (e.g. {', '.join(only_source[:3]) or '-'}), "
+                f"{len(only_translated)} only in the translation (e.g. {', '.join(only_translated[:3]) or '-'})")
+    headings = [segment_id for segment_id, level in source.items() if translated[segment_id] != level]
+    if headings:
+        return f"heading levels differ at {len(headings)} segments (e.g. {', '.join(headings[:3])})"
+    return None
+
+
+def _tmx_seg_text(seg) -> str:
+    """Text of a <seg>, skipping inline formatting codes but keeping their tails"""
+    parts = [seg.text or '']
+    for child in seg:
+        if child.tag.rsplit('}', 1)[-1] not in _TMX_CODE_TAGS:
+            parts.append(_tmx_seg_text(child))
+        parts.append(child.tail or '')
+    return ''.join(parts)
+
+
+class TranslationMemory:
+    """SQLite-backed translation store indexed by (target language, source hash)"""
+
+    def __init__(self, path: str = ':memory:'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS segments (
+                source_lang TEXT NOT NULL,
+                target_lang TEXT NOT NULL,
+                source_hash TEXT NOT NULL,
+                source TEXT NOT NULL,
+                target TEXT NOT NULL,
+                origin TEXT,
+                PRIMARY KEY (target_lang, source_hash, source_lang)
+            )
+        ''')
+        self._conn.commit()
+        self._revision = 0     # 本进程内的写入次数
+        self._digest = None    # ((revision, data_version), 内容摘要)
+        self._split_legacy_chinese()
+
+    def _split_legacy_chinese(self):
+        """旧版本把所有中文都记为'zh'：按文本字形改记为zh-hans/zh-hant，无法判断时按简体"""
+        from segment_classifier import han_script
+        with self._lock:
+            rows = self._conn.execute("SELECT rowid, source_lang, target_lang, source, target FROM segments "
+                                      "WHERE source_lang = 'zh' OR target_lang = 'zh'").fetchall()
+            if not rows:
+                return
+            self._conn.executemany('UPDATE OR REPLACE segments SET source_lang = ?, target_lang = ? WHERE rowid = ?', [
+                ((han_script(source) or 'zh-hans') if source_lang == 'zh' else source_lang,
+                 (han_script(target) or 'zh-hans') if target_lang == 'zh' else target_lang, rowid)
+                for rowid, source_lang, target_lang, source, target in rows
+            ])
+            self._conn.commit()
+            self._revision += 1
+        logger.info(f"Relabelled {len(rows)} translation memory entries from 'zh' to zh-hans/zh-hant")
+
+    def __getstate__(self):
+        # 传给其他进程时：文件库按路径重新打开，内存库连同数据一起序列化
+        with self._lock:
+            data = self._conn.serialize() if self.path == ':memory:' else None
+        return {'path': self.path, 'data': data}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+        if state['data'] is not None:
+            self._conn.deserialize(state['data'])
+            self._revision += 1
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM segments').fetchone()[0]
+
+    def add_many(self, rows: Iterable[Tuple[str, str, str, str]], origin: str = '') -> int:
+        """Insert (source, target, source_lang, target_lang) rows; later entries win"""
+        records = [
+            (normalize_lang(source_lang), normalize_lang(target_lang), _segment_hash(source),
+             normalize_segment(source), target.strip(), origin)
+            for source, target, source_lang, target_lang in rows
+            if normalize_segment(source) and target and target.strip()
+        ]
+        if records:
+            with self._lock:
+                self._conn.executemany('INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?, ?, ?)', records)
+                self._conn.commit()
+                self._revision += 1
+        return len(records)
+
+    def content_version(self) -> str:
+        """Digest of every stored entry; changes whenever an entry is added or replaced
+
+        Recomputed only after a write, in this process or (for file-backed stores) any other.
+        """
+        with self._lock:
+            # data_version在其他连接提交写入后变化
+            version = (self._revision, self._conn.execute('PRAGMA data_version').fetchone()[0])
+            if self._digest is None or self._digest[0] != version:
+                digest = hashlib.sha256()
+                for row in self._conn.execute('SELECT source_lang, target_lang, source_hash, target FROM segments '
+                                              'ORDER BY target_lang, source_hash, source_lang'):
+                    digest.update('\x1f'.join(row).encode('utf-8') + b'\x1e')
+                self._digest = (version, digest.hexdigest())
+            return self._digest[1]
+
+    def add(self, source: str, target: str, source_lang: str, target_lang: str, origin: str = '') -> bool:
+        return self.add_many([(source, target, source_lang, target_lang)], origin) == 1
+
+    def lookup(self, text: str, target_lang: str, source_lang: str = None) -> Optional[str]:
+        """Stored translation of text into target_lang, or None"""
+        query = 'SELECT target, source FROM segments WHERE target_lang = ? AND source_hash = ?'
+        params = [normalize_lang(target_lang), _segment_hash(text)]
+        if source_lang:
+            query += ' AND source_lang = ?'
+            params.append(normalize_lang(source_lang))
+
+        with self._lock:
+            for target, source in self._conn.execute(query, params):
+                if source == normalize_segment(text):
+                    return target
+        return None
+
+    def import_tmx(self, source: Union[str, BinaryIO], batch_size: int = 1000) -> int:
+        """Stream a TMX file into the store; every non-source <tuv> of a <tu> becomes one pair"""
+        origin = source if isinstance(source, str) else getattr(source, 'name', 'tmx')
+        header_srclang = None
+        batch = []
+        imported = 0
+
+        for _, element in ET.iterparse(source, events=('end',)):
+            tag = element.tag.rsplit('}', 1)[-1]
+            if tag == 'header':
+                srclang = element.get('srclang', '')
+                header_srclang = None if srclang.lower() in ('', '*all*') else srclang
+                continue
+            if tag != 'tu':
+                continue
+
+            tu_srclang = element.get('srclang')
+            variants = []
+            for tuv in element:
+                if tuv.tag.rsplit('}', 1)[-1] != 'tuv':
+                    continue
+                seg = next((child for child in tuv if child.tag.rsplit('}', 1)[-1] == 'seg'), None)
+                if seg is not None:
+                    variants.append((tuv.get(XML_LANG) or tuv.get('lang') or '', _tmx_seg_text(seg)))
+            element.clear()
+
+            if len(variants) < 2:
+                continue
+            source_lang = tu_srclang or header_srclang or variants[0][0]
+            source_text = next((text for lang, text in variants
+                                if normalize_lang(lang) == normalize_lang(source_lang)), None)
+            if source_text is None:
+                continue
+            for lang, text in variants:
+                if normalize_lang(lang) != normalize_lang(source_lang):
+                    batch.append((source_text, text, source_lang, lang))
+
+            if len(batch) >= batch_size:
+                imported += self.add_many(batch, origin)
+                batch = []
+
+        imported += self.add_many(batch, origin)
+        return imported
+
+    def import_docx_pair(self, source_doc, translated_doc, source_lang: str, target_lang: str,
+                         parser=None) -> int:
+        """Align a source and translated .docx by StructuralParser ids and store the pairs
+
+        Ids are positional, so the documents must have the same structure (see
+        _structure_mismatch); otherwise nothing is imported and ValueError is raised.
+        """
+        if parser is None:
+            from smart_translator import StructuralParser
+            parser = StructuralParser()
+
+        source_parsed = parser.parse_document(source_doc)
+        translated_parsed = parser.parse_document(translated_doc)
+        if not source_parsed or not translated_parsed:
+            return 0
+        mismatch = _structure_mismatch(source_parsed, translated_parsed)
+        if mismatch:
+            raise ValueError(f"Documents do not align, nothing imported: {mismatch}")
+
+        translated_by_id = {
+            item['id']: item['text'] for item in translated_parsed['content_layer']
+            if item.get('type') in ('paragraph', 'table_cell')
+        }
+        pairs = [
+            (item['text'], translated_by_id[item['id']], source_lang, target_lang)
+            for item in source_parsed['content_layer']
+            if item.get('type') in ('paragraph', 'table_cell')
+        ]
+        origin = source_doc if isinstance(source_doc, str) else 'docx'
+        return self.add_many(pairs, origin)
+
+    def export_tmx(self, output: Union[str, BinaryIO], source_lang: str = None,
+                   target_lang: str = None) -> int:
+        """Write stored pairs as TMX 1.4, optionally filtered by language pair"""
+        query = 'SELECT source_lang, target_lang, source, target FROM segments'
+        conditions, params = [], []
+        if source_lang:
+            conditions.append('source_lang = ?')
+            params.append(normalize_lang(source_lang))
+        if target_lang:
+            conditions.append('target_lang = ?')
+            params.append(normalize_lang(target_lang))
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+
+        stream = open(output, 'wb') if isinstance(output, str) else output
+        exported = 0
+        try:
+            stream.write(b'<?xml version="1.0" encoding="UTF-8"?>\n<tmx version="1.4">\n')
+            header_lang = quoteattr(normalize_lang(source_lang) if source_lang else '*all*')
+            stream.write(f'  <header creationtool="Free_translate" creationtoolversion="1.0" '
+                         f'segtype="paragraph" o-tmf="sqlite" adminlang="en" srclang={header_lang} '
+                         f'datatype="plaintext"/>\n  <body>\n'.encode('utf-8'))
+
+            # 逐行从游标写出，不把整个库读入内存
+            with self._lock:
+                for row_source_lang, row_target_lang, source, target in self._conn.execute(query, params):
+                    stream.write((
+                        f'    <tu srclang={quoteattr(row_source_lang)}>\n'
+                        f'      <tuv xml:lang={quoteattr(row_source_lang)}><seg>{escape(source)}</seg></tuv>\n'
+                        f'      <tuv xml:lang={quoteattr(row_target_lang)}><seg>{escape(target)}</seg></tuv>\n'
+                        f'    </tu>\n'
+                    ).encode('utf-8'))
+                    exported += 1
+
+            stream.write(b'  </body>\n</tmx>\n')
+        finally:
+            if isinstance(output, str):
+                stream.close()
+        return exported
+
+    def stats(self) -> Dict[str, int]:
+        """Segment counts per language pair"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT source_lang, target_lang, COUNT(*) FROM segments GROUP BY source_lang, target_lang'
+            ).fetchall()
+        return {f"{source}->{target}": count for source, target, count in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import/export for the translation memory")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    tmx_import = subparsers.add_parser('import-tmx', help="Import TMX files")
+    tmx_import.add_argument('database')
+    tmx_import.add_argument('files', nargs='+')
+
+    docx_import = subparsers.add_parser('import-docx', help="Import an aligned source/translated .docx pair")
+    docx_import.add_argument('database')
+    docx_import.add_argument('source_docx')
+    docx_import.add_argument('translated_docx')
+    docx_import.add_argument('--source-lang', required=True)
+    docx_import.add_argument('--target-lang', required=True)
+
+    tmx_export = subparsers.add_parser('export-tmx', help="Export to TMX")
+    tmx_export.add_argument('database')
+    tmx_export.add_argument('output')
+    tmx_export.add_argument('--source-lang')
+    tmx_export.add_argument('--target-lang')
+
+    args = parser.parse_args()
+    memory = TranslationMemory(args.database)
+    try:
+        if args.command == 'import-tmx':
+            for path in args.files:
+                print(f"{path}: {memory.import_tmx(path)} segments")
+        elif args.command == 'import-docx':
+            try:
+                count = memory.import_docx_pair(args.source_docx, args.translated_docx,
+                                                args.source_lang, args.target_lang)
+            except ValueError as e:
+                parser.exit(1, f"{e}\n")
+            print(f"{count} segments")
+        else:
+            print(f"{memory.export_tmx(args.output, args.source_lang, args.target_lang)} segments")
+        print(memory.stats())
+    finally:
+        memory.close()
+
+
+if __name__ == "__main__":
+    main()